@@ -4,6 +4,7 @@ import { router } from 'expo-router';
 import { Ionicons } from '@expo/vector-icons';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import { LOCAL_HOST } from '../environment';
+import { authHeaders } from '../auth';
 
 const presetColors = ['#7C3AED', '#0EA5E9', '#F59E0B', '#EF4444', '#10B981'];
 
@@ -27,7 +28,7 @@ export default function AddCategoryScreen() {
 
       const response = await fetch(`${LOCAL_HOST}/categories`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: await authHeaders({ 'Content-Type': 'application/json' }),
         body: JSON.stringify({
           user_id: parseInt(userId),
           name,
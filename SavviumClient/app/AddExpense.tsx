@@ -3,6 +3,7 @@ import { View, Text, TextInput, TouchableOpacity, StyleSheet, SafeAreaView } fro
 import { router, useFocusEffect } from "expo-router";
 import AsyncStorage from "@react-native-async-storage/async-storage";
 import { LOCAL_HOST } from "../environment";
+import { authHeaders } from "../auth";
 import type { Category } from "./Dashboard";
 import { Picker } from "@react-native-picker/picker";
 import { Ionicons } from '@expo/vector-icons';
@@ -16,7 +17,7 @@ export default function AddExpenseScreen() {
 
     const fetchCategories = async (id: string) => {
         try {
-            const response = await fetch(`${LOCAL_HOST}/users/${id}/categories`);
+            const response = await fetch(`${LOCAL_HOST}/users/${id}/categories`, { headers: await authHeaders() });
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
@@ -50,7 +51,7 @@ export default function AddExpenseScreen() {
         try {
             const response = await fetch(`${LOCAL_HOST}/expenses`, {
                 method: "POST",
-                headers: { "Content-Type": "application/json" },
+                headers: await authHeaders({ "Content-Type": "application/json" }),
                 body: JSON.stringify({
                     name,
                     amount: parseFloat(amount),
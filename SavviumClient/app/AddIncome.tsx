@@ -4,6 +4,7 @@ import { useFocusEffect, router } from "expo-router";
 import { Ionicons } from '@expo/vector-icons';
 import AsyncStorage from "@react-native-async-storage/async-storage";
 import { LOCAL_HOST } from "../environment";
+import { authHeaders } from "../auth";
 
 export default function AddIncomeScreen() {
   const [source, setSource] = useState("");
@@ -28,7 +29,7 @@ export default function AddIncomeScreen() {
     try {
       const response = await fetch(`${LOCAL_HOST}/incomes`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: await authHeaders({ "Content-Type": "application/json" }),
         body: JSON.stringify({
             user_id: parseInt(userId!),
             name: source,
@@ -14,6 +14,7 @@ import { Calendar } from "react-native-calendars";
 import { router, useFocusEffect } from "expo-router";
 import AsyncStorage from "@react-native-async-storage/async-storage";
 import { LOCAL_HOST } from "../environment";
+import { authHeaders } from "../auth";
 import { Ionicons } from "@expo/vector-icons";
 
 export default function AddRecurringExpenseScreen() {
@@ -53,7 +54,7 @@ export default function AddRecurringExpenseScreen() {
     try {
       const response = await fetch(`${LOCAL_HOST}/recurring-expenses`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: await authHeaders({ "Content-Type": "application/json" }),
         body: JSON.stringify({
           user_id: userId,
           name,
@@ -82,7 +83,7 @@ export default function AddRecurringExpenseScreen() {
   if (!userId) return;
 
   try {
-    const response = await fetch(`${LOCAL_HOST}/recurring-expenses?user_id=${userId}`);
+    const response = await fetch(`${LOCAL_HOST}/recurring-expenses?user_id=${userId}`, { headers: await authHeaders() });
     const data = await response.json();
     setRecurringExpenses(data);
   } catch (error) {
@@ -121,7 +122,7 @@ export default function AddRecurringExpenseScreen() {
     const due_day = parseInt(newDate.split("-")[2]);
     await fetch(`${LOCAL_HOST}/recurring-expenses/${selectedBill.id}`, {
       method: "PATCH",
-      headers: { "Content-Type": "application/json" },
+      headers: await authHeaders({ "Content-Type": "application/json" }),
       body: JSON.stringify({ due_day }),
     });
     setEditDateVisible(false);
@@ -131,7 +132,7 @@ export default function AddRecurringExpenseScreen() {
   const handleSaveAmount = async () => {
     await fetch(`${LOCAL_HOST}/recurring-expenses/${selectedBill.id}`, {
       method: "PATCH",
-      headers: { "Content-Type": "application/json" },
+      headers: await authHeaders({ "Content-Type": "application/json" }),
       body: JSON.stringify({ amount: parseFloat(newAmount) }),
     });
     setEditAmountVisible(false);
@@ -141,6 +142,7 @@ export default function AddRecurringExpenseScreen() {
   const handleDelete = async () => {
     await fetch(`${LOCAL_HOST}/recurring-expenses/${selectedBill.id}`, {
       method: "DELETE",
+      headers: await authHeaders(),
     });
     setConfirmDeleteVisible(false);
     fetchRecurringExpenses();
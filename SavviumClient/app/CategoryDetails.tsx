@@ -17,6 +17,7 @@ import { Ionicons } from "@expo/vector-icons";
 import { ProgressChart } from "react-native-chart-kit";
 import { Calendar } from "react-native-calendars";
 import { LOCAL_HOST } from "../environment";
+import { authHeaders } from "../auth";
 
 const screenWidth = Dimensions.get("window").width;
 
@@ -52,7 +53,7 @@ export default function CategoryDetailsScreen() {
 
   const fetchExpenses = async () => {
     try {
-      const response = await fetch(`${LOCAL_HOST}/categories/${id}/expenses`);
+      const response = await fetch(`${LOCAL_HOST}/categories/${id}/expenses`, { headers: await authHeaders() });
       const data = await response.json();
       setExpenses(data);
     } catch (err) {
@@ -76,7 +77,7 @@ export default function CategoryDetailsScreen() {
     try {
       const response = await fetch(`${LOCAL_HOST}/expenses`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: await authHeaders({ "Content-Type": "application/json" }),
         body: JSON.stringify({
           category_id: Number(id),
           name: expenseName,
@@ -100,7 +101,7 @@ export default function CategoryDetailsScreen() {
   /* ---------- Category‑level actions ---------- */
   const handleDeleteCategory = async () => {
     try {
-      const response = await fetch(`${LOCAL_HOST}/categories/${id}`, { method: "DELETE" });
+      const response = await fetch(`${LOCAL_HOST}/categories/${id}`, { method: "DELETE", headers: await authHeaders() });
       if (response.ok) {
         router.replace("/Dashboard");
       } else {
@@ -120,7 +121,7 @@ export default function CategoryDetailsScreen() {
     try {
       const response = await fetch(`${LOCAL_HOST}/categories/${id}`, {
         method: "PATCH",
-        headers: { "Content-Type": "application/json" },
+        headers: await authHeaders({ "Content-Type": "application/json" }),
         body: JSON.stringify({ budget: parseFloat(newBudget) }),
       });
       if (response.ok) {
@@ -158,7 +159,7 @@ export default function CategoryDetailsScreen() {
   const saveEditedAmount = async () => {
     await fetch(`${LOCAL_HOST}/expenses/${selectedExpense.id}`, {
       method: "PATCH",
-      headers: { "Content-Type": "application/json" },
+      headers: await authHeaders({ "Content-Type": "application/json" }),
       body: JSON.stringify({ amount: parseFloat(newExpenseAmount) }),
     });
     setEditExpenseAmountVisible(false);
@@ -166,7 +167,7 @@ export default function CategoryDetailsScreen() {
   };
 
   const deleteExpense = async () => {
-    await fetch(`${LOCAL_HOST}/expenses/${selectedExpense.id}`, { method: "DELETE" });
+    await fetch(`${LOCAL_HOST}/expenses/${selectedExpense.id}`, { method: "DELETE", headers: await authHeaders() });
     setDeleteExpenseVisible(false);
     fetchExpenses();
   };
@@ -399,7 +400,7 @@ export default function CategoryDetailsScreen() {
             if (!newExpenseDate) return;
             await fetch(`${LOCAL_HOST}/expenses/${selectedExpense.id}`, {
               method: "PATCH",
-              headers: { "Content-Type": "application/json" },
+              headers: await authHeaders({ "Content-Type": "application/json" }),
               body: JSON.stringify({ date: newExpenseDate }),
             });
             setEditExpenseDateVisible(false);
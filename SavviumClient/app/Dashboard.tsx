@@ -14,6 +14,7 @@ import { useState, useRef, useCallback } from "react";
 import AsyncStorage from "@react-native-async-storage/async-storage";
 import { Ionicons } from "@expo/vector-icons";
 import { LOCAL_HOST } from "../environment";
+import { authHeaders } from "../auth";
 import { ProgressChart } from "react-native-chart-kit";
 
 const screenWidth = Dimensions.get("window").width;
@@ -24,6 +25,14 @@ export type Category = {
   name?: string;
   budget?: number;
   color?: string;
+  spent?: number;
+  remaining?: number;
+};
+
+export type Totals = {
+  budget: number;
+  spent: number;
+  income: number;
 };
 
 export type Expense = {
@@ -54,61 +63,25 @@ export default function DashboardScreen() {
   const [categories, setCategories] = useState<Category[]>([]);
   const [expenses, setExpenses] = useState<Expense[]>([]);
   const [incomes, setIncomes] = useState<Income[]>([]);
+  const [totals, setTotals] = useState<Totals>({ budget: 0, spent: 0, income: 0 });
   const [userId, setUserId] = useState<string | null>(null);
   const [userName, setUserName] = useState<string | null>(null);
 
-  const fetchCategories = async (id: string) => {
-    try {
-      const response = await fetch(`${LOCAL_HOST}/users/${id}/categories`);
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-      const data = await response.json();
-      setCategories(data);
-    } catch (error) {
-      console.error("Error fetching categories:", error);
-    }
-  };
-
-  const fetchExpenses = async (userId: string) => {
-    try {
-      const response = await fetch(`${LOCAL_HOST}/users/${userId}/expenses`);
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-      const data = await response.json();
-      
-      const expensesWithDates = data.map((expense: Expense) => {
-        if (!expense.date) {
-          console.log("Found expense without date:", expense.id);
-          return { ...expense, date: new Date().toISOString() };
-        }
-        return expense;
-      });
-      
-      const sortedExpenses = expensesWithDates.sort((a: Expense, b: Expense) => {
-        return new Date(b.date).getTime() - new Date(a.date).getTime();
-      });
-      
-      setExpenses(sortedExpenses);
-    } catch (error) {
-      console.error("Error fetching expenses:", error);
-    }
-  };
-
-  const fetchIncomes = async (userId: string) => {
+  // Categories (with spent totals), recent expenses/incomes and totals all
+  // come from a single request.
+  const fetchDashboard = async (id: string) => {
     try {
-      const response = await fetch(`${LOCAL_HOST}/users/${userId}/incomes`);
+      const response = await fetch(`${LOCAL_HOST}/users/${id}/dashboard`, { headers: await authHeaders() });
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
       const data = await response.json();
-      const sortedIncomes = data.sort((a: Income, b: Income) => {
-        return new Date(b.date).getTime() - new Date(a.date).getTime();
-      });
-      setIncomes(sortedIncomes);
+      setCategories(data.categories);
+      setExpenses(data.expenses);
+      setIncomes(data.incomes);
+      setTotals(data.totals);
     } catch (error) {
-      console.error("Error fetching incomes:", error);
+      console.error("Error fetching dashboard:", error);
     }
   };
 
@@ -120,9 +93,7 @@ export default function DashboardScreen() {
       if (storedUserName) {
         setUserName(storedUserName);
       }
-      await fetchCategories(storedUserId);
-      await fetchExpenses(storedUserId);
-      await fetchIncomes(storedUserId); 
+      await fetchDashboard(storedUserId);
     }
   };
 
@@ -155,6 +126,7 @@ export default function DashboardScreen() {
     try {
       await AsyncStorage.removeItem("isLoggedIn");
       await AsyncStorage.removeItem("userId");
+      await AsyncStorage.removeItem("authToken");
       router.replace("/");
     } catch (error) {
       console.error("Logout error:", error);
@@ -192,46 +164,24 @@ export default function DashboardScreen() {
     router.push("/AddIncome");
   };
 
-  const totalBudget = categories.reduce(
-    (sum, cat) => sum + (cat.budget ?? 0),
-    0
+  const totalBudget = totals.budget;
+
+  const totalSpent = totals.spent;
+
+  const totalIncome = totals.income;
+
+  const isAnyCategoryOverBudget = categories.some(
+    (category) =>
+      category.budget !== undefined && (category.spent ?? 0) > category.budget
   );
 
-  const totalSpent = expenses.reduce((sum, exp) => sum + exp.amount, 0);
-
-  const totalIncome = incomes.reduce((sum, inc) => sum + inc.amount, 0);
-
-  const isAnyCategoryOverBudget = categories.some((category) => {
-    const categoryExpenses = expenses.filter(
-      (expense) => expense.category_id === category.id
-    );
-    const totalCategorySpent = categoryExpenses.reduce(
-      (sum, exp) => sum + exp.amount,
-      0
-    );
-    return (
-      category.budget !== undefined && totalCategorySpent > category.budget
-    );
-  });
-
-  const overBudgetCategory = categories.find((category) => {
-    const categoryExpenses = expenses.filter(
-      (expense) => expense.category_id === category.id
-    );
-    const totalCategorySpent = categoryExpenses.reduce(
-      (sum, exp) => sum + exp.amount,
-      0
-    );
-    return (
-      category.budget !== undefined && totalCategorySpent > category.budget
-    );
-  });
+  const overBudgetCategory = categories.find(
+    (category) =>
+      category.budget !== undefined && (category.spent ?? 0) > category.budget
+  );
 
   const overBudgetAmount = overBudgetCategory
-    ? expenses
-        .filter((expense) => expense.category_id === overBudgetCategory.id)
-        .reduce((sum, exp) => sum + exp.amount, 0) -
-      (overBudgetCategory.budget ?? 0)
+    ? (overBudgetCategory.spent ?? 0) - (overBudgetCategory.budget ?? 0)
     : 0;
 
   const progress = totalBudget > 0 ? Math.min(totalSpent / totalBudget, 1) : 0;
@@ -49,10 +49,11 @@ export default function LoginScreen() {
       const data = await response.json();
 
       if (response.ok) {
-        // Save login state, userId, and userName into AsyncStorage
+        // Save login state, userId, userName and the access token into AsyncStorage
         await AsyncStorage.setItem('isLoggedIn', 'true');
         await AsyncStorage.setItem('userId', data.user.id.toString());
         await AsyncStorage.setItem('userName', data.user.name);
+        await AsyncStorage.setItem('authToken', data.token);
 
         // Redirect to Dashboard, passing name (optional)
         router.replace({
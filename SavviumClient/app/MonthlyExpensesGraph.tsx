@@ -4,14 +4,16 @@ import { router } from 'expo-router';
 import { Ionicons } from '@expo/vector-icons';
 import { BarChart } from "react-native-chart-kit";
 import { Dimensions } from "react-native";
+import AsyncStorage from "@react-native-async-storage/async-storage";
 import { LOCAL_HOST } from "../environment";
+import { authHeaders } from "../auth";
 
 const screenWidth = Dimensions.get("window").width;
 
 type ExpenseData = {
-    date: string;
-    amount: number;
-    category_name: string;
+    period: string;
+    total: number;
+    count: number;
 };
 
 export default function MonthlyExpensesGraph() {
@@ -20,7 +22,15 @@ export default function MonthlyExpensesGraph() {
     useEffect(() => {
         const fetchMonthlyExpenses = async () => {
             try {
-                const response = await fetch(`${LOCAL_HOST}/expenses/monthly`);
+                const userId = await AsyncStorage.getItem("userId");
+                if (!userId) return;
+                // Daily totals for the current month, summed by the server
+                const now = new Date();
+                const monthStart = `${now.getFullYear()}-${String(now.getMonth() + 1).padStart(2, "0")}-01`;
+                const response = await fetch(
+                    `${LOCAL_HOST}/users/${userId}/spending?group=day&from=${monthStart}`,
+                    { headers: await authHeaders() }
+                );
                 const result: ExpenseData[] = await response.json();
                 setData(result);
             } catch (error) {
@@ -31,11 +41,6 @@ export default function MonthlyExpensesGraph() {
         fetchMonthlyExpenses();
     }, []);
 
-    const chartData = {
-        labels: data.map((item) => item.category_name), // Use category names as labels
-        datasets: [{ data: data.map((item) => item.amount) }],
-    };
-
 
     return (
         <SafeAreaView style={styles.safeArea}>
@@ -48,8 +53,8 @@ export default function MonthlyExpensesGraph() {
                 </View>
                 <BarChart
                     data={{
-                        labels: data.map((item) => item.date),
-                        datasets: [{ data: data.map((item) => item.amount) }],
+                        labels: data.map((item) => item.period.slice(5)),
+                        datasets: [{ data: data.map((item) => item.total) }],
                     }}
                     width={screenWidth - 40}
                     height={220}
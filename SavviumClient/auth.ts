@@ -0,0 +1,7 @@
+import AsyncStorage from '@react-native-async-storage/async-storage';
+
+// Request headers for the API: the access token saved at login, plus any extras
+export async function authHeaders(extra: Record<string, string> = {}): Promise<Record<string, string>> {
+  const token = await AsyncStorage.getItem('authToken');
+  return token ? { ...extra, Authorization: `Bearer ${token}` } : extra;
+}
@@ -0,0 +1,81 @@
+"""Async I/O for the ASGI mode: one outbound HTTP client and one async
+database engine per process, created at startup and closed at shutdown.
+
+Both need packages the WSGI server does not: httpx, plus the async
+driver for the database (aiosqlite for SQLite).
+"""
+import os
+from sqlalchemy.engine import make_url
+import database
+
+# Async driver for each sync backend SQLAlchemy may be configured with
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+
+def async_url(app):
+    """app's SQLALCHEMY_DATABASE_URI with its async driver.
+
+    A relative SQLite path is resolved against the instance folder, as
+    Flask-SQLAlchemy does for the sync engine, so both open the same file.
+    """
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'No async driver known for {backend!r}')
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    if backend == 'sqlite' and url.database not in (None, '', ':memory:'):
+        if not os.path.isabs(url.database):
+            url = url.set(database=os.path.join(app.instance_path, url.database))
+    return url
+
+
+def http_client(config):
+    """An httpx.AsyncClient sized by HTTP_MAX_CONNECTIONS; close it with aclose()."""
+    import httpx  # optional dependency, only needed for the async code paths
+
+    return httpx.AsyncClient(
+        timeout=config['HTTP_TIMEOUT'],
+        limits=httpx.Limits(
+            max_connections=config['HTTP_MAX_CONNECTIONS'],
+            max_keepalive_connections=config['HTTP_MAX_CONNECTIONS'] // 10,
+        ),
+    )
+
+
+class AsyncResources:
+    def __init__(self, app):
+        self.app = app
+        self.http = None
+        self.engine = None
+        self._sessionmaker = None
+
+    def open(self):
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        config = self.app.config
+        self.http = http_client(config)
+        url = async_url(self.app)
+        self.engine = create_async_engine(url, pool_pre_ping=config['DB_POOL_PRE_PING'])
+        if url.get_backend_name() == 'sqlite':
+            # Same PRAGMAs as the sync writer; the async routes only make
+            # single-row writes, so BEGIN IMMEDIATE is not needed.
+            database.configure_sqlite(
+                self.engine.sync_engine,
+                database.sqlite_pragmas(self.app, read_only=False),
+                begin_immediate=False,
+            )
+        self._sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def close(self):
+        if self.http is not None:
+            await self.http.aclose()
+        if self.engine is not None:
+            await self.engine.dispose()
+
+    def session(self):
+        """A new AsyncSession; use as `async with resources.session() as s`."""
+        return self._sessionmaker()
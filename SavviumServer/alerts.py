@@ -0,0 +1,314 @@
+"""Budget alerts: notify a user when a category's spending this month
+crosses ALERT_THRESHOLDS percent of its budget (80 and 100 by default).
+
+Alerts are checked as expenses are written, never by rescanning them.
+Every write path updates monthly_rollups through rollups.apply(), which
+passes the same deltas to check(). Only categories whose current-month
+total went up are looked at, with one primary-key read of the rollup and
+its category each, so the cost of a write does not grow with the number
+of users or expenses. Lowering a budget below this month's spending is
+checked the same way.
+
+A crossing is queued in alert_outbox in the same transaction as the
+write. An alert therefore exists exactly when the write that caused it
+committed, and each threshold alerts once per category per month.
+
+A background worker drains the outbox:
+- It claims due alerts with a lease, so two workers never send the same
+  alert at once.
+- It sends them to the configured sink.
+- It retries failures with exponential backoff.
+
+Delivery is at least once. Each alert carries its id, so a receiver can
+drop repeats.
+
+    flask --app app alerts-drain       # one pass, e.g. from cron
+    python fake_sink.py --port 8766    # a local stand-in receiver
+    SAVVIUM_ALERT_SINK_URL=http://localhost:8766/alerts flask --app app alerts-drain
+"""
+import json
+import logging
+import os
+import threading
+import urllib.request
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import event, inspect, select, text, tuple_, update
+from sqlalchemy.dialects.sqlite import insert
+from models import db, AlertOutbox, BudgetCategory, MonthlyRollup
+from money import cents, to_amount, to_cents
+
+outbox = AlertOutbox.__table__
+# Spelled out so SQLite matches the partial index ix_alert_outbox_pending
+PENDING = text("alert_outbox.status = 'pending'")
+
+log = logging.getLogger(__name__)
+
+# Set after a commit that queued alerts, so the worker delivers them promptly
+_wake = threading.Event()
+
+
+def crossed(spent_before, budget_before, spent, budget, thresholds):
+    """The thresholds (percent of budget) that a change from (spent_before,
+    budget_before) to (spent, budget) crosses upwards. All amounts in cents."""
+    if budget <= 0:
+        return []
+    return [
+        t for t in thresholds
+        if budget * t <= spent * 100 and (budget_before <= 0 or spent_before * 100 < budget_before * t)
+    ]
+
+
+def _queue(connection, month, crossings):
+    """Insert (user_id, category_id, name, spent, budget, threshold) crossings into the outbox."""
+    if not crossings:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {
+            'user_id': user_id,
+            'category_id': category_id,
+            'year_month': month,
+            'threshold': threshold,
+            'payload': json.dumps({
+                'user_id': user_id,
+                'category_id': category_id,
+                'category_name': name,
+                'month': month,
+                'threshold': threshold,
+                'spent': to_amount(spent),
+                'budget': to_amount(budget),
+            }),
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt_at': now,
+            'created_at': now,
+        }
+        for user_id, category_id, name, spent, budget, threshold in crossings
+    ]
+    # A threshold already alerted this month is skipped by the unique index
+    connection.execute(insert(outbox).on_conflict_do_nothing(), rows)
+    db.session.info['alerts_queued'] = True
+
+
+def check(connection, deltas, today=None):
+    """Queue alerts for the current-month totals that `deltas` just raised.
+
+    Called by rollups.apply() with the (user_id, category_id, year_month)
+    -> [cents, count] deltas it has applied.
+    """
+    month = (today or datetime.utcnow().date()).strftime('%Y-%m')
+    raised = {(u, c): total for (u, c, m), (total, _) in deltas.items() if m == month and total > 0}
+    if not raised:
+        return
+    thresholds = current_app.config['ALERT_THRESHOLDS']
+    rows = connection.execute(
+        select(MonthlyRollup.user_id, MonthlyRollup.category_id, MonthlyRollup.total_cents,
+               BudgetCategory.name, cents(BudgetCategory.budget))
+        .join(BudgetCategory, BudgetCategory.id == MonthlyRollup.category_id)
+        .where(
+            tuple_(MonthlyRollup.user_id, MonthlyRollup.category_id).in_(list(raised)),
+            MonthlyRollup.year_month == month,
+        )
+    ).all()
+    crossings = []
+    for user_id, category_id, spent, name, budget in rows:
+        before = spent - raised[(user_id, category_id)]
+        for threshold in crossed(before, budget, spent, budget, thresholds):
+            crossings.append((user_id, category_id, name, spent, budget, threshold))
+    _queue(connection, month, crossings)
+
+
+def _before_flush(session, flush_context, instances):
+    # A lowered budget can put this month's spending over a threshold
+    month = datetime.utcnow().strftime('%Y-%m')
+    thresholds = current_app.config['ALERT_THRESHOLDS']
+    crossings = []
+    for obj in session.dirty:
+        if not isinstance(obj, BudgetCategory):
+            continue
+        history = inspect(obj).attrs.budget.history
+        if not (history.deleted and history.added):
+            continue
+        before, budget = to_cents(history.deleted[0]), to_cents(history.added[0])
+        if budget >= before:
+            continue
+        spent = session.connection().execute(
+            select(MonthlyRollup.total_cents).where(
+                MonthlyRollup.user_id == obj.user_id,
+                MonthlyRollup.category_id == obj.id,
+                MonthlyRollup.year_month == month,
+            )
+        ).scalar() or 0
+        for threshold in crossed(spent, before, spent, budget, thresholds):
+            crossings.append((obj.user_id, obj.id, obj.name, spent, budget, threshold))
+    if crossings:
+        _queue(session.connection(), month, crossings)
+
+
+def _after_commit(session):
+    if session.info.pop('alerts_queued', False):
+        _wake.set()
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop('alerts_queued', None)
+
+
+class LogSink:
+    """Writes alerts to the log; the default when no ALERT_SINK_URL is set."""
+
+    def send(self, alert):
+        log.info('Budget alert for user %(user_id)s: %(category_name)s at %(threshold)s%% '
+                 '(%(spent).2f of %(budget).2f) in %(month)s', alert)
+
+
+class WebhookSink:
+    """POSTs each alert as JSON to a URL; any non-2xx answer is a failure."""
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alert):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(alert).encode(),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def sink_for(app):
+    url = app.config['ALERT_SINK_URL']
+    return WebhookSink(url, app.config['HTTP_TIMEOUT']) if url else LogSink()
+
+
+def claim(now, limit, lease_seconds):
+    """Lease up to `limit` due alerts to this worker and return (id, payload, attempts) rows.
+
+    The claim is one UPDATE ... RETURNING, so concurrent workers get
+    disjoint alerts. An alert whose worker dies is claimed again once
+    the lease runs out.
+    """
+    due = (
+        select(outbox.c.id)
+        .where(PENDING, outbox.c.next_attempt_at <= now)
+        .order_by(outbox.c.next_attempt_at)
+        .limit(limit)
+    )
+    rows = db.session.execute(
+        update(outbox)
+        .where(outbox.c.id.in_(due))
+        .values(attempts=outbox.c.attempts + 1, next_attempt_at=now + timedelta(seconds=lease_seconds))
+        .returning(outbox.c.id, outbox.c.payload, outbox.c.attempts)
+    ).all()
+    db.session.commit()
+    return rows
+
+
+def drain(sink, now=None, batch_size=100, stop=None):
+    """Deliver every alert that is due and return counts of what happened.
+
+    Returns early, between batches, once `stop` is set.
+    """
+    config = current_app.config
+    stats = dict.fromkeys(['delivered', 'retried', 'failed'], 0)
+    while True:
+        if stop is not None and stop.is_set():
+            return stats
+        now = now or datetime.utcnow()
+        rows = claim(now, batch_size, config['ALERT_LEASE_SECONDS'])
+        if not rows:
+            return stats
+        for alert_id, payload, attempts in rows:
+            try:
+                sink.send(dict(json.loads(payload), id=alert_id))
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                if attempts >= config['ALERT_MAX_ATTEMPTS']:
+                    values = {'status': 'failed', 'last_error': error}
+                    log.warning('Giving up on budget alert %s after %d attempts: %s', alert_id, attempts, error)
+                    stats['failed'] += 1
+                else:
+                    delay = min(config['ALERT_RETRY_SECONDS'] * 2 ** (attempts - 1), 3600)
+                    values = {'next_attempt_at': datetime.utcnow() + timedelta(seconds=delay), 'last_error': error}
+                    stats['retried'] += 1
+            else:
+                values = {'status': 'delivered', 'delivered_at': datetime.utcnow(), 'last_error': None}
+                stats['delivered'] += 1
+            db.session.execute(update(outbox).where(outbox.c.id == alert_id).values(**values))
+            db.session.commit()
+        now = None
+
+
+class _StopEvent(threading.Event):
+    """Stops the worker; setting it also ends the worker's current wait."""
+
+    def set(self):
+        super().set()
+        _wake.set()
+
+
+def _loop(app, stop, interval):
+    sink = sink_for(app)
+    while True:
+        # Cleared before stop is checked, so a stop that comes after the
+        # check still ends the wait below
+        _wake.clear()
+        if stop.is_set():
+            return
+        with app.app_context():
+            try:
+                result = drain(sink, stop=stop)
+                if result['delivered'] or result['failed']:
+                    log.info('Budget alerts: %(delivered)d delivered, %(retried)d to retry, %(failed)d failed', result)
+            except Exception:
+                db.session.rollback()
+                log.exception('Budget alert delivery failed')
+        _wake.wait(interval)
+
+
+def start(app, use_reloader=False):
+    """Deliver queued alerts from a daemon thread, as soon as they are
+    committed and every ALERT_POLL_INTERVAL seconds for retries.
+
+    Returns the event that stops the thread, or None when the worker is
+    disabled. With the reloader only the serving child process runs it.
+    """
+    if not app.config['ALERT_WORKER']:
+        return None
+    if use_reloader and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return None
+    stop = _StopEvent()
+    threading.Thread(
+        target=_loop, args=(app, stop, app.config['ALERT_POLL_INTERVAL']), name='budget-alerts', daemon=True
+    ).start()
+    return stop
+
+
+def init_app(app):
+    # Percent of a category's budget at which an alert is sent
+    app.config.setdefault('ALERT_THRESHOLDS', [80, 100])
+    # Where alerts are POSTed as JSON; logged when unset
+    app.config.setdefault('ALERT_SINK_URL', None)
+    app.config.setdefault('ALERT_WORKER', True)
+    app.config.setdefault('ALERT_POLL_INTERVAL', 30)
+    app.config.setdefault('ALERT_MAX_ATTEMPTS', 8)
+    # The nth retry waits RETRY_SECONDS * 2**(n-1), up to an hour
+    app.config.setdefault('ALERT_RETRY_SECONDS', 30)
+    app.config.setdefault('ALERT_LEASE_SECONDS', 60)
+
+    if not event.contains(db.session, 'before_flush', _before_flush):
+        event.listen(db.session, 'before_flush', _before_flush)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_soft_rollback', _after_rollback)
+
+    @app.cli.command('alerts-drain')
+    def alerts_drain_command():
+        """Deliver the budget alerts that are due."""
+        result = drain(sink_for(app))
+        click.echo(f"Delivered {result['delivered']}, {result['retried']} to retry, {result['failed']} failed")
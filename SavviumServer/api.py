@@ -0,0 +1,603 @@
+import json
+import logging
+from flask import Blueprint, Response, abort, request, jsonify, make_response, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from models import db, User, BudgetCategory, Expense, Income, RecurringExpense
+from auth import authorize
+from datetime import datetime
+from pagination import PaginationError, page_args, parse_date
+import reports
+import serializers
+import sync
+import ledger
+import idempotency
+import importer
+import search
+import forecast
+import export
+import archive
+from changes import conditional_get, category_version
+import money
+
+api_bp = Blueprint('api', __name__)
+
+log = logging.getLogger(__name__)
+
+@api_bp.route('/')
+def hello_world():
+    return "Hello, Savvium Server!"
+
+# Dollars from a request body rounded to the cent, or None if not a number.
+# Parsed before any model is touched, so a bad value is a 400 rather than
+# an error in the middle of the flush.
+def parse_amount(value):
+    try:
+        return money.to_amount(money.to_cents(value))
+    except ValueError:
+        return None
+
+def amount_error(field):
+    return jsonify({'message': f"'{field}' must be a number"}), 400
+
+# Create a new category
+@api_bp.route('/categories', methods=['POST'])
+def create_category():
+    data = request.get_json()
+    authorize(data["user_id"])
+    budget = parse_amount(data.get("budget"))
+    if budget is None:
+        return amount_error('budget')
+    new_cat = BudgetCategory(
+        user_id=data["user_id"],
+        name=data["name"],
+        budget=budget,
+        color=data.get("color", "#cccccc")
+    )
+    db.session.add(new_cat)
+    db.session.commit()
+    return jsonify({"message": "Category created", "category": {
+        "id": new_cat.id,
+        "user_id": new_cat.user_id,
+        "name": new_cat.name,
+        "budget": new_cat.budget,
+        "color": new_cat.color
+    }})
+
+# Create a new expense
+@api_bp.route('/expenses', methods=['POST'])
+def create_expense():
+    data = request.get_json()
+    expense_date = datetime.strptime(data.get('date'), '%Y-%m-%d').date() if data.get('date') else datetime.utcnow().date()
+
+    category = db.session.get(BudgetCategory, data["category_id"])
+    if not category:
+        return jsonify({'error': 'Category not found'}), 404
+    authorize(category.user_id)
+    amount = parse_amount(data.get("amount"))
+    if amount is None:
+        return amount_error('amount')
+
+    new_expense = Expense(
+        category_id=category.id,
+        user_id=category.user_id,
+        name=data["name"],
+        amount=amount,
+        date=expense_date
+    )
+    db.session.add(new_expense)
+    db.session.commit()
+    return jsonify({"message": "Expense created", "expense": {
+        "id": new_expense.id,
+        "category_id": new_expense.category_id,
+        "name": new_expense.name,
+        "amount": new_expense.amount,
+        "date": new_expense.date.isoformat()
+    }})
+
+# Create many expenses for one user in a single transaction.
+# Body: {"user_id": 1, "expenses": [{"category_id", "name", "amount", "date"}, ...]}
+# Invalid items are reported per index and skipped; valid ones are inserted
+# in one batch. Send an Idempotency-Key header (or "idempotency_key") to make
+# retries return the original result instead of inserting duplicates.
+@api_bp.route('/expenses/bulk', methods=['POST'])
+def create_expenses_bulk():
+    data = request.get_json()
+    user_id = data.get('user_id')
+    items = data.get('expenses')
+
+    if not user_id or not isinstance(items, list):
+        return jsonify({'message': 'Missing required fields'}), 400
+    authorize(user_id)
+    if len(items) > ledger.MAX_BULK_EXPENSES:
+        return jsonify({'message': f'At most {ledger.MAX_BULK_EXPENSES} expenses per request'}), 413
+
+    key = idempotency.request_key(data)
+    if key:
+        request_hash = idempotency.payload_hash(data)
+        replayed = idempotency.replay(user_id, key, request_hash)
+        if replayed is not None:
+            return replayed
+
+    rows, errors = ledger.validate_expenses(user_id, items)
+    ids = ledger.insert_expenses(user_id, [values for _, values in rows])
+
+    results = [None] * len(items)
+    for (index, _), expense_id in zip(rows, ids):
+        results[index] = {'index': index, 'status': 'created', 'id': expense_id}
+    for index, message in errors:
+        results[index] = {'index': index, 'status': 'error', 'error': message}
+
+    status = 201 if not errors else 207 if ids else 400
+    response = make_response(jsonify({'created': len(ids), 'failed': len(errors), 'results': results}), status)
+
+    if key:
+        idempotency.remember(user_id, key, request_hash, response)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key committed first
+        db.session.rollback()
+        if key:
+            return idempotency.replay(user_id, key, request_hash)
+        raise
+    return response
+
+@api_bp.route('/users/<int:user_id>/imports', methods=['POST'])
+def import_statement(user_id):
+    authorize(user_id)
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'message': "Missing 'file' upload"}), 400
+
+    try:
+        rules = json.loads(request.form.get('rules') or '[]')
+        stats = importer.import_statement(
+            user_id,
+            importer.text_stream(upload.stream),
+            importer.format_for(upload.filename or '', request.form.get('format')),
+            rules=rules,
+            default_category_id=request.form.get('default_category_id', type=int),
+            debits_positive=request.form.get('debits_positive') == 'true',
+        )
+    except (importer.StatementError, ValueError, KeyError) as e:
+        # Chunks committed before the bad row stay imported; a retry skips them
+        db.session.rollback()
+        return jsonify({'message': f'Could not import statement: {e}'}), 400
+    return jsonify(stats), 201
+
+def get_expense_or_404(expense_id):
+    # An archived expense is moved back to the expenses table to be changed
+    expense = db.session.get(Expense, expense_id) or archive.restore('expenses', expense_id)
+    if expense is None:
+        abort(404)
+    return expense
+
+@api_bp.route('/expenses/<int:expense_id>', methods=['PATCH'])
+def update_expense(expense_id):
+    data = request.get_json()
+    expense = get_expense_or_404(expense_id)
+    authorize(expense.user_id)
+    amount = parse_amount(data["amount"]) if "amount" in data else None
+    if "amount" in data and amount is None:
+        return amount_error('amount')
+
+    if "name" in data:
+        expense.name = data["name"]
+    if "amount" in data:
+        expense.amount = amount
+    if "date" in data:
+        expense.date = datetime.strptime(data["date"], "%Y-%m-%d").date()
+
+    db.session.commit()
+    return jsonify({"message": "Expense updated"})
+
+@api_bp.route('/expenses/<int:expense_id>', methods=['DELETE'])
+def delete_expense(expense_id):
+    expense = get_expense_or_404(expense_id)
+    authorize(expense.user_id)
+    db.session.delete(expense)
+    db.session.commit()
+    return jsonify({'message': 'Expense deleted successfully'})
+
+
+
+# Everything the Dashboard screen shows, in one round trip: categories with
+# spent totals, recent expenses and incomes, and upcoming recurring bills.
+# Optional query param: recent (number of recent rows, default 20).
+@api_bp.route('/users/<int:user_id>/dashboard', methods=['GET'])
+@conditional_get()
+def get_user_dashboard(user_id):
+    recent = request.args.get('recent', 20, type=int)
+    if not 1 <= recent <= 500:
+        return jsonify({'message': "'recent' must be between 1 and 500"}), 400
+
+    categories = reports.category_totals(user_id)
+    return jsonify({
+        "categories": categories,
+        "expenses": reports.recent_expenses(user_id, recent),
+        "incomes": reports.recent_incomes(user_id, recent),
+        "recurring_expenses": reports.upcoming_recurring(user_id, datetime.utcnow().date()),
+        "totals": {
+            "budget": money.total(c["budget"] for c in categories),
+            "spent": money.total(c["spent"] for c in categories),
+            "income": reports.income_total(user_id),
+        },
+    })
+
+# Get a user's expenses for the current month
+@api_bp.route('/expenses/monthly', methods=['GET'])
+@conditional_get()
+def get_monthly_expenses():
+    user_id = request.args.get('user_id', type=int)
+
+    if user_id is None:
+        return jsonify({'message': 'Missing user_id in query parameters'}), 400
+
+    try:
+        # Calculate the start of the current month
+        start_of_month = datetime.utcnow().date().replace(day=1)
+
+        # Query the user's expenses for the current month
+        expenses = (
+            serializers.expense_query()
+            .filter(Expense.user_id == user_id, Expense.date >= start_of_month)
+            .order_by(Expense.date)
+            .all()
+        )
+        result = [serializers.expense_to_dict(e) for e in expenses]
+
+        return jsonify(result), 200
+    except Exception as e:
+        log.exception('Error fetching monthly expenses')
+        return jsonify({"error": str(e)}), 500
+
+def date_range_args():
+    date_from = parse_date(request.args['from'], 'from') if request.args.get('from') else None
+    date_to = parse_date(request.args['to'], 'to') if request.args.get('to') else None
+    return date_from, date_to
+
+# Per-category spent totals and budget remaining for a user.
+# Optional query params: from, to (YYYY-MM-DD); all time by default.
+@api_bp.route('/users/<int:user_id>/summary', methods=['GET'])
+@conditional_get()
+def get_user_summary(user_id):
+    try:
+        date_from, date_to = date_range_args()
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+
+    categories = reports.category_totals(user_id, date_from, date_to)
+    total_budget = money.total(c["budget"] for c in categories)
+    total_spent = money.total(c["spent"] for c in categories)
+    return jsonify({
+        "from": date_from.isoformat() if date_from else None,
+        "to": date_to.isoformat() if date_to else None,
+        "total_budget": total_budget,
+        "total_spent": total_spent,
+        "remaining": money.total([total_budget, -total_spent]),
+        "categories": categories,
+    })
+
+# Expense sums per day or month for a user.
+# Query params: group=day|month (default month), from, to, by_category=1
+@api_bp.route('/users/<int:user_id>/spending', methods=['GET'])
+@conditional_get()
+def get_user_spending(user_id):
+    period = request.args.get('group', 'month')
+    if period not in reports.PERIOD_FORMATS:
+        return jsonify({'message': "'group' must be 'day' or 'month'"}), 400
+
+    try:
+        date_from, date_to = date_range_args()
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+
+    by_category = request.args.get('by_category') in ('1', 'true')
+    return jsonify(reports.spending_by_period(user_id, period, date_from, date_to, by_category))
+
+def paginated(rows, next_cursor):
+    response = jsonify(rows)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+# Get expenses for a specific user, newest first, archived ones included.
+# Optional query params: from, to (YYYY-MM-DD), limit, cursor. The cursor for
+# the next page is returned in the X-Next-Cursor header.
+@api_bp.route('/users/<int:user_id>/expenses', methods=['GET'])
+@conditional_get()
+def get_user_expenses(user_id):
+    try:
+        page = page_args(request.args)
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+
+    expenses, next_cursor = archive.paginate(
+        'expenses', lambda e: serializers.expense_select(e).where(e.user_id == user_id), page
+    )
+    result = [serializers.expense_to_dict(e) for e in expenses]
+    return paginated(result, next_cursor)
+
+# Get expenses for a specific category, newest first (same paging params)
+@api_bp.route('/categories/<int:category_id>/expenses', methods=['GET'])
+@conditional_get(owner=category_version)
+def get_expenses_by_category(category_id):
+    try:
+        page = page_args(request.args)
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+
+    expenses, next_cursor = archive.paginate(
+        'expenses', lambda e: serializers.expense_select(e).where(e.category_id == category_id), page
+    )
+    result = [serializers.expense_to_dict(e) for e in expenses]
+    return paginated(result, next_cursor)
+
+# Search a user's expenses (or incomes, with type=incomes) by name, best
+# matches first. Every word of q matches as a prefix ("cof sho" finds
+# "Coffee shop"). Optional query params: category_id (expenses only),
+# from, to (YYYY-MM-DD), limit (default 50), cursor (from X-Next-Cursor).
+@api_bp.route('/users/<int:user_id>/search', methods=['GET'])
+@conditional_get()
+def search_user_records(user_id):
+    kind = request.args.get('type', 'expenses')
+    if kind not in search.INDEXES:
+        return jsonify({'message': "'type' must be 'expenses' or 'incomes'"}), 400
+    category_id = request.args.get('category_id', type=int)
+    if category_id is not None and kind != 'expenses':
+        return jsonify({'message': "'category_id' only applies to expenses"}), 400
+    try:
+        page = page_args({k: v for k, v in request.args.items() if k != 'cursor'})
+        cursor = search.decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        rows, next_cursor = search.search(
+            user_id,
+            request.args.get('q', ''),
+            kind=kind,
+            category_id=category_id,
+            date_from=page['date_from'],
+            date_to=page['date_to'],
+            limit=page['limit'] or search.DEFAULT_LIMIT,
+            cursor=cursor,
+        )
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+    return paginated(rows, next_cursor)
+
+
+# Projected month-end spending per category, with budget overrun warnings
+# (see forecast.py). Optional query param: date (YYYY-MM-DD, default today).
+@api_bp.route('/users/<int:user_id>/forecast', methods=['GET'])
+@conditional_get()
+def get_user_forecast(user_id):
+    try:
+        today = parse_date(request.args['date'], 'date') if request.args.get('date') else None
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+
+    result = forecast.for_user(user_id, today)
+    if result is None:
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify(result)
+
+
+# Everything a user owns, streamed in chunks so memory stays flat at any size.
+# Query params: format=ndjson|csv (default ndjson), type=categories|
+# recurring_expenses|expenses|incomes (required for csv; ndjson exports
+# every kind when omitted). Not cached: the body is never held in memory.
+@api_bp.route('/users/<int:user_id>/export', methods=['GET'])
+def export_user_data(user_id):
+    authorize(user_id)
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return jsonify({'message': "'format' must be 'ndjson' or 'csv'"}), 400
+    kind = request.args.get('type')
+    if kind is not None and kind not in export.KINDS:
+        return jsonify({'message': "'type' must be one of " + ', '.join(export.KINDS)}), 400
+    if fmt == 'csv' and kind is None:
+        return jsonify({'message': "'type' is required for CSV exports"}), 400
+    if db.session.get(User, user_id) is None:
+        return jsonify({'error': 'User not found'}), 404
+
+    if fmt == 'csv':
+        chunks = export.csv_rows(user_id, kind)
+    else:
+        chunks = export.ndjson(user_id, [kind] if kind else export.KINDS)
+    filename = f"savvium-{user_id}-{kind or 'all'}.{fmt}"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=export.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+# Delete a category (and associated expenses)
+@api_bp.route('/categories/<int:category_id>', methods=['DELETE'])
+def delete_category(category_id):
+    category = db.get_or_404(BudgetCategory, category_id)
+    authorize(category.user_id)
+    db.session.delete(category)
+    db.session.commit()
+    return jsonify({"message": "Category and associated expenses deleted."})
+
+# Update a category (e.g., edit budget)
+@api_bp.route('/categories/<int:id>', methods=['PATCH'])
+def update_category(id):
+    data = request.get_json()
+    category = db.session.get(BudgetCategory, id)
+
+    if not category:
+        return jsonify({'error': 'Category not found'}), 404
+    authorize(category.user_id)
+
+    if 'budget' in data:
+        budget = parse_amount(data['budget'])
+        if budget is None:
+            return amount_error('budget')
+        category.budget = budget
+
+    db.session.commit()
+    return jsonify({'message': 'Category updated successfully'})
+
+# Get categories for a specific user
+@api_bp.route('/users/<int:user_id>/categories', methods=['GET'])
+@conditional_get()
+def get_user_categories(user_id):
+    categories = serializers.category_query().filter(BudgetCategory.user_id == user_id).all()
+    result = [serializers.category_to_dict(c) for c in categories]
+    return jsonify(result)
+
+# Create a new income entry
+@api_bp.route('/incomes', methods=['POST'])
+def add_income():
+    data = request.get_json()
+    user_id = data.get('user_id')
+    name = data.get('name')
+    amount = data.get('amount')
+    date_str = data.get('date')
+
+    if not user_id or not name or not amount:
+        return jsonify({'message': 'Missing required fields'}), 400
+    authorize(user_id)
+    amount = parse_amount(amount)
+    if amount is None:
+        return amount_error('amount')
+
+    try:
+        income_date = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else datetime.utcnow().date()
+
+        income = Income(
+            user_id=user_id,
+            name=name,
+            amount=amount,
+            date=income_date
+        )
+        db.session.add(income)
+        db.session.commit()
+        return jsonify({'message': 'Income added successfully'}), 201
+    except Exception as e:
+        log.exception('Error saving income')
+        db.session.rollback()
+        return jsonify({'message': 'Error saving income', 'error': str(e)}), 500
+
+# Get income entries of a user, newest first (same paging params)
+@api_bp.route('/users/<int:user_id>/incomes', methods=['GET'])
+@conditional_get()
+def get_user_incomes(user_id):
+    try:
+        page = page_args(request.args)
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+
+    incomes, next_cursor = archive.paginate(
+        'incomes', lambda i: serializers.income_select(i).where(i.user_id == user_id), page
+    )
+    result = [serializers.income_to_dict(i) for i in incomes]
+    return paginated(result, next_cursor)
+
+# Delta sync: every category, expense, income and recurring expense created,
+# updated or deleted since the given sync token (0 for a full snapshot).
+# Query param: since (the sync_token returned by the previous call).
+@api_bp.route('/users/<int:user_id>/sync', methods=['GET'])
+@conditional_get()
+def get_user_changes(user_id):
+    since = request.args.get('since', 0, type=int)
+    if since < 0:
+        return jsonify({'message': "'since' must be a non-negative integer"}), 400
+
+    result = sync.changes_since(user_id, since)
+    if result is None:
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify(result)
+
+# A bill falls due on due_day each month; 29-31 fall on the last day of
+# shorter months (see scheduler.py)
+DUE_DAY_MESSAGE = "'due_day' must be an integer from 1 to 31"
+
+def valid_due_day(value):
+    return ledger.is_id(value) and 1 <= value <= 31
+
+# Create a new recurring expense
+@api_bp.route('/recurring-expenses', methods=['POST'])
+def add_recurring_expense():
+    data = request.get_json()
+    user_id = data.get('user_id')
+    name = data.get('name')
+    amount = data.get('amount')
+    category_id = data.get('category_id')
+    due_day = data.get('due_day')  # 1–31
+
+    if not all([user_id, name, amount, category_id, due_day]):
+        return jsonify({'message': 'Missing required fields'}), 400
+    authorize(user_id)
+    if not valid_due_day(due_day):
+        return jsonify({'message': DUE_DAY_MESSAGE}), 400
+    if not ledger.is_id(category_id) or not ledger.owned_category_ids(user_id, {category_id}):
+        return jsonify({'message': 'Category not found'}), 400
+    amount = parse_amount(amount)
+    if amount is None:
+        return amount_error('amount')
+
+    try:
+        new_expense = RecurringExpense(
+            user_id=user_id,
+            name=name,
+            amount=amount,
+            category_id=category_id,
+            due_day=due_day
+        )
+        db.session.add(new_expense)
+        db.session.commit()
+        return jsonify({'message': 'Recurring expense added'}), 201
+    except Exception as e:
+        log.exception('Error saving recurring expense')
+        db.session.rollback()
+        return jsonify({'message': 'Error saving expense', 'error': str(e)}), 500
+
+# Get recurring expenses
+@api_bp.route('/recurring-expenses', methods=['GET'])
+@conditional_get()
+def get_recurring_expenses():
+    user_id = request.args.get('user_id', type=int)
+
+    if user_id is None:
+        return jsonify({'message': 'Missing user_id in query parameters'}), 400
+
+    try:
+        expenses = serializers.recurring_query().filter(RecurringExpense.user_id == user_id).all()
+        result = [serializers.recurring_to_dict(e) for e in expenses]
+        return jsonify(result), 200
+    except Exception as e:
+        log.exception('Error fetching recurring expenses')
+        return jsonify({'message': 'Error fetching expenses', 'error': str(e)}), 500
+
+
+# Update recurring expense
+@api_bp.route('/recurring-expenses/<int:expense_id>', methods=['PATCH'])
+def update_recurring_expense(expense_id):
+    data = request.get_json()
+    expense = db.get_or_404(RecurringExpense, expense_id)
+    authorize(expense.user_id)
+    if 'due_day' in data and not valid_due_day(data['due_day']):
+        return jsonify({'message': DUE_DAY_MESSAGE}), 400
+    amount = parse_amount(data['amount']) if 'amount' in data else None
+    if 'amount' in data and amount is None:
+        return amount_error('amount')
+
+    if 'due_day' in data:
+        expense.due_day = data['due_day']
+    if 'amount' in data:
+        expense.amount = amount
+
+    db.session.commit()
+    return jsonify({'message': 'Recurring expense updated'})
+
+# Delete recurring expense
+@api_bp.route('/recurring-expenses/<int:expense_id>', methods=['DELETE'])
+def delete_recurring_expense(expense_id):
+    expense = db.get_or_404(RecurringExpense, expense_id)
+    authorize(expense.user_id)
+    # Expenses it already created stay; they just stop pointing at the bill
+    Expense.query.filter_by(recurring_id=expense_id).update({'recurring_id': None})
+    db.session.delete(expense)
+    db.session.commit()
+    return jsonify({'message': 'Recurring expense deleted'})
@@ -0,0 +1,256 @@
+"""Archival of old expenses and incomes into per-year tables.
+
+The archive job moves rows dated before the horizon (the first day of the
+month ARCHIVE_AFTER_MONTHS back) out of expenses and incomes into
+expenses_archive_<year> and incomes_archive_<year>. Archive tables keep
+every column of the hot table, with indexes for the list endpoints, delta
+sync and the lookups that have to see archived rows too (Plaid
+transaction ids, materialized recurring bills). The hot tables and their
+indexes then only hold recent rows. monthly_rollups is left alone, so
+totals over archived months are still read from it. Archived names stay
+in the search index; as the hot table's triggers no longer cover them,
+the archive job and restore() add and remove them with search_index().
+
+Reads that can reach back past the horizon take sources(): the hot model
+plus an alias of it for every archived year the range overlaps. The list
+endpoints query them as one UNION ALL ordered by (date, id). SQLite
+answers it by merging the index-ordered arms, so a page costs about the
+same whatever the number of archived rows. Archived rows are read-only;
+editing or deleting one first moves it back with restore().
+
+    flask --app app archive
+"""
+from collections import Counter, defaultdict
+from datetime import date, datetime
+import click
+from flask import current_app, g
+from sqlalchemy import (
+    Column, Index, MetaData, Table, column, delete, event, insert, literal, select, table as table_clause, union_all,
+)
+from sqlalchemy.dialects.sqlite import insert as upsert
+from sqlalchemy.orm import aliased
+from models import db, ArchivedYear, BudgetCategory, Expense, Income, Tombstone
+import changes
+import pagination
+
+# kind -> (model, indexes). Archive tables created before migrations 17
+# and 18 are brought up to date by them.
+KINDS = {
+    'expenses': (
+        Expense,
+        (('user_id', 'date'), ('category_id', 'date'), ('user_id', 'version'),
+         ('plaid_transaction_id',), ('recurring_id', 'period')),
+    ),
+    'incomes': (
+        Income,
+        (('user_id', 'date'), ('user_id', 'version')),
+    ),
+}
+
+# Archive tables are created by the archive job, so they live outside
+# db.metadata and create_all() leaves them alone
+metadata = MetaData()
+_entities = {}
+
+
+def table(kind, year):
+    name = f'{kind}_archive_{year}'
+    if name not in metadata.tables:
+        model, indexes = KINDS[kind]
+        Table(
+            name, metadata,
+            *[Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+              for c in model.__table__.c],
+            *[Index(f'ix_{name}_{"_".join(index)}', *index) for index in indexes],
+        )
+    return metadata.tables[name]
+
+
+def search_index(kind, year, where=None, remove=False):
+    """An INSERT that adds the archived rows of `year` matching `where` to
+    the kind's search index, or removes them from it."""
+    archived = table(kind, year)
+    name = f'{kind}_fts'
+    fts = table_clause(name, column(name), column('rowid'), column('name'), column('owner'))
+    columns = [fts.c.rowid, fts.c.name, fts.c.owner]
+    values = [archived.c.id, archived.c.name, literal('u').concat(archived.c.user_id)]
+    if remove:
+        # FTS5's delete command, which needs the values that were indexed
+        columns.insert(0, fts.c[name])
+        values.insert(0, literal('delete'))
+    rows = select(*values)
+    if where is not None:
+        rows = rows.where(where)
+    return insert(fts).from_select(columns, rows)
+
+
+def entity(kind, year):
+    """The kind's model mapped onto one archived year, for ORM-style column access."""
+    if (kind, year) not in _entities:
+        _entities[(kind, year)] = aliased(KINDS[kind][0], table(kind, year), adapt_on_names=True)
+    return _entities[(kind, year)]
+
+
+def years(kind):
+    """The archived years of `kind`, read once per request."""
+    if 'archived_years' not in g:
+        found = defaultdict(list)
+        for row in db.session.execute(select(ArchivedYear.kind, ArchivedYear.year).order_by(ArchivedYear.year)):
+            found[row.kind].append(row.year)
+        g.archived_years = found
+    return g.archived_years[kind]
+
+
+def sources(kind, date_from=None, date_to=None):
+    """The hot model and the archived years that can hold rows between the dates."""
+    result = [KINDS[kind][0]]
+    for year in years(kind):
+        if (date_from is None or year >= date_from.year) and (date_to is None or year <= date_to.year):
+            result.append(entity(kind, year))
+    return result
+
+
+def union(kind, build, date_from=None, date_to=None):
+    """build(source) for every source as one UNION ALL (just the hot select if nothing is archived)."""
+    selects = [build(source) for source in sources(kind, date_from, date_to)]
+    return union_all(*selects) if len(selects) > 1 else selects[0]
+
+
+def paginate(kind, build, page):
+    """pagination.paginate() over hot and archived rows.
+
+    `build(source)` returns the select for one source, filtered to the
+    owner and with 'date' and 'id' labelled. Archived years outside the
+    page's range, or past its cursor, are not read at all.
+    """
+    upper = page['date_to']
+    if page['cursor'] and (upper is None or page['cursor'][0] < upper):
+        upper = page['cursor'][0]
+    arms = [(build(s), s.date, s.id) for s in sources(kind, page['date_from'], upper)]
+    return pagination.paginate_union(arms, page)
+
+
+def restore(kind, row_id):
+    """Move an archived row back to its hot table and return it, or None if it is not archived.
+
+    The row keeps its id. Its month's rollup already counts it, so the
+    move goes around the ORM and leaves monthly_rollups alone.
+    """
+    model = KINDS[kind][0]
+    for year in reversed(years(kind)):
+        archived = table(kind, year)
+        row = db.session.execute(select(archived).where(archived.c.id == row_id)).mappings().first()
+        if row is not None:
+            # Inserting into the hot table indexes the row again
+            db.session.execute(search_index(kind, year, archived.c.id == row_id, remove=True))
+            db.session.execute(insert(model.__table__).values(**row))
+            db.session.execute(delete(archived).where(archived.c.id == row_id))
+            return db.session.get(model, row_id)
+    return None
+
+
+def restore_where(kind, build):
+    """restore() every archived row whose id build(source) selects. Returns how many were moved."""
+    archived = [build(source) for source in sources(kind)[1:]]
+    if not archived:
+        return 0
+    ids = db.session.execute(union_all(*archived) if len(archived) > 1 else archived[0]).scalars().all()
+    for row_id in ids:
+        restore(kind, row_id)
+    return len(ids)
+
+
+def horizon(today):
+    """First day of the oldest month kept hot."""
+    config = current_app.config
+    # Forecasts read FORECAST_HISTORY_MONTHS of past expenses from the hot table
+    months = max(config['ARCHIVE_AFTER_MONTHS'], config['FORECAST_HISTORY_MONTHS'] + 1)
+    index = today.year * 12 + today.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive(kind, before, batch_size):
+    """Move rows of `kind` dated before `before` to their year's archive
+    table, one transaction per batch. Returns {year: rows moved}."""
+    model, _ = KINDS[kind]
+    hot = model.__table__
+    columns = [c.name for c in hot.c]
+    moved = Counter()
+    # Ids are AUTOINCREMENT (see migration 16), so a new hot row never
+    # takes an archived row's id, whatever the dates of the rows left hot
+    created = set(years(kind))
+    while True:
+        rows = db.session.execute(
+            select(hot.c.id, hot.c.date)
+            .where(hot.c.date < before)
+            .order_by(hot.c.date)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        by_year = defaultdict(list)
+        for row in rows:
+            by_year[row.date.year].append(row.id)
+        for year, ids in by_year.items():
+            archived = table(kind, year)
+            if year not in created:
+                archived.create(db.session.connection(), checkfirst=True)
+                db.session.execute(
+                    upsert(ArchivedYear).on_conflict_do_nothing(),
+                    {'kind': kind, 'year': year, 'archived_at': datetime.utcnow()},
+                )
+                created.add(year)
+            db.session.execute(
+                insert(archived).from_select(columns, select(*[hot.c[c] for c in columns]).where(hot.c.id.in_(ids)))
+            )
+            moved[year] += len(ids)
+        # Fires the search index's delete trigger, but not the ORM hooks
+        # that would adjust rollups and leave sync tombstones
+        db.session.execute(delete(hot).where(hot.c.id.in_([row.id for row in rows])))
+        for year, ids in by_year.items():
+            db.session.execute(search_index(kind, year, table(kind, year).c.id.in_(ids)))
+        db.session.commit()
+    g.pop('archived_years', None)
+    return moved
+
+
+def _before_flush(session, flush_context, instances):
+    # Deleting a category deletes its archived expenses too, with a
+    # tombstone each as sync reports archived rows
+    dropped = [obj.id for obj in session.deleted if isinstance(obj, BudgetCategory)]
+    if not dropped:
+        return
+    connection = session.connection()
+    for year in connection.execute(select(ArchivedYear.year).where(ArchivedYear.kind == 'expenses')).scalars().all():
+        archived = table('expenses', year)
+        where = archived.c.category_id.in_(dropped)
+        for row in connection.execute(select(archived.c.id, archived.c.user_id).where(where)):
+            session.add(Tombstone(user_id=row.user_id, table_name='expenses', row_id=row.id,
+                                  version=changes.record_change(row.user_id)))
+        connection.execute(search_index('expenses', year, where, remove=True))
+        connection.execute(delete(archived).where(where))
+
+
+def init_app(app):
+    # Rows older than this many whole months are archived
+    app.config.setdefault('ARCHIVE_AFTER_MONTHS', 24)
+    app.config.setdefault('ARCHIVE_BATCH_SIZE', 5000)
+
+    if not event.contains(db.session, 'before_flush', _before_flush):
+        event.listen(db.session, 'before_flush', _before_flush)
+
+    @app.before_request
+    def forget_archived_years():
+        # The archive job may have run since the last request of this app context
+        g.pop('archived_years', None)
+
+    @app.cli.command('archive')
+    @click.option('--date', 'today', type=click.DateTime(['%Y-%m-%d']), help='Run as if today were this date.')
+    def archive_command(today):
+        """Move expenses and incomes older than ARCHIVE_AFTER_MONTHS to the archive tables."""
+        before = horizon(today.date() if today else datetime.utcnow().date())
+        for kind in KINDS:
+            moved = archive(kind, before, app.config['ARCHIVE_BATCH_SIZE'])
+            for year, count in sorted(moved.items()):
+                click.echo(f'Archived {count} {kind} from {year}')
+        click.echo(f'Rows dated before {before.isoformat()} are archived.')
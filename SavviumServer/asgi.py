@@ -0,0 +1,240 @@
+"""ASGI entry point: `uvicorn asgi:application`.
+
+Requests for the async routes below run on the event loop, so thousands
+of them can wait on Plaid or the database at once in one process. Every
+other request is handed to the Flask app unchanged through a2wsgi's
+WSGIMiddleware. Those routes stay synchronous, since they use the sync
+SQLAlchemy session, and run on ASGI_WSGI_THREADS threads.
+
+Needs `pip install uvicorn httpx aiosqlite a2wsgi` on top of the WSGI
+requirements (see aio.py).
+"""
+import asyncio
+import json
+import logging
+from datetime import date, timedelta
+from urllib.parse import parse_qs
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import Map, Rule
+from app import create_app
+from aio import AsyncResources
+from models import BudgetCategory, PlaidItem
+import plaid
+from plaid_sync import PlaidSync
+from tokens import MissingSecretKey, token_user_id
+
+log = logging.getLogger(__name__)
+
+
+async def read_body(receive):
+    # Only for the async routes, whose bodies are small JSON documents
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return bytes(body)
+
+
+class AsyncRequest:
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.method = scope['method']
+        self.body = body
+        self.headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        self.user_id = None
+
+    @property
+    def args(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode('latin-1'))
+        return {key: values[-1] for key, values in query.items()}
+
+    def get_json(self):
+        try:
+            return json.loads(self.body or b'null')
+        except ValueError:
+            return None
+
+
+class AsyncApp:
+    """Async routes in front of the Flask app.
+
+    Routes are matched with werkzeug's router, so rules are written as in
+    Flask; anything that does not match falls through to the Flask app.
+    Views are called as `await view(request, **url_args)` inside a Flask
+    app context and return a JSON-able body, or `(body, status)`.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.resources = AsyncResources(flask_app)
+        # Streams request bodies into wsgi.input as they arrive, so uploads
+        # such as statement imports are not held in memory
+        self.fallback = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_THREADS'])
+        self.url_map = Map()
+        self.views = {}
+
+    def route(self, rule, methods):
+        def decorator(view):
+            self.url_map.add(Rule(rule, endpoint=view.__name__, methods=methods))
+            self.views[view.__name__] = view
+            return view
+        return decorator
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        adapter = self.url_map.bind('localhost')
+        try:
+            endpoint, url_args = adapter.match(scope['path'], method=scope['method'])
+        except (NotFound, MethodNotAllowed):
+            return await self.fallback(scope, receive, send)
+
+        request = AsyncRequest(scope, await read_body(receive))
+        with self.flask_app.app_context():
+            try:
+                result = await self.dispatch(endpoint, request, url_args)
+            except plaid.PlaidError as e:
+                log.warning('Plaid error: %s', e.payload)
+                result = {'error': str(e)}, 502
+            except Exception:
+                log.exception('Error in %s', endpoint)
+                result = {'error': 'Server error'}, 500
+        body, status = result if isinstance(result, tuple) else (result, 200)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        # Serialized like Flask's jsonify, so both halves look the same to clients
+        payload = json.dumps(body, separators=(',', ':')) + '\n'
+        await send({'type': 'http.response.body', 'body': payload.encode('utf-8')})
+
+    async def dispatch(self, endpoint, request, url_args):
+        # Same rules as auth.load_caller, except that every async route
+        # needs a caller.
+        header = request.headers.get('authorization', '')
+        if not header.startswith('Bearer '):
+            return {'message': 'Authentication required'}, 401
+        try:
+            request.user_id = token_user_id(header[len('Bearer '):].strip())
+        except MissingSecretKey:
+            return {'message': 'Sign-in is not configured on this server'}, 500
+        if request.user_id is None:
+            return {'message': 'Invalid or expired token'}, 401
+        return await self.views[endpoint](request, **url_args)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    self.resources.open()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.resources.close()
+                self.fallback.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(config=None):
+    asgi_app = AsyncApp(create_app(config))
+    flask_app = asgi_app.flask_app
+    resources = asgi_app.resources
+
+    def plaid_client():
+        return plaid.client_for(flask_app, resources.http)
+
+    @asgi_app.route('/plaid/link-token', methods=['POST'])
+    async def create_link_token(request):
+        data = await plaid_client().link_token_create(
+            request.user_id, flask_app.config['PLAID_CLIENT_NAME'])
+        return {'link_token': data['link_token'], 'expiration': data.get('expiration')}
+
+    @asgi_app.route('/plaid/items', methods=['POST'])
+    async def exchange_public_token(request):
+        data = request.get_json() or {}
+        if not data.get('public_token'):
+            return {'message': 'Missing public_token'}, 400
+        category_id = data.get('default_category_id')
+        if category_id is not None:
+            async with resources.session() as session:
+                owned = await session.scalar(select(BudgetCategory.id).where(
+                    BudgetCategory.id == category_id, BudgetCategory.user_id == request.user_id))
+            if owned is None:
+                return {'error': 'Category not found'}, 404
+        exchanged = await plaid_client().item_public_token_exchange(data['public_token'])
+        # The access token stays on the server; the client only sees the item id
+        async with resources.session() as session, session.begin():
+            session.add(PlaidItem(
+                user_id=request.user_id,
+                item_id=exchanged['item_id'],
+                access_token=exchanged['access_token'],
+                default_category_id=category_id,
+            ))
+        return {'message': 'Bank account linked', 'item_id': exchanged['item_id']}, 201
+
+    @asgi_app.route('/users/<int:user_id>/plaid/sync', methods=['POST'])
+    async def sync_plaid_items(request, user_id):
+        if user_id != request.user_id:
+            return {'message': 'Not allowed'}, 403
+        return await PlaidSync(flask_app, resources.http).run(user_id)
+
+    @asgi_app.route('/users/<int:user_id>/plaid/transactions', methods=['GET'])
+    async def get_plaid_transactions(request, user_id):
+        if user_id != request.user_id:
+            return {'message': 'Not allowed'}, 403
+        try:
+            days = int(request.args.get('days', 30))
+        except ValueError:
+            return {'message': 'days must be a number'}, 400
+        if not 1 <= days <= 730:
+            return {'message': 'days must be between 1 and 730'}, 400
+
+        async with resources.session() as session:
+            items = (await session.scalars(
+                select(PlaidItem).where(PlaidItem.user_id == user_id))).all()
+
+        end = date.today()
+        start = end - timedelta(days=days)
+        client = plaid_client()
+
+        async def fetch(item):
+            transactions = []
+            while True:
+                page = await client.transactions_get(
+                    item.access_token, start, end, offset=len(transactions))
+                transactions += page['transactions']
+                if not page['transactions'] or len(transactions) >= page['total_transactions']:
+                    break
+            return [{
+                'item_id': item.item_id,
+                'transaction_id': t['transaction_id'],
+                'date': t['date'],
+                'name': t['name'],
+                'amount': t['amount'],
+                'category': (t.get('category') or [None])[0],
+            } for t in transactions]
+
+        # Each bank is a separate round trip to Plaid; wait on them together
+        results = await asyncio.gather(*(fetch(item) for item in items))
+        return [t for item_transactions in results for t in item_transactions]
+
+    return asgi_app
+
+
+application = create_asgi_app()
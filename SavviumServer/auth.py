@@ -1,33 +1,95 @@
-from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+import logging
+from flask import Blueprint, abort, current_app, g, request, jsonify
 from models import db, User
+from passwords import hasher, PoolBusy
+from tokens import MissingSecretKey, issue_token, token_user_id
 
 
 auth_bp = Blueprint('auth', __name__)
 
+# Endpoints callable without a token even when AUTH_REQUIRED is set
+PUBLIC_ENDPOINTS = {'auth.signup', 'auth.login', 'api.hello_world', 'prometheus_metrics', 'static'}
+# Operational counters (cache, password pool), which need a token even
+# when AUTH_REQUIRED is off
+TOKEN_ENDPOINTS = {'cache_stats', 'password_stats'}
+
+log = logging.getLogger(__name__)
+
+
+@auth_bp.record_once
+def configure(state):
+    state.app.config.setdefault('AUTH_REQUIRED', False)
+    state.app.config.setdefault('TOKEN_MAX_AGE', 30 * 24 * 3600)
+
+
+@auth_bp.before_app_request
+def load_caller():
+    # g.user_id is the caller proven by an "Authorization: Bearer <token>"
+    # header, or None for a request without one (allowed unless
+    # AUTH_REQUIRED is set, so older clients keep working).
+    g.user_id = None
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        g.user_id = token_user_id(header[len('Bearer '):].strip())
+        if g.user_id is None:
+            return jsonify({'message': 'Invalid or expired token'}), 401
+    elif request.endpoint in TOKEN_ENDPOINTS or (
+        current_app.config['AUTH_REQUIRED'] and request.endpoint not in PUBLIC_ENDPOINTS
+    ):
+        return jsonify({'message': 'Authentication required'}), 401
+
+
+def authorize(user_id):
+    """Abort with 403 unless the authenticated caller owns `user_id`'s data."""
+    if g.get('user_id') is None:
+        return
+    try:
+        owner = int(user_id)
+    except (TypeError, ValueError):
+        abort(403)
+    if owner != g.user_id:
+        abort(403)
+
+
+@auth_bp.app_errorhandler(403)
+def forbidden(e):
+    return jsonify({'message': 'Not allowed'}), 403
+
+
+@auth_bp.app_errorhandler(MissingSecretKey)
+def missing_secret_key(e):
+    log.error('Access tokens are disabled until SECRET_KEY is set to a random value')
+    return jsonify({'message': 'Sign-in is not configured on this server'}), 500
+
+
+@auth_bp.errorhandler(PoolBusy)
+def busy(e):
+    response = jsonify({'message': 'Too many sign-in attempts in progress, try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
 @auth_bp.route('/signup', methods=['POST'])
 def signup():
     data = request.get_json()
-    print("Signup data received:", data)
-
     if User.query.filter_by(email=data['email']).first():
-        print("User already exists.")
         return jsonify({'message': 'User already exists'}), 409
 
+    password = hasher.hash(data['password'])
     try:
         new_user = User(
             name=data['name'],
             last_name=data.get('last_name', ''),
             phone=data.get('phone', ''),
             email=data['email'],
-            password=generate_password_hash(data['password'])
+            password=password
         )
         db.session.add(new_user)
         db.session.commit()
-        print("New user created!")
+        log.info('Created user %s', new_user.id)
         return jsonify({'message': 'User created successfully'}), 201
-    except Exception as e:
-        print("Error while creating user:", e)
+    except Exception:
+        log.exception('Error while creating user')
         return jsonify({'message': 'Server error'}), 500
 
 
@@ -35,11 +97,15 @@ def signup():
 def login():
     data = request.get_json()
     user = User.query.filter_by(email=data['email']).first()
-    if not user or not check_password_hash(user.password, data['password']):
+    # The session is not needed while the KDF runs; end it so the
+    # connection goes back to the pool.
+    db.session.remove()
+    if not user or not hasher.verify(user.password, data['password']):
         return jsonify({'message': 'Invalid credentials'}), 401
 
     return jsonify({
         'message': 'Login successful',
+        'token': issue_token(user.id),
         'user': {
             'id': user.id,
             'name': user.name,
@@ -0,0 +1,374 @@
+"""Load tests for the server: a synthetic data set and the request
+sequences the app's screens make, with latency and query counts per step.
+
+The data set is generated from a seed into a fresh SQLite file: N users,
+each with M categories and K expenses, plus incomes and recurring bills,
+written through the same paths the API uses, so rollups and data
+versions are consistent. Each workload replays what one screen does:
+
+    dashboard         Dashboard: dashboard data and the monthly graph
+    category_details  CategoryDetails: a category's expenses
+    add_expense       AddExpense: categories, create the expense, back to the dashboard
+
+Workloads run a fixed number of iterations from several threads, either
+in-process through the Flask test client (query counts included) or
+against a running server with --url. Results are written as JSON;
+--compare reports the change between two result files.
+
+    python bench.py --users 50 --expenses 2000 --out before.json
+    python bench.py --users 50 --expenses 2000 --out after.json
+    python bench.py --compare before.json after.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import secrets
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from flask import g
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+WORKLOADS = ('dashboard', 'category_details', 'add_expense')
+CATEGORY_NAMES = ['groceries', 'rent', 'transport', 'dining', 'utilities', 'health',
+                  'entertainment', 'shopping', 'travel', 'education', 'gifts', 'pets']
+EXPENSE_NAMES = ['coffee', 'lunch', 'bus pass', 'groceries', 'movie', 'gas', 'pharmacy',
+                 'books', 'dinner', 'taxi', 'gym', 'phone bill']
+INSERT_CHUNK = 1000
+# A p50 or p99 this much slower than the baseline counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+
+def generate(users=20, categories=6, expenses=1000, incomes=24, recurring=4, seed=0, days=365):
+    """Fill the current app's (empty, migrated) database with synthetic data.
+
+    Returns {user_id: [category_id, ...]}. The same arguments always give
+    the same rows, with dates counted back from today.
+    """
+    from models import db, User, BudgetCategory, Income, RecurringExpense
+    from changes import record_change
+    import ledger
+
+    rng = random.Random(seed)
+    today = date.today()
+    # One hash for every user: the KDF is deliberately slow
+    password = generate_password_hash('bench-password')
+    layout = {}
+    for n in range(users):
+        user = User(name=f'Bench{n}', last_name='User', email=f'bench{n}@example.com', password=password)
+        db.session.add(user)
+        db.session.flush()
+        names = rng.sample(CATEGORY_NAMES, min(categories, len(CATEGORY_NAMES)))
+        names += [f'category {i}' for i in range(len(names), categories)]
+        version = record_change(user.id)
+        category_ids = db.session.execute(
+            insert(BudgetCategory).returning(BudgetCategory.id, sort_by_parameter_order=True),
+            [dict(user_id=user.id, name=name, budget=rng.randrange(100, 2000), color='#cccccc', version=version)
+             for name in names],
+        ).scalars().all()
+        layout[user.id] = category_ids
+
+        for start in range(0, expenses, INSERT_CHUNK):
+            ledger.insert_expenses(user.id, [
+                {
+                    'category_id': rng.choice(category_ids),
+                    'name': rng.choice(EXPENSE_NAMES),
+                    'amount': round(rng.uniform(1, 150), 2),
+                    'date': today - timedelta(days=rng.randrange(days)),
+                }
+                for _ in range(start, min(start + INSERT_CHUNK, expenses))
+            ])
+        version = record_change(user.id)
+        if incomes:
+            db.session.execute(insert(Income), [
+                dict(user_id=user.id, name='salary', amount=round(rng.uniform(1500, 6000), 2),
+                     date=today - timedelta(days=rng.randrange(days)), version=version)
+                for _ in range(incomes)
+            ])
+        if recurring:
+            db.session.execute(insert(RecurringExpense), [
+                dict(user_id=user.id, name=f'bill {i}', amount=round(rng.uniform(10, 300), 2),
+                     category_id=rng.choice(category_ids), due_day=rng.randint(1, 31),
+                     created_at=datetime.utcnow(), version=version)
+                for i in range(recurring)
+            ])
+        db.session.commit()
+    return layout
+
+
+class Recorder:
+    """Latency, status and SQL statement count of every request, per workload step."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, workload, step, seconds, status, queries):
+        with self._lock:
+            self.samples[(workload, step)].append((seconds, queries))
+            if status >= 400:
+                self.errors[(workload, step)] += 1
+
+
+def _percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class InProcessClient:
+    """Calls the app through its test client and reads each request's query count."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+        @app.after_request
+        def remember_query_count(response):
+            # metrics.py counts statements per request in g.query_count
+            self._local.queries = g.get('query_count')
+            return response
+
+    def request(self, method, path, token, body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        self._local.queries = None
+        response = client.open(path, method=method, json=body, headers={'Authorization': f'Bearer {token}'})
+        return response.status_code, response.get_json(silent=True), self._local.queries
+
+
+class HttpClient:
+    """Calls a running server; query counts are not available this way."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, token, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {'Authorization': f'Bearer {token}'}
+        if data is not None:
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req) as response:
+                return response.status, json.loads(response.read() or b'null'), None
+        except urllib.error.HTTPError as e:
+            return e.code, None, None
+
+
+def _steps(workload, user_id, category_ids, rng):
+    """The (step, method, path, body) requests one iteration of a workload makes."""
+    month_start = date.today().replace(day=1).isoformat()
+    if workload == 'dashboard':
+        return [
+            ('dashboard', 'GET', f'/users/{user_id}/dashboard', None),
+            ('monthly_graph', 'GET', f'/users/{user_id}/spending?group=day&from={month_start}', None),
+        ]
+    if workload == 'category_details':
+        return [('category_expenses', 'GET', f'/categories/{rng.choice(category_ids)}/expenses', None)]
+    if workload == 'add_expense':
+        return [
+            ('list_categories', 'GET', f'/users/{user_id}/categories', None),
+            ('create_expense', 'POST', '/expenses', {
+                'name': rng.choice(EXPENSE_NAMES),
+                'amount': round(rng.uniform(1, 150), 2),
+                'category_id': rng.choice(category_ids),
+            }),
+            ('dashboard', 'GET', f'/users/{user_id}/dashboard', None),
+        ]
+    raise ValueError(f'Unknown workload {workload!r}')
+
+
+def run_workload(client, workload, layout, tokens, iterations=200, threads=4, seed=0):
+    """Run `iterations` of a workload across `threads` threads; returns its report."""
+    recorder = Recorder()
+    users = sorted(layout)
+
+    def iteration(i):
+        rng = random.Random(f'{seed}:{workload}:{i}')
+        user_id = rng.choice(users)
+        for step, method, path, body in _steps(workload, user_id, layout[user_id], rng):
+            started = time.perf_counter()
+            status, _, queries = client.request(method, path, tokens[user_id], body)
+            recorder.add(workload, step, time.perf_counter() - started, status, queries)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(iteration, range(iterations)))
+    wall = time.perf_counter() - started
+
+    steps = {}
+    requests = 0
+    for (_, step), samples in recorder.samples.items():
+        latencies = sorted(s for s, _ in samples)
+        queries = [q for _, q in samples if q is not None]
+        requests += len(samples)
+        steps[step] = {
+            'requests': len(samples),
+            'errors': recorder.errors[(workload, step)],
+            'p50_ms': round(1000 * _percentile(latencies, 0.50), 3),
+            'p90_ms': round(1000 * _percentile(latencies, 0.90), 3),
+            'p99_ms': round(1000 * _percentile(latencies, 0.99), 3),
+            'mean_ms': round(1000 * statistics.fmean(latencies), 3),
+            'max_ms': round(1000 * latencies[-1], 3),
+            'queries_mean': round(statistics.fmean(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+    return {
+        'iterations': iterations,
+        'threads': threads,
+        'seconds': round(wall, 3),
+        'requests': requests,
+        'requests_per_second': round(requests / wall, 1),
+        'iterations_per_second': round(iterations / wall, 1),
+        'steps': steps,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Per-step p50/p99 changes between two result files, and the regressions among them."""
+    rows, regressions = [], []
+    for workload, report in current['workloads'].items():
+        base_steps = baseline['workloads'].get(workload, {}).get('steps', {})
+        for step, stats in report['steps'].items():
+            base = base_steps.get(step)
+            if not base:
+                continue
+            row = {'workload': workload, 'step': step}
+            for key in ('p50_ms', 'p99_ms'):
+                change = (stats[key] - base[key]) / base[key] if base[key] else 0.0
+                row[key] = (base[key], stats[key], round(change, 3))
+                if change > threshold:
+                    regressions.append((workload, step, key, round(change, 3)))
+            # The mean moves with the cache hit ratio; the maximum only moves
+            # when a request starts issuing more statements, e.g. one per row.
+            row['queries_max'] = (base.get('queries_max'), stats.get('queries_max'))
+            if (stats.get('queries_max') or 0) > (base.get('queries_max') or 0):
+                regressions.append((workload, step, 'queries_max', stats['queries_max']))
+            rows.append(row)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Savvium server with app-like workloads.')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--categories', type=int, default=6, help='per user')
+    parser.add_argument('--expenses', type=int, default=1000, help='per user')
+    parser.add_argument('--incomes', type=int, default=24, help='per user')
+    parser.add_argument('--recurring', type=int, default=4, help='per user')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=200, help='per workload')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--workload', action='append', choices=WORKLOADS, help='default: all')
+    parser.add_argument('--db', help='SQLite file to generate into (default: a temporary file)')
+    parser.add_argument('--url', help='benchmark a running server instead, seeded with the same --db')
+    parser.add_argument('--no-cache', action='store_true', help='disable the response cache')
+    parser.add_argument('--out', help='write results here instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='compare two result files')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        rows, regressions = compare(baseline, current, args.threshold)
+        for row in rows:
+            print('{workload:17} {step:18} p50 {p50[0]:8.2f} -> {p50[1]:8.2f} ms ({p50[2]:+.0%})  '
+                  'p99 {p99[0]:8.2f} -> {p99[1]:8.2f} ms ({p99[2]:+.0%})  max queries {q[0]} -> {q[1]}'.format(
+                      p50=row['p50_ms'], p99=row['p99_ms'], q=row['queries_max'], **row))
+        for regression in regressions:
+            print('REGRESSION', *regression)
+        sys.exit(1 if regressions else 0)
+
+    from app import create_app
+    from tokens import issue_token
+    import migrations
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='savvium-bench-'), 'bench.sqlite')
+    config = {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(db_path),
+        'RECURRING_SCHEDULER': False,
+        # Signs the tokens of this run only
+        'SECRET_KEY': secrets.token_hex(32),
+    }
+    if args.no_cache:
+        config['CACHE_BACKEND'] = 'none'
+    app = create_app(config)
+
+    with app.app_context():
+        fresh = not os.path.exists(db_path) or os.path.getsize(db_path) == 0
+        migrations.upgrade()
+        started = time.perf_counter()
+        if fresh:
+            layout = generate(args.users, args.categories, args.expenses, args.incomes,
+                              args.recurring, args.seed)
+        else:
+            from models import BudgetCategory
+            layout = defaultdict(list)
+            for category_id, user_id in BudgetCategory.query.with_entities(BudgetCategory.id, BudgetCategory.user_id):
+                layout[user_id].append(category_id)
+        generate_seconds = time.perf_counter() - started
+        tokens = {user_id: issue_token(user_id) for user_id in layout}
+        # Counted rather than taken from the arguments, as --db may be reused
+        from models import db, BudgetCategory, Expense, Income, RecurringExpense
+        dataset = {
+            'users': len(layout),
+            'categories': BudgetCategory.query.count(),
+            'expenses': db.session.query(Expense.id).count(),
+            'incomes': Income.query.count(),
+            'recurring': RecurringExpense.query.count(),
+        }
+
+    client = HttpClient(args.url) if args.url else InProcessClient(app)
+    results = {
+        'commit': _git_commit(),
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'target': args.url or 'in-process',
+        'parameters': {key: getattr(args, key) for key in ('seed', 'iterations', 'threads', 'no_cache')},
+        'dataset': dataset,
+        'generate_seconds': round(generate_seconds, 2) if fresh else None,
+        'workloads': {},
+    }
+    for workload in args.workload or WORKLOADS:
+        results['workloads'][workload] = run_workload(
+            client, workload, layout, tokens, args.iterations, args.threads, args.seed)
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
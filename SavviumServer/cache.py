@@ -0,0 +1,193 @@
+import json
+import threading
+from collections import OrderedDict
+from flask import current_app, jsonify
+
+
+class MemoryBackend:
+    """In-process LRU cache holding at most `max_entries` responses.
+
+    Entries are grouped by user so one write can drop everything cached for
+    that user. Each gunicorn worker has its own copy; keys include the
+    user's data version, so a worker never serves a response older than the
+    latest write, but use the Redis backend to share hits between workers.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, key):
+        with self._lock:
+            value = self._entries.get((user_id, key))
+            if value is not None:
+                self._entries.move_to_end((user_id, key))
+            return value
+
+    def set(self, user_id, key, value):
+        with self._lock:
+            self._entries[(user_id, key)] = value
+            self._entries.move_to_end((user_id, key))
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                (old_user, old_key), _ = self._entries.popitem(last=False)
+                self._keys_by_user[old_user].discard(old_key)
+                if not self._keys_by_user[old_user]:
+                    del self._keys_by_user[old_user]
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in self._keys_by_user.pop(user_id, ()):
+                self._entries.pop((user_id, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Cache stored in any Redis-protocol server (Redis, Valkey, a local
+    redis-server, ...), shared by every worker process.
+
+    Size is bounded by the server (run it with maxmemory and
+    maxmemory-policy allkeys-lru) and by a per-entry TTL.
+    """
+
+    def __init__(self, url, ttl=3600, prefix='savvium:cache'):
+        import redis  # optional dependency, only needed for this backend
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _user_set(self, user_id):
+        return f'{self.prefix}:u{user_id}:keys'
+
+    def _key(self, user_id, key):
+        return f'{self.prefix}:u{user_id}:{key}'
+
+    def get(self, user_id, key):
+        raw = self.client.get(self._key(user_id, key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, user_id, key, value):
+        full_key = self._key(user_id, key)
+        pipe = self.client.pipeline()
+        pipe.set(full_key, json.dumps(value), ex=self.ttl)
+        pipe.sadd(self._user_set(user_id), full_key)
+        pipe.expire(self._user_set(user_id), self.ttl)
+        pipe.execute()
+
+    def invalidate(self, user_id):
+        user_set = self._user_set(user_id)
+        keys = self.client.smembers(user_set)
+        self.client.delete(user_set, *keys)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(f'{self.prefix}:*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self):
+        return sum(1 for key in self.client.scan_iter(f'{self.prefix}:u*') if not key.endswith(b':keys'))
+
+
+class NullBackend:
+    def get(self, user_id, key):
+        return None
+
+    def set(self, user_id, key, value):
+        pass
+
+    def invalidate(self, user_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def size(self):
+        return 0
+
+
+# Response headers worth replaying from a cached entry
+CACHED_HEADERS = ('Content-Type', 'X-Next-Cursor')
+
+
+class ResponseCache:
+    """Per-user cache of GET responses (see changes.conditional_get), dropped
+    whenever a write to that user's data commits.
+
+    Configured with CACHE_BACKEND ('memory', 'redis' or 'none'),
+    CACHE_MAX_ENTRIES, CACHE_REDIS_URL and CACHE_TTL.
+    """
+
+    def __init__(self):
+        self.backend = NullBackend()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_BACKEND', 'memory')
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('CACHE_TTL', 3600)
+
+        kind = app.config['CACHE_BACKEND']
+        if kind == 'memory':
+            self.backend = MemoryBackend(app.config['CACHE_MAX_ENTRIES'])
+        elif kind == 'redis':
+            self.backend = RedisBackend(app.config['CACHE_REDIS_URL'], app.config['CACHE_TTL'])
+        elif kind == 'none':
+            self.backend = NullBackend()
+        else:
+            raise ValueError(f'Unknown CACHE_BACKEND {kind!r}')
+
+        @app.route('/cache/stats', methods=['GET'])
+        def cache_stats():
+            return jsonify(self.stats())
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def lookup(self, user_id, key):
+        """Return the cached response for `key`, or None on a miss."""
+        entry = self.backend.get(user_id, key)
+        if entry is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return current_app.response_class(entry['body'], status=entry['status'], headers=entry['headers'])
+
+    def store(self, user_id, key, response):
+        self.backend.set(user_id, key, {
+            'body': response.get_data(as_text=True),
+            'status': response.status_code,
+            'headers': {h: response.headers[h] for h in CACHED_HEADERS if h in response.headers},
+        })
+
+    def invalidate_user(self, user_id):
+        self._count('invalidations')
+        self.backend.invalidate(user_id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': self.backend.size(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'invalidations': self.invalidations,
+        }
+
+
+cache = ResponseCache()
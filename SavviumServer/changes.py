@@ -0,0 +1,128 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+from flask import current_app, request
+from sqlalchemy import event, update
+from models import db, User, BudgetCategory, SyncMixin, Tombstone
+from cache import cache
+from auth import authorize
+
+
+def _bump(session, user_id):
+    # One bump per user per transaction; every row written in it shares the version
+    versions = session.info.setdefault('change_versions', {})
+    if user_id not in versions:
+        users = User.__table__
+        versions[user_id] = session.connection().execute(
+            update(users)
+            .where(users.c.id == user_id)
+            .values(data_version=users.c.data_version + 1)
+            .returning(users.c.data_version)
+        ).scalar()
+    return versions[user_id]
+
+
+def record_change(user_id):
+    """Bump the user's data version inside the current transaction.
+
+    ORM writes are tracked automatically by the before_flush hook below;
+    call this directly only for writes that bypass the unit of work (bulk
+    INSERT/UPDATE statements) and stamp the returned version on the rows.
+    The new version becomes visible, and the user's cached responses are
+    dropped, only if the transaction commits.
+    """
+    return _bump(db.session, user_id)
+
+
+def _before_flush(session, flush_context, instances):
+    # Stamp every created or modified row with its owner's new version and
+    # leave a tombstone for every deleted one, including rows removed by a
+    # cascade (deleting a category deletes its expenses and bills).
+    for obj in session.new:
+        if isinstance(obj, SyncMixin):
+            obj.version = _bump(session, obj.user_id)
+    for obj in session.dirty:
+        if isinstance(obj, SyncMixin) and session.is_modified(obj):
+            obj.version = _bump(session, obj.user_id)
+    for obj in session.deleted:
+        if isinstance(obj, SyncMixin):
+            session.add(Tombstone(
+                user_id=obj.user_id,
+                table_name=obj.__tablename__,
+                row_id=obj.id,
+                version=_bump(session, obj.user_id),
+            ))
+
+
+def _after_commit(session):
+    for user_id in session.info.pop('change_versions', {}):
+        cache.invalidate_user(user_id)
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop('change_versions', None)
+
+
+def user_version(user_id):
+    return db.session.query(User.id, User.data_version).filter(User.id == user_id).first()
+
+
+def category_version(category_id):
+    return (
+        db.session.query(User.id, User.data_version)
+        .join(BudgetCategory, BudgetCategory.user_id == User.id)
+        .filter(BudgetCategory.id == category_id)
+        .first()
+    )
+
+
+def conditional_get(owner=None):
+    """Serve a GET view with an ETag derived from its owner's data version.
+
+    `owner(**view_args)` returns the (user_id, data_version) row the
+    response belongs to; by default it is looked up from the view's
+    `user_id` argument or query parameter. That single lookup is the only
+    query run when the client's If-None-Match matches (304) or when the
+    response is already cached. A caller with an access token may only read
+    their own data.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if owner is not None:
+                row = owner(**kwargs)
+            else:
+                user_id = kwargs.get('user_id', request.args.get('user_id', type=int))
+                row = user_version(user_id) if user_id is not None else None
+            if row is None:
+                return view(**kwargs)
+
+            user_id, version = row
+            authorize(user_id)
+            # Some responses depend on today's date (current month, next due
+            # dates), so the date is part of the key as well as the version.
+            key = f'{datetime.utcnow().date().isoformat()}:{request.full_path}'
+            etag = hashlib.sha1(f'{user_id}:{version}:{key}'.encode()).hexdigest()
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = cache.lookup(user_id, f'v{version}:{key}')
+                if response is None:
+                    response = current_app.make_response(view(**kwargs))
+                    if response.status_code == 200:
+                        cache.store(user_id, f'v{version}:{key}', response)
+
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    if not event.contains(db.session, 'after_commit', _after_commit):
+        event.listen(db.session, 'before_flush', _before_flush)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_soft_rollback', _after_rollback)
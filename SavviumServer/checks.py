@@ -0,0 +1,242 @@
+import os
+import subprocess
+import sys
+import click
+from datetime import datetime
+from sqlalchemy import event
+from models import db, User, BudgetCategory, Expense, Income, RecurringExpense
+from cache import cache
+
+# Every list endpoint the client calls, with sample arguments. New list
+# endpoints should be added here so the index check covers them.
+LIST_ENDPOINTS = [
+    '/users/1/categories',
+    '/users/1/expenses',
+    '/users/1/expenses?limit=20&from=2025-01-01&to=2025-12-31&cursor=MjAyNS0wNi0wMXwxMDA',
+    '/categories/1/expenses',
+    '/categories/1/expenses?limit=20&cursor=MjAyNS0wNi0wMXwxMDA',
+    '/expenses/monthly?user_id=1',
+    '/users/1/summary',
+    '/users/1/summary?from=2025-01-01&to=2025-01-31',
+    '/users/1/spending?group=day&from=2025-01-01&to=2025-01-31',
+    '/users/1/spending?group=month&by_category=1',
+    '/users/1/incomes',
+    '/users/1/incomes?limit=20&cursor=MjAyNS0wNi0wMXwxMDA',
+    '/recurring-expenses?user_id=1',
+    '/users/1/dashboard',
+    '/users/1/sync?since=5',
+    '/users/1/search?q=bla',
+    '/users/1/search?q=bla&category_id=3&from=2025-01-01&to=2025-12-31',
+    '/users/1/search?q=sal&type=incomes',
+    '/users/1/forecast',
+    '/users/1/export',
+    '/users/1/export?format=csv&type=expenses',
+]
+
+
+# Endpoints whose query count must not depend on how many rows they return.
+# Placeholders are filled in with the ids of the seeded user and category.
+COUNTED_ENDPOINTS = [
+    '/users/{user_id}/categories',
+    '/users/{user_id}/expenses',
+    '/users/{user_id}/expenses?limit=500',
+    '/categories/{category_id}/expenses',
+    '/expenses/monthly?user_id={user_id}',
+    '/users/{user_id}/incomes',
+    '/recurring-expenses?user_id={user_id}',
+    '/users/{user_id}/summary',
+    '/users/{user_id}/spending?group=day&by_category=1',
+    '/users/{user_id}/dashboard',
+    '/users/{user_id}/sync?since=0',
+    '/users/{user_id}/search?q=expense',
+    '/users/{user_id}/search?q=inc&type=incomes',
+    '/users/{user_id}/forecast',
+    '/users/{user_id}/export',
+]
+
+
+def _capture_selects(app, url):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    # A cached response would issue no queries at all
+    cache.backend.clear()
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = app.test_client().get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return response.status_code, statements
+
+
+def _full_scans(plan_rows):
+    # SQLite reports table scans as "SCAN <table>"; anything that uses an
+    # index is reported as "SEARCH ..." or "SCAN ... USING [COVERING] INDEX".
+    scans = []
+    for row in plan_rows:
+        detail = row[-1]
+        if detail.startswith('SCAN ') and 'INDEX' not in detail and detail != 'SCAN CONSTANT ROW':
+            scans.append(detail)
+    return scans
+
+
+def check_query_plans(app, endpoints=LIST_ENDPOINTS):
+    """Run each endpoint and EXPLAIN every SELECT it issues.
+
+    Returns a list of (url, statement, full_scan_details) for the queries
+    that scan a table without an index. An empty list means every list
+    endpoint is index backed.
+    """
+    failures = []
+    with app.app_context():
+        for url in endpoints:
+            status, statements = _capture_selects(app, url)
+            if status >= 500:
+                failures.append((url, None, [f'endpoint returned {status}']))
+                continue
+            with db.engine.connect() as conn:
+                for statement, parameters in statements:
+                    plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+                    scans = _full_scans(plan)
+                    if scans:
+                        failures.append((url, statement, scans))
+    return failures
+
+
+def _seed(rows):
+    # Flushed but never committed: check_query_counts rolls it back
+    today = datetime.utcnow().date()
+    user = User(name='Query', email=f'query-count-{rows}@savvium.invalid', password='!')
+    db.session.add(user)
+    db.session.flush()
+    categories = [BudgetCategory(user_id=user.id, name=f'Category {i}', budget=100) for i in range(rows)]
+    db.session.add_all(categories)
+    db.session.flush()
+    for i, category in enumerate(categories):
+        db.session.add(Expense(category_id=category.id, user_id=user.id, name=f'Expense {i}', amount=1, date=today))
+        db.session.add(Expense(category_id=categories[0].id, user_id=user.id, name=f'Expense {i}', amount=1, date=today))
+        db.session.add(Income(user_id=user.id, name=f'Income {i}', amount=1, date=today))
+        db.session.add(RecurringExpense(user_id=user.id, category_id=category.id, name=f'Bill {i}', amount=1, due_day=i % 31 + 1))
+    db.session.flush()
+    return {'user_id': user.id, 'category_id': categories[0].id}
+
+
+def _count_queries(client, url):
+    count = [0]
+
+    def before_cursor_execute(*args):
+        count[0] += 1
+
+    cache.backend.clear()
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return response.status_code, count[0]
+
+
+def query_counts(app, small=1, large=50, endpoints=COUNTED_ENDPOINTS):
+    """Return {url: (queries for `small` rows, queries for `large` rows)}.
+
+    Seed data is written inside one outer app context, so the test client's
+    requests reuse its session and see the uncommitted rows; everything is
+    rolled back at the end. A count is 'HTTP <status>' when the endpoint
+    failed.
+    """
+    with app.app_context():
+        client = app.test_client()
+        try:
+            counts = {url: [] for url in endpoints}
+            for rows in (small, large):
+                ids = _seed(rows)
+                for url in endpoints:
+                    status, queries = _count_queries(client, url.format(**ids))
+                    counts[url].append(queries if status < 400 else f'HTTP {status}')
+        finally:
+            # Seeded ids will be reused once rolled back, so drop their cache entries too
+            db.session.rollback()
+            cache.backend.clear()
+    return {url: tuple(pair) for url, pair in counts.items()}
+
+
+def check_query_counts(app, small=1, large=50, endpoints=COUNTED_ENDPOINTS):
+    """Assert each endpoint issues the same number of queries for 1 row as for many.
+
+    Returns (url, counts) for every endpoint whose query count grew with
+    the number of rows (an N+1 regression) or that failed.
+    """
+    failures = []
+    for url, (few, many) in query_counts(app, small, large, endpoints).items():
+        if few != many or isinstance(few, str):
+            failures.append((url, (few, many)))
+    return failures
+
+
+STARTUP_SCRIPT = (
+    'import time; started = time.perf_counter(); '
+    'from app import create_app; create_app(); '
+    'print(time.perf_counter() - started)'
+)
+
+
+def measure_startup(top=10):
+    """Time `from app import create_app; create_app()` in a fresh interpreter.
+
+    Returns (seconds, slowest) where slowest lists the (package, cumulative
+    import microseconds) pairs from -X importtime that took longest.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    slowest = {}
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        # Largest cumulative time per top-level package, e.g. all of sqlalchemy
+        package = module.strip().split('.')[0]
+        if package != 'app':
+            slowest[package] = max(slowest.get(package, 0), int(cumulative))
+    imports = sorted(slowest.items(), key=lambda i: i[1], reverse=True)
+    return float(result.stdout.strip().splitlines()[-1]), imports[:top]
+
+
+def init_app(app):
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """Fail if any list endpoint runs a query without an index."""
+        failures = check_query_plans(app)
+        for url, statement, scans in failures:
+            click.echo(f'{url}: {", ".join(scans)}')
+            if statement:
+                click.echo(f'    {" ".join(statement.split())}')
+        if failures:
+            raise SystemExit(1)
+        click.echo(f'All {len(LIST_ENDPOINTS)} list endpoints use an index.')
+
+    @app.cli.command('check-query-counts')
+    def check_query_counts_command():
+        """Fail if any list endpoint's query count grows with its row count (N+1)."""
+        failures = check_query_counts(app)
+        for url, (few, many) in failures:
+            click.echo(f'{url}: {few} queries for 1 row, {many} for many')
+        if failures:
+            raise SystemExit(1)
+        click.echo(f'All {len(COUNTED_ENDPOINTS)} endpoints use a fixed number of queries.')
+
+    @app.cli.command('startup-time')
+    def startup_time_command():
+        """Report how long a new worker takes to import and create the app."""
+        seconds, slowest = measure_startup()
+        click.echo(f'Import and create_app(): {1000 * seconds:.0f} ms')
+        for module, microseconds in slowest:
+            click.echo(f'  {microseconds / 1000:8.1f} ms  {module}')
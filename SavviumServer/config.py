@@ -0,0 +1,53 @@
+"""Default configuration.
+
+Every setting can be overridden from the environment with a SAVVIUM_
+prefix, e.g. SAVVIUM_CACHE_BACKEND=redis or SAVVIUM_AUTH_REQUIRED=true
+(values are parsed as JSON where possible). DATABASE_URL and
+DATABASE_READ_URL are also honoured, as most hosting platforms set them.
+"""
+import os
+
+# The placeholder shipped in this file. tokens.py refuses to sign or check
+# access tokens with it, since anyone could mint a token for any user.
+INSECURE_SECRET_KEY = 'your-secret-key'
+
+
+class Config:
+    # Set SECRET_KEY (or SAVVIUM_SECRET_KEY) to a long random value
+    SECRET_KEY = os.environ.get('SECRET_KEY', INSECURE_SECRET_KEY)
+
+    # Writes (and reads inside a write request) use SQLALCHEMY_DATABASE_URI;
+    # GET requests read through SQLALCHEMY_READ_URI, which defaults to the
+    # same database (see database.py).
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///db.sqlite')
+    SQLALCHEMY_READ_URI = os.environ.get('DATABASE_READ_URL')
+
+    # Connection pool, per engine and per process
+    DB_POOL_SIZE = 5
+    DB_MAX_OVERFLOW = 10
+    DB_POOL_RECYCLE = 1800
+    DB_POOL_PRE_PING = True
+
+    # SQLite connection settings, applied with PRAGMAs on every new connection
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_BUSY_TIMEOUT_MS = 5000
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB = 64 * 1024
+    # Write transactions take the write lock when they start, so two
+    # writers queue on the busy timeout instead of one failing with
+    # "database is locked" when it tries to upgrade a read lock.
+    SQLITE_BEGIN_IMMEDIATE = True
+
+    # ASGI mode (asgi.py): threads serving the Flask routes, and the shared
+    # outbound HTTP client used by the async routes
+    ASGI_WSGI_THREADS = 32
+    HTTP_TIMEOUT = 30
+    HTTP_MAX_CONNECTIONS = 1000
+
+    PLAID_CLIENT_ID = os.environ.get('PLAID_CLIENT_ID')
+    PLAID_SECRET = os.environ.get('PLAID_SECRET')
+    PLAID_ENV = os.environ.get('PLAID_ENV', 'sandbox')
+    # Overrides the host derived from PLAID_ENV, e.g. to point at a fake server
+    PLAID_BASE_URL = None
+    PLAID_CLIENT_NAME = 'Savvium'
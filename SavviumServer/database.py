@@ -0,0 +1,126 @@
+"""Engine setup: pool options, SQLite PRAGMAs and read/write routing.
+
+Two engines are configured: the default one for writes and a 'read' bind
+for GET requests. The session picks the read engine only while it has
+nothing to write, so a request that has flushed (or is flushing) keeps
+reading its own uncommitted rows from the write engine.
+"""
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+READ_BIND = 'read'
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica():
+            return self._db.engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self):
+        return (
+            has_request_context()
+            and request.method in ('GET', 'HEAD')
+            and READ_BIND in self._db.engines
+            and not self.info.get('has_written')
+            and not self._flushing
+            and self._is_clean()
+        )
+
+
+def _mark_written(session, flush_context, instances):
+    session.info['has_written'] = True
+
+
+def _clear_written(session, *args):
+    session.info.pop('has_written', None)
+
+
+def _is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def _is_memory(uri):
+    return make_url(uri).database in (None, '', ':memory:')
+
+
+def _engine_options(app, uri):
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    if _is_sqlite(uri) and _is_memory(uri):
+        return options
+    options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+    options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+    options.setdefault('pool_pre_ping', app.config['DB_POOL_PRE_PING'])
+    if _is_sqlite(uri):
+        connect_args = dict(options.get('connect_args', {}))
+        # pysqlite's own busy handler, in seconds
+        connect_args.setdefault('timeout', app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000)
+        options['connect_args'] = connect_args
+    return options
+
+
+def sqlite_pragmas(app, read_only):
+    pragmas = [
+        f"busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"synchronous = {app.config['SQLITE_SYNCHRONOUS']}",
+        f"mmap_size = {int(app.config['SQLITE_MMAP_SIZE'])}",
+        # A negative cache_size is in KiB rather than pages
+        f"cache_size = -{int(app.config['SQLITE_CACHE_SIZE_KB'])}",
+        'temp_store = MEMORY',
+    ]
+    if read_only:
+        pragmas.append('query_only = ON')
+    else:
+        # journal_mode is stored in the database file; setting it from the
+        # writer is enough, and WAL lets readers run alongside a writer.
+        pragmas.insert(0, f"journal_mode = {app.config['SQLITE_JOURNAL_MODE']}")
+    return pragmas
+
+
+def configure_sqlite(engine, pragmas, begin_immediate):
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f'PRAGMA {pragma}')
+        cursor.close()
+        if begin_immediate:
+            # Let SQLAlchemy emit BEGIN itself (see the begin hook below)
+            dbapi_connection.isolation_level = None
+
+    if begin_immediate:
+        @event.listens_for(engine, 'begin')
+        def on_begin(conn):
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def init_app(app, db):
+    """Configure `db`'s engines from app.config and bind it to the app."""
+    write_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    read_uri = app.config.get('SQLALCHEMY_READ_URI') or write_uri
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _engine_options(app, write_uri)
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    if not (_is_sqlite(read_uri) and _is_memory(read_uri)):
+        binds[READ_BIND] = dict(_engine_options(app, read_uri), url=read_uri)
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+    db.init_app(app)
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite' and not _is_memory(str(engine.url)):
+                read_only = key == READ_BIND
+                configure_sqlite(
+                    engine,
+                    sqlite_pragmas(app, read_only),
+                    begin_immediate=not read_only and app.config['SQLITE_BEGIN_IMMEDIATE'],
+                )
+
+    if not event.contains(db.session, 'before_flush', _mark_written):
+        event.listen(db.session, 'before_flush', _mark_written)
+        event.listen(db.session, 'after_commit', _clear_written)
+        event.listen(db.session, 'after_soft_rollback', _clear_written)
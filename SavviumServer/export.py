@@ -0,0 +1,115 @@
+"""Full exports of a user's data, streamed as NDJSON or CSV.
+
+Rows are read with yield_per, so only one batch of rows is held at a
+time, and are written out in chunks of about CHUNK_BYTES. An export of
+100 rows and one of 10 million use the same memory. Rows have the same
+shape as in the list endpoints (see serializers.py), and archived
+expenses and incomes are included. NDJSON adds a "type"
+field to each row, so one stream can hold every kind. CSV holds one kind
+per file.
+
+    flask --app app export --user 1 --format csv --type expenses > expenses.csv
+"""
+import csv
+import io
+import json
+from collections import namedtuple
+import click
+from sqlalchemy import literal_column
+from models import db, BudgetCategory, Expense, Income, RecurringExpense
+import archive
+import serializers
+
+# Rows fetched from the database at a time
+BATCH_SIZE = 1000
+# Rows are buffered into chunks of about this size before being sent
+CHUNK_BYTES = 64 * 1024
+
+# `label` is the NDJSON type. `order_by` follows an index that starts with
+# user_id, so rows stream from the first one without a sort. Kinds are
+# exported in this order, so every row comes after the category it refers to.
+# Kinds that can be archived have a `query` that takes the source to read
+# (see archive.py), and are ordered by the labels of the merged selects.
+Kind = namedtuple('Kind', 'label model query to_dict columns order_by')
+
+BY_DATE = (literal_column('date'), literal_column('id'))
+
+KINDS = {
+    'categories': Kind('category', BudgetCategory, serializers.category_query, serializers.category_to_dict,
+                       serializers.CATEGORY_COLUMNS, (BudgetCategory.id,)),
+    'recurring_expenses': Kind('recurring_expense', RecurringExpense, serializers.recurring_query,
+                               serializers.recurring_to_dict, serializers.RECURRING_COLUMNS,
+                               (RecurringExpense.due_day, RecurringExpense.id)),
+    'expenses': Kind('expense', Expense, serializers.expense_select, serializers.expense_to_dict,
+                     serializers.EXPENSE_COLUMNS, BY_DATE),
+    'incomes': Kind('income', Income, serializers.income_select, serializers.income_to_dict,
+                    serializers.INCOME_COLUMNS, BY_DATE),
+}
+
+# json.dumps() with custom separators builds a new encoder per call
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def rows(user_id, kind):
+    """Yield a user's rows of one kind as dicts."""
+    spec = KINDS[kind]
+    if kind in archive.KINDS:
+        statement = archive.union(kind, lambda source: spec.query(source).where(source.user_id == user_id))
+        result = db.session.execute(statement.order_by(*spec.order_by), execution_options={'yield_per': BATCH_SIZE})
+    else:
+        query = spec.query().filter(spec.model.user_id == user_id).order_by(*spec.order_by)
+        result = query.yield_per(BATCH_SIZE)
+    for row in result:
+        yield spec.to_dict(row)
+
+
+def ndjson(user_id, kinds=tuple(KINDS)):
+    """Yield the user's rows of each kind as newline-delimited JSON, in chunks."""
+    chunk, size = [], 0
+    for kind in kinds:
+        label = KINDS[kind].label
+        for row in rows(user_id, kind):
+            line = _encode({'type': label, **row}) + '\n'
+            chunk.append(line)
+            size += len(line)
+            if size >= CHUNK_BYTES:
+                yield ''.join(chunk)
+                chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def csv_rows(user_id, kind):
+    """Yield the user's rows of one kind as CSV with a header line, in chunks."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=[column.key for column in KINDS[kind].columns])
+    writer.writeheader()
+    for row in rows(user_id, kind):
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def init_app(app):
+    @app.cli.command('export')
+    @click.option('--user', 'user_id', type=int, required=True)
+    @click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='ndjson')
+    @click.option('--type', 'kind', type=click.Choice(list(KINDS)),
+                  help='Only this kind of row (required for CSV).')
+    def export_command(user_id, fmt, kind):
+        """Write a user's data to stdout as NDJSON or CSV."""
+        if fmt == 'csv' and kind is None:
+            raise click.UsageError('--type is required for CSV exports')
+        chunks = csv_rows(user_id, kind) if fmt == 'csv' else ndjson(user_id, [kind] if kind else KINDS)
+        stdout = click.get_text_stream('stdout')
+        for chunk in chunks:
+            stdout.write(chunk)
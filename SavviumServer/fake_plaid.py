@@ -0,0 +1,215 @@
+"""A local stand-in for the Plaid API, to run and benchmark the bank sync offline.
+
+Serves /link/token/create, /item/public_token/exchange, /transactions/get
+and /transactions/sync. Any access token is accepted and gets its own
+repeatable transaction history, so items can be inserted straight into
+plaid_items without going through Link. POST /fake/advance adds, modifies
+and removes transactions on every item seen so far, for incremental
+syncs. Latency, errors and rate limiting can be injected.
+
+    python fake_plaid.py --port 8765 --transactions 1000 --failure-rate 0.05
+    SAVVIUM_PLAID_BASE_URL=http://localhost:8765 flask --app app plaid-sync
+"""
+import argparse
+import hashlib
+import random
+import threading
+import time
+from datetime import date, timedelta
+from flask import Flask, jsonify, request
+
+MERCHANTS = [
+    ('Whole Foods', ['Shops', 'Groceries']),
+    ('Shell', ['Travel', 'Gas Stations']),
+    ('Uber', ['Travel', 'Taxi']),
+    ('Starbucks', ['Food and Drink', 'Coffee Shop']),
+    ('Netflix', ['Service', 'Subscription']),
+    ('Amazon', ['Shops', 'Digital Purchase']),
+    ('Con Edison', ['Service', 'Utilities']),
+    ('Chipotle', ['Food and Drink', 'Restaurants']),
+]
+
+
+class FakeItem:
+    """One item's transactions, and the log of changes /transactions/sync pages through."""
+
+    def __init__(self, access_token, count, seed):
+        self.id = 'item-' + hashlib.sha1(f'{seed}:{access_token}'.encode()).hexdigest()[:12]
+        self.rng = random.Random(f'{seed}:{access_token}')
+        self.transactions = {}
+        self.changes = []
+        self.serial = 0
+        for _ in range(count):
+            self.add()
+
+    def _transaction(self, transaction_id, days_ago):
+        name, category = self.rng.choice(MERCHANTS)
+        # About one in ten is money in, which Plaid reports as negative
+        amount = round(self.rng.uniform(1, 250), 2) * (-1 if self.rng.random() < 0.1 else 1)
+        return {
+            'transaction_id': transaction_id,
+            'account_id': f'{self.id}-checking',
+            'date': (date.today() - timedelta(days=days_ago)).isoformat(),
+            'name': name,
+            'amount': amount,
+            'category': category,
+            'pending': False,
+        }
+
+    def add(self):
+        self.serial += 1
+        transaction = self._transaction(f'{self.id}-{self.serial}', self.rng.randrange(0, 365))
+        self.transactions[transaction['transaction_id']] = transaction
+        self.changes.append(('added', transaction))
+
+    def modify(self):
+        if self.transactions:
+            old = self.rng.choice(list(self.transactions.values()))
+            transaction = dict(old, amount=round(old['amount'] * self.rng.uniform(0.5, 1.5), 2))
+            self.transactions[transaction['transaction_id']] = transaction
+            self.changes.append(('modified', transaction))
+
+    def remove(self):
+        if self.transactions:
+            transaction_id = self.rng.choice(list(self.transactions))
+            del self.transactions[transaction_id]
+            self.changes.append(('removed', {'transaction_id': transaction_id}))
+
+
+def create_fake_plaid(transactions=500, seed=0, latency=0.0, failure_rate=0.0, mutation_rate=0.0):
+    app = Flask(__name__)
+    items = {}
+    lock = threading.Lock()
+    # Fault injection uses its own generator so histories stay repeatable
+    faults = random.Random(seed)
+    # Exposed for benchmarks that check the synced rows against the source
+    app.config['FAKE_PLAID_ITEMS'] = items
+    stats = {'requests': 0, 'failures': 0}
+
+    def error(status, error_type, code, message):
+        return jsonify({'error_type': error_type, 'error_code': code, 'error_message': message}), status
+
+    def item_for(access_token):
+        if access_token not in items:
+            items[access_token] = FakeItem(access_token, transactions, seed)
+        return items[access_token]
+
+    @app.before_request
+    def simulate_network():
+        if request.path.startswith('/fake/'):
+            return None
+        if latency:
+            time.sleep(latency)
+        body = request.get_json(silent=True) or {}
+        with lock:
+            stats['requests'] += 1
+            if not body.get('client_id') or not body.get('secret'):
+                return error(400, 'INVALID_INPUT', 'INVALID_API_KEYS', 'invalid client_id or secret provided')
+            roll = faults.random()
+            if roll < failure_rate:
+                stats['failures'] += 1
+                if roll < failure_rate / 2:
+                    return error(429, 'RATE_LIMIT_EXCEEDED', 'RATE_LIMIT', 'rate limit exceeded')
+                return error(500, 'API_ERROR', 'INTERNAL_SERVER_ERROR', 'an unexpected error occurred')
+        return None
+
+    @app.route('/link/token/create', methods=['POST'])
+    def link_token_create():
+        user = request.get_json()['user']['client_user_id']
+        return jsonify({
+            'link_token': f'link-fake-{user}-{time.time_ns()}',
+            'expiration': (date.today() + timedelta(days=1)).isoformat() + 'T00:00:00Z',
+        })
+
+    @app.route('/item/public_token/exchange', methods=['POST'])
+    def item_public_token_exchange():
+        access_token = 'access-fake-' + request.get_json()['public_token']
+        with lock:
+            item = item_for(access_token)
+        return jsonify({'access_token': access_token, 'item_id': item.id})
+
+    @app.route('/transactions/get', methods=['POST'])
+    def transactions_get():
+        body = request.get_json()
+        options = body.get('options') or {}
+        offset, count = options.get('offset', 0), options.get('count', 100)
+        with lock:
+            item = item_for(body['access_token'])
+            matching = sorted(
+                (t for t in item.transactions.values() if body['start_date'] <= t['date'] <= body['end_date']),
+                key=lambda t: t['date'], reverse=True,
+            )
+        return jsonify({
+            'transactions': matching[offset:offset + count],
+            'total_transactions': len(matching),
+            'item': {'item_id': item.id},
+        })
+
+    @app.route('/transactions/sync', methods=['POST'])
+    def transactions_sync():
+        body = request.get_json()
+        cursor = body.get('cursor') or '0'
+        if not cursor.isdigit():
+            return error(400, 'INVALID_INPUT', 'INVALID_FIELD', 'cursor is not valid')
+        start, count = int(cursor), min(body.get('count', 100), 500)
+        with lock:
+            item = item_for(body['access_token'])
+            if start > 0 and faults.random() < mutation_rate:
+                return error(400, 'TRANSACTIONS_ERROR', 'TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION',
+                             'underlying transaction data changed since last page was fetched')
+            page = item.changes[start:start + count]
+            end = start + len(page)
+            has_more = end < len(item.changes)
+        return jsonify({
+            'added': [t for kind, t in page if kind == 'added'],
+            'modified': [t for kind, t in page if kind == 'modified'],
+            'removed': [t for kind, t in page if kind == 'removed'],
+            'next_cursor': str(end),
+            'has_more': has_more,
+        })
+
+    @app.route('/fake/advance', methods=['POST'])
+    def advance():
+        body = request.get_json(silent=True) or {}
+        with lock:
+            for item in items.values():
+                for _ in range(body.get('added', 5)):
+                    item.add()
+                for _ in range(body.get('modified', 2)):
+                    item.modify()
+                for _ in range(body.get('removed', 1)):
+                    item.remove()
+        return jsonify({'items': len(items)})
+
+    @app.route('/fake/stats', methods=['GET'])
+    def fake_stats():
+        with lock:
+            return jsonify(dict(stats, items=len(items)))
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a fake Plaid API for offline syncs.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--transactions', type=int, default=500, help='initial transactions per item')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0, help='added to every API call')
+    parser.add_argument('--failure-rate', type=float, default=0, help='share of calls answered 429 or 500')
+    parser.add_argument('--mutation-rate', type=float, default=0,
+                        help='share of follow-up sync pages answered with a mutation-during-pagination error')
+    args = parser.parse_args(argv)
+
+    app = create_fake_plaid(
+        transactions=args.transactions,
+        seed=args.seed,
+        latency=args.latency_ms / 1000,
+        failure_rate=args.failure_rate,
+        mutation_rate=args.mutation_rate,
+    )
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
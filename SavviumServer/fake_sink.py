@@ -0,0 +1,72 @@
+"""A local stand-in for the service that delivers budget alerts, to run the
+alert worker offline.
+
+POST /alerts accepts an alert as the worker sends it and records it by
+id, so repeated deliveries of one alert are counted but kept once.
+GET /fake/alerts lists what was received and GET /fake/stats counts it.
+Latency and errors can be injected.
+
+    python fake_sink.py --port 8766 --failure-rate 0.2
+    SAVVIUM_ALERT_SINK_URL=http://localhost:8766/alerts flask --app app alerts-drain
+"""
+import argparse
+import random
+import threading
+import time
+from flask import Flask, jsonify, request
+
+
+def create_fake_sink(seed=0, latency=0.0, failure_rate=0.0):
+    app = Flask(__name__)
+    alerts = {}
+    lock = threading.Lock()
+    faults = random.Random(seed)
+    # Exposed for benchmarks that check what was delivered
+    app.config['FAKE_SINK_ALERTS'] = alerts
+    stats = {'requests': 0, 'failures': 0, 'duplicates': 0}
+
+    @app.route('/alerts', methods=['POST'])
+    def receive():
+        if latency:
+            time.sleep(latency)
+        alert = request.get_json(silent=True)
+        with lock:
+            stats['requests'] += 1
+            if not isinstance(alert, dict) or 'id' not in alert:
+                return jsonify({'message': 'An alert with an id is required'}), 400
+            if faults.random() < failure_rate:
+                stats['failures'] += 1
+                return jsonify({'message': 'Temporarily unavailable'}), 503
+            if alert['id'] in alerts:
+                stats['duplicates'] += 1
+            alerts[alert['id']] = alert
+        return jsonify({'id': alert['id']}), 202
+
+    @app.route('/fake/alerts', methods=['GET'])
+    def fake_alerts():
+        with lock:
+            return jsonify(sorted(alerts.values(), key=lambda a: a['id']))
+
+    @app.route('/fake/stats', methods=['GET'])
+    def fake_stats():
+        with lock:
+            return jsonify(dict(stats, alerts=len(alerts)))
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a fake alert receiver for offline deliveries.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0, help='added to every delivery')
+    parser.add_argument('--failure-rate', type=float, default=0, help='share of deliveries answered 503')
+    args = parser.parse_args(argv)
+
+    app = create_fake_sink(seed=args.seed, latency=args.latency_ms / 1000, failure_rate=args.failure_rate)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+"""Month-end spending forecasts and budget overrun warnings.
+
+For every budget category the month-end projection is
+
+    spent so far this month
+  + recurring bills still to be charged this month
+  + the expected rest of the discretionary spending (expenses not
+    created from a recurring bill)
+
+The discretionary rest blends two estimates. One carries the current
+month's pace to the end of the month. The other is what the rest of the
+month cost in each of the previous FORECAST_HISTORY_MONTHS months, cut at
+the same fraction of the month. The pace counts for more as the month
+goes on. The spread of the past months gives a low-high range.
+
+A category's status is:
+- 'over' once spending has passed its budget;
+- 'likely_over' when the projection passes it;
+- 'at_risk' when only the high end does;
+- 'on_track' otherwise.
+
+Income is projected as the larger of this month's income so far and the
+monthly average.
+
+A batch of users is loaded with a few grouped queries into NumPy arrays,
+and every category of every user in the batch is computed at once.
+
+The nightly batch (`flask --app app forecast-batch`) splits the users
+over a process pool and stores the results in the forecasts table.
+GET /users/<id>/forecast serves a stored forecast while it is current
+and computes one otherwise.
+"""
+import calendar
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from itertools import chain, repeat
+import click
+from flask import current_app
+from sqlalchemy import Integer, String, cast, exists, func, select, type_coerce
+from sqlalchemy.dialects.sqlite import insert
+from models import db, BudgetCategory, Expense, Forecast, Income, RecurringExpense, User
+from money import cents, to_amount
+
+def month_number(day):
+    return day.year * 12 + day.month - 1
+
+
+# NumPy counts datetime64[M] months from January 1970
+EPOCH_MONTH = month_number(date(1970, 1, 1))
+
+
+def _month_number_sql(column):
+    return cast(func.strftime('%Y', column), Integer) * 12 + cast(func.strftime('%m', column), Integer) - 1
+
+
+def _days_in(number):
+    year, month = divmod(number, 12)
+    return calendar.monthrange(year, month + 1)[1]
+
+
+def _columns(np, rows, width):
+    """Result rows as one int64 array per column (empty arrays when there are no rows)."""
+    # fromiter over the flattened values; np.array() probes each Row as a sequence first
+    values = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * width)
+    return values.reshape(-1, width).T
+
+
+def _load(np, user_ids, today, history_months):
+    """Everything a batch of forecasts needs, mostly as arrays, in five queries."""
+    current = month_number(today)
+    first = current - history_months
+    start = date(first // 12, first % 12 + 1, 1)
+    end = today.replace(day=_days_in(current))
+    year_month = today.strftime('%Y-%m')
+
+    versions = dict(db.session.execute(select(User.id, User.data_version).where(User.id.in_(user_ids))).all())
+    categories = db.session.execute(
+        select(BudgetCategory.id, BudgetCategory.user_id, BudgetCategory.name, cents(BudgetCategory.budget))
+        .where(BudgetCategory.user_id.in_(user_ids))
+        .order_by(BudgetCategory.id)
+    ).all()
+
+    # Grouped by the stored YYYY-MM-DD string, which is split into month and
+    # day below; that is about twice as fast as calling strftime() per row.
+    is_recurring = cast(Expense.recurring_id.isnot(None), Integer)
+    expenses = db.session.execute(
+        select(Expense.category_id, type_coerce(Expense.date, String), is_recurring, cents(func.sum(Expense.amount)))
+        .where(Expense.user_id.in_(user_ids), Expense.date >= start, Expense.date <= end)
+        .group_by(Expense.category_id, Expense.date, is_recurring)
+    ).all()
+    dates = np.array([row[1] for row in expenses], dtype='datetime64[D]')
+    months = dates.astype('datetime64[M]')
+    category, recurring, amount = _columns(np, [(row[0], row[2], row[3]) for row in expenses], 3)
+
+    # Bills not yet materialized this month (see scheduler.py)
+    created = func.coalesce(cast(func.strftime('%Y%m%d', RecurringExpense.created_at), Integer), 0)
+    bills = db.session.execute(
+        select(RecurringExpense.category_id, cents(RecurringExpense.amount), RecurringExpense.due_day, created)
+        .where(
+            RecurringExpense.user_id.in_(user_ids),
+            ~exists().where(Expense.recurring_id == RecurringExpense.id, Expense.period == year_month),
+        )
+    ).all()
+
+    income_month = _month_number_sql(Income.date)
+    incomes = db.session.execute(
+        select(Income.user_id, income_month - first, cents(func.sum(Income.amount)))
+        .where(Income.user_id.in_(user_ids), Income.date >= start, Income.date <= end)
+        .group_by(Income.user_id, income_month)
+    ).all()
+
+    return {
+        'versions': versions,
+        'categories': categories,
+        'expenses': (
+            category,
+            months.astype(np.int64) - (first - EPOCH_MONTH),
+            (dates - months).astype(np.int64) + 1,
+            recurring,
+            amount,
+        ),
+        'bills': _columns(np, bills, 4),
+        'incomes': _columns(np, incomes, 3),
+        'months': np.array([_days_in(first + m) for m in range(history_months + 1)]),
+    }
+
+
+def _rint(np, values):
+    return np.rint(values).astype(np.int64)
+
+
+def _sum_by(np, index, weights, length):
+    # bincount sums in float64, which is exact for cents up to 2**53
+    return _rint(np, np.bincount(index, weights, minlength=length))
+
+
+def compute(user_ids, today=None, history_months=None):
+    """Forecasts for the month of `today`, as {user_id: (data_version, payload)}.
+
+    Unknown user ids are left out.
+    """
+    import numpy as np
+
+    today = today or datetime.utcnow().date()
+    if history_months is None:
+        history_months = current_app.config['FORECAST_HISTORY_MONTHS']
+    user_ids = sorted(set(user_ids))
+    data = _load(np, user_ids, today, history_months)
+    users = np.array(user_ids, dtype=np.int64)
+    M = history_months
+    day = today.day
+    days = data['months'][M]
+
+    category_ids = np.array([c[0] for c in data['categories']], dtype=np.int64)
+    owner = np.searchsorted(users, np.array([c[1] for c in data['categories']], dtype=np.int64))
+    budget = np.array([c[3] for c in data['categories']], dtype=np.int64)
+    C = len(category_ids)
+
+    # Discretionary spending per (category, month, day of month)
+    category, month, month_day, recurring, amount = data['expenses']
+    index = np.searchsorted(category_ids, category)
+    grid = np.zeros((C, M + 1, 31), dtype=np.int64)
+    discretionary = recurring == 0
+    np.add.at(grid, (index[discretionary], month[discretionary], month_day[discretionary] - 1), amount[discretionary])
+    this_month = month == M
+    recurring_spent = _sum_by(np, index[this_month & ~discretionary], amount[this_month & ~discretionary], C)
+
+    # Months before a user's first expense or income do not count as history
+    income_user, income_month, income_amount = data['incomes']
+    income_owner = np.searchsorted(users, income_user)
+    first_month = np.full(len(users), M, dtype=np.int64)
+    np.minimum.at(first_month, owner[index], month)
+    np.minimum.at(first_month, income_owner, income_month)
+    active = np.arange(M)[None, :] >= first_month[owner][:, None]
+    history = active.sum(axis=1)
+
+    # What the rest of each past month cost, cut at the same fraction of the month
+    cumulative = grid.cumsum(axis=2)
+    cut = np.clip(np.rint(day / days * data['months'][:M]).astype(np.int64), 1, None)
+    rest_of_month = cumulative[:, np.arange(M), -1] - cumulative[:, np.arange(M), cut - 1]
+    mean = (rest_of_month * active).sum(axis=1) / np.maximum(history, 1)
+    spread = np.sqrt((((rest_of_month - mean[:, None]) * active) ** 2).sum(axis=1) / np.maximum(history, 1))
+
+    discretionary_spent = cumulative[:, M, -1]
+    to_date = cumulative[:, M, day - 1]
+    pace = to_date * (days - day) / day
+    weight = day / days
+    rest = np.where(history > 0, weight * pace + (1 - weight) * mean, pace)
+    spread = np.where(history > 0, (1 - weight) * spread, 0.0)
+    # Expenses already entered for later this month are part of the rest
+    rest = np.maximum(rest - (discretionary_spent - to_date), 0)
+
+    # Bills due later this month, or earlier ones the scheduler has yet to catch up on
+    bill_category, bill_amount, due_day, created = data['bills']
+    due = (today.year * 100 + today.month) * 100 + np.minimum(due_day, days)
+    pending = (created <= due) & np.isin(bill_category, category_ids)
+    bills_due = _sum_by(np, np.searchsorted(category_ids, bill_category[pending]), bill_amount[pending], C)
+
+    spent = discretionary_spent + recurring_spent
+    projected = spent + bills_due + _rint(np, rest)
+    low = spent + bills_due + _rint(np, np.maximum(rest - spread, 0))
+    high = spent + bills_due + _rint(np, rest + spread)
+    status = np.select(
+        [spent > budget, projected > budget, high > budget],
+        ['over', 'likely_over', 'at_risk'],
+        'on_track',
+    )
+
+    income = np.zeros((len(users), M + 1), dtype=np.int64)
+    np.add.at(income, (income_owner, income_month), income_amount)
+    income_active = np.arange(M)[None, :] >= first_month[:, None]
+    income_history = income_active.sum(axis=1)
+    income_mean = (income[:, :M] * income_active).sum(axis=1) / np.maximum(income_history, 1)
+    income_projected = np.maximum(income[:, M], _rint(np, income_mean))
+
+    columns = {'budget': budget, 'spent': spent, 'bills_due': bills_due, 'projected': projected,
+               'low': low, 'high': high}
+    totals = {name: _sum_by(np, owner, values, len(users)).tolist()
+              for name, values in columns.items()}
+    columns = {name: values.tolist() for name, values in columns.items()}
+    results = {}
+    for u, user_id in enumerate(user_ids):
+        if user_id in data['versions']:
+            payload = {
+                'as_of': today.isoformat(),
+                'month': today.strftime('%Y-%m'),
+                'days_left': int(days - day),
+                'history_months': int(M - first_month[u]),
+                'categories': [],
+                'totals': {name: to_amount(values[u]) for name, values in totals.items()},
+                'income': {
+                    'received': to_amount(int(income[u, M])),
+                    'projected': to_amount(int(income_projected[u])),
+                },
+                'net': to_amount(int(income_projected[u]) - totals['projected'][u]),
+            }
+            results[user_id] = (data['versions'][user_id], payload)
+    for c, (category_id, user_id, name, _) in enumerate(data['categories']):
+        row = {'id': category_id, 'name': name}
+        row.update((key, to_amount(values[c])) for key, values in columns.items())
+        row['status'] = str(status[c])
+        results[user_id][1]['categories'].append(row)
+    return results
+
+
+def store(results, today):
+    """Upsert computed forecasts, given as (user_id, data_version, payload JSON) rows."""
+    if not results:
+        return
+    forecasts = Forecast.__table__
+    stmt = insert(forecasts)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[forecasts.c.user_id],
+            set_={name: stmt.excluded[name] for name in ('as_of', 'data_version', 'payload', 'computed_at')},
+        ),
+        [
+            {'user_id': user_id, 'as_of': today, 'data_version': version, 'payload': payload,
+             'computed_at': datetime.utcnow()}
+            for user_id, version, payload in results
+        ],
+    )
+
+
+def for_user(user_id, today=None):
+    """A user's forecast, from the nightly batch if nothing has changed since, else computed now.
+
+    Returns None for an unknown user.
+    """
+    today = today or datetime.utcnow().date()
+    stored = (
+        db.session.query(Forecast.payload)
+        .join(User, User.id == Forecast.user_id)
+        .filter(Forecast.user_id == user_id, Forecast.as_of == today, Forecast.data_version == User.data_version)
+        .scalar()
+    )
+    if stored is not None:
+        return json.loads(stored)
+    result = compute([user_id], today).get(user_id)
+    return result[1] if result else None
+
+
+def _rows(results):
+    return [(user_id, version, json.dumps(payload)) for user_id, (version, payload) in results.items()]
+
+
+# Worker processes build their own app (and engines) once, in the initializer
+_worker_app = None
+
+
+def _init_worker(config):
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app(config)
+
+
+def _compute_chunk(user_ids, today, history_months):
+    with _worker_app.app_context():
+        return _rows(compute(user_ids, today, history_months))
+
+
+def run_batch(app, today=None, workers=None, batch_size=None):
+    """Compute and store the forecast of every user.
+
+    Batches of users are computed in a process pool, or inline with
+    workers=0. The results are written here, so SQLite sees one writer.
+    """
+    started = time.perf_counter()
+    today = today or datetime.utcnow().date()
+    workers = app.config['FORECAST_WORKERS'] if workers is None else workers
+    batch_size = batch_size or app.config['FORECAST_BATCH_SIZE']
+    history_months = app.config['FORECAST_HISTORY_MONTHS']
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+    # Writes begin immediately (SQLITE_BEGIN_IMMEDIATE); end this one before the workers read
+    db.session.commit()
+    batches = [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)]
+
+    stored = 0
+    if workers:
+        config = {key: app.config[key] for key in ('SQLALCHEMY_DATABASE_URI', 'SQLALCHEMY_READ_URI')}
+        # Workers only read, so they need not queue for SQLite's write lock
+        config['SQLITE_BEGIN_IMMEDIATE'] = False
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(config,)) as pool:
+            for rows in pool.map(_compute_chunk, batches, repeat(today), repeat(history_months)):
+                store(rows, today)
+                db.session.commit()
+                stored += len(rows)
+    else:
+        for batch in batches:
+            rows = _rows(compute(batch, today, history_months))
+            store(rows, today)
+            db.session.commit()
+            stored += len(rows)
+    return {'as_of': today.isoformat(), 'users': stored, 'seconds': round(time.perf_counter() - started, 2)}
+
+
+def init_app(app):
+    # Past months that count as history, besides the current one
+    app.config.setdefault('FORECAST_HISTORY_MONTHS', 6)
+    app.config.setdefault('FORECAST_WORKERS', os.cpu_count() or 1)
+    # Users loaded and computed together
+    app.config.setdefault('FORECAST_BATCH_SIZE', 200)
+
+    @app.cli.command('forecast-batch')
+    @click.option('--date', 'today', type=click.DateTime(formats=['%Y-%m-%d']), help='Forecast as of this day.')
+    @click.option('--workers', type=int, help='Worker processes (0 computes in this process).')
+    def forecast_batch_command(today, workers):
+        """Precompute every user's month-end forecast, e.g. nightly from cron."""
+        result = run_batch(app, today.date() if today else None, workers)
+        click.echo(f"Stored {result['users']} forecasts as of {result['as_of']} in {result['seconds']}s")
@@ -0,0 +1,37 @@
+import hashlib
+import json
+from flask import current_app, jsonify, request
+from models import db, IdempotencyKey
+
+
+def request_key(data):
+    """The client's idempotency key, from the Idempotency-Key header or the body."""
+    return request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+
+
+def payload_hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def replay(user_id, key, request_hash):
+    """Return the stored response for a retried request, or None if the key is new."""
+    record = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+    if record is None:
+        return None
+    if record.request_hash != request_hash:
+        return jsonify({'message': 'Idempotency-Key was already used with a different request'}), 422
+    response = current_app.response_class(record.response, status=record.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def remember(user_id, key, request_hash, response):
+    # Added to the caller's transaction, so the key is stored only if the
+    # writes it describes commit too.
+    db.session.add(IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        request_hash=request_hash,
+        status_code=response.status_code,
+        response=response.get_data(as_text=True),
+    ))
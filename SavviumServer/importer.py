@@ -0,0 +1,260 @@
+"""Streaming import of bank statements (CSV or OFX) into a user's expenses.
+
+Rows are parsed lazily from the input stream, mapped to categories with
+rules, deduplicated against existing expenses (archived ones included)
+through the (user_id, fingerprint) index and inserted in fixed-size chunks, each in its
+own transaction, so memory use does not grow with the statement size.
+
+Command line usage (from the SavviumServer directory):
+
+    python importer.py --user 1 --default-category 3 statement.csv
+"""
+import argparse
+import csv
+import io
+import json
+import re
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import select
+from models import db, BudgetCategory, Expense, expense_fingerprint
+import archive
+import ledger
+
+DEFAULT_CHUNK_SIZE = 1000
+
+Transaction = namedtuple('Transaction', 'date name amount')
+
+CSV_DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y', '%d.%m.%Y')
+CSV_COLUMNS = {
+    'date': ('date', 'transaction date', 'posted date', 'posting date', 'booking date'),
+    'name': ('name', 'description', 'payee', 'merchant', 'memo'),
+    'amount': ('amount', 'transaction amount'),
+    'debit': ('debit', 'withdrawal', 'withdrawals'),
+    'credit': ('credit', 'deposit', 'deposits'),
+}
+
+
+class StatementError(ValueError):
+    pass
+
+
+def _parse_amount(value):
+    value = (value or '').strip().replace(',', '').replace('$', '')
+    if value.startswith('(') and value.endswith(')'):
+        value = '-' + value[1:-1]
+    return float(value) if value else 0.0
+
+
+def _parse_csv_date(value):
+    for fmt in CSV_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Unrecognised date {value!r}')
+
+
+def iter_csv(stream):
+    """Yield a Transaction per CSV line. Spending is negative, as banks export it."""
+    reader = csv.DictReader(stream)
+    headers = {h.strip().lower(): h for h in reader.fieldnames or ()}
+    columns = {
+        field: next((headers[c] for c in candidates if c in headers), None)
+        for field, candidates in CSV_COLUMNS.items()
+    }
+    if not columns['date'] or not columns['name'] or not (columns['amount'] or columns['debit']):
+        raise StatementError('CSV needs date, description and amount (or debit/credit) columns')
+
+    required = [columns['date'], columns['name'], columns['amount'] or columns['debit']]
+    for row in reader:
+        # DictReader fills the columns a short line lacks with None
+        if any(row[c] is None for c in required):
+            raise StatementError(f'Line {reader.line_num} is missing columns')
+        if columns['amount']:
+            amount = _parse_amount(row[columns['amount']])
+        else:
+            amount = _parse_amount(row.get(columns['credit'])) - abs(_parse_amount(row[columns['debit']]))
+        yield Transaction(_parse_csv_date(row[columns['date']]), row[columns['name']].strip(), amount)
+
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)')
+
+
+def iter_ofx(stream):
+    """Yield a Transaction per <STMTTRN> block of an OFX file (SGML or XML).
+
+    Parses line by line with a tag regex rather than building a document,
+    so only the current transaction is held in memory.
+    """
+    current = None
+    for line in stream:
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    yield Transaction(
+                        datetime.strptime(current['DTPOSTED'][:8], '%Y%m%d').date(),
+                        (current.get('NAME') or current.get('MEMO') or '').strip(),
+                        _parse_amount(current['TRNAMT']),
+                    )
+                    current = None
+                elif not closing:
+                    current = {}
+            elif current is not None and not closing and value.strip():
+                current[tag] = value.strip()
+
+
+PARSERS = {'csv': iter_csv, 'ofx': iter_ofx, 'qfx': iter_ofx}
+
+
+def _compile(pattern):
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except (re.error, TypeError) as e:
+        raise StatementError(f'Invalid rule {pattern!r}: {e}') from None
+
+
+class CategoryRules:
+    """Map a transaction name to a category id.
+
+    Explicit rules ({"match": <regex>, "category_id": <id>}) are tried in
+    order, then a category whose name appears in the transaction name, then
+    the default category.
+    """
+
+    def __init__(self, categories, rules=(), default_category_id=None):
+        self.rules = [(_compile(r['match']), r['category_id']) for r in rules]
+        self.by_name = [(name.lower(), category_id) for category_id, name in categories if name]
+        self.default_category_id = default_category_id
+
+    def category_for(self, name):
+        for pattern, category_id in self.rules:
+            if pattern.search(name):
+                return category_id
+        lowered = name.lower()
+        for category_name, category_id in self.by_name:
+            if category_name in lowered:
+                return category_id
+        return self.default_category_id
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _existing_fingerprints(user_id, fingerprints, date_from, date_to):
+    def build(source):
+        query = select(source.fingerprint).where(source.user_id == user_id, source.fingerprint.in_(fingerprints))
+        # Archives have no fingerprint index; their (user_id, date) one narrows the rows instead
+        if source is not Expense:
+            query = query.where(source.date >= date_from, source.date <= date_to)
+        return query
+    return set(db.session.execute(archive.union('expenses', build, date_from, date_to)).scalars())
+
+
+def import_statement(user_id, stream, fmt, rules=(), default_category_id=None,
+                     debits_positive=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Import a statement for a user and return counters describing the run.
+
+    Credits (money in) are skipped, as are rows no rule maps to a category
+    and rows whose (date, amount, name) already exists for the user.
+    Each chunk is committed on its own; a failure leaves earlier chunks in
+    place, and re-running the import skips them as duplicates.
+    """
+    if fmt not in PARSERS:
+        raise StatementError(f"Unsupported format {fmt!r}; expected one of {', '.join(PARSERS)}")
+    if not isinstance(rules, (list, tuple)) or not all(isinstance(r, dict) for r in rules):
+        raise StatementError('Rules must be a list of {"match": regex, "category_id": id} objects')
+
+    categories = db.session.query(BudgetCategory.id, BudgetCategory.name).filter(BudgetCategory.user_id == user_id).all()
+    owned = {c.id for c in categories}
+    for category_id in [r['category_id'] for r in rules] + [default_category_id]:
+        if category_id is not None and category_id not in owned:
+            raise StatementError(f'Category {category_id} not found')
+    mapper = CategoryRules(categories, rules, default_category_id)
+
+    stats = {'read': 0, 'imported': 0, 'duplicates': 0, 'credits': 0, 'uncategorized': 0}
+    for chunk in _chunks(PARSERS[fmt](stream), chunk_size):
+        stats['read'] += len(chunk)
+        candidates = {}
+        for t in chunk:
+            amount = t.amount if debits_positive else -t.amount
+            if amount <= 0:
+                stats['credits'] += 1
+                continue
+            category_id = mapper.category_for(t.name)
+            if category_id is None:
+                stats['uncategorized'] += 1
+                continue
+            fingerprint = expense_fingerprint(user_id, t.date, amount, t.name)
+            if fingerprint in candidates:
+                stats['duplicates'] += 1
+                continue
+            candidates[fingerprint] = {'category_id': category_id, 'name': t.name, 'amount': amount, 'date': t.date}
+
+        existing = set()
+        if candidates:
+            dates = [row['date'] for row in candidates.values()]
+            existing = _existing_fingerprints(user_id, list(candidates), min(dates), max(dates))
+        stats['duplicates'] += len(existing)
+        rows = [row for fingerprint, row in candidates.items() if fingerprint not in existing]
+        ledger.insert_expenses(user_id, rows)
+        db.session.commit()
+        stats['imported'] += len(rows)
+    return stats
+
+
+def text_stream(binary):
+    # utf-8-sig drops the byte order mark some banks prepend
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def format_for(filename, explicit=None):
+    if explicit:
+        return explicit.lower()
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else 'csv'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import a CSV or OFX bank statement as expenses.')
+    parser.add_argument('path', help='statement file')
+    parser.add_argument('--user', type=int, required=True, help='user id to import for')
+    parser.add_argument('--format', choices=sorted(PARSERS), help='defaults to the file extension')
+    parser.add_argument('--default-category', type=int, help='category for rows no rule matches')
+    parser.add_argument('--rules', help='JSON file with [{"match": regex, "category_id": id}, ...]')
+    parser.add_argument('--debits-positive', action='store_true', help='spending is positive in this file')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    app = create_app()
+
+    rules = []
+    if args.rules:
+        with open(args.rules) as f:
+            rules = json.load(f)
+
+    started = datetime.utcnow()
+    with app.app_context(), open(args.path, 'rb') as f:
+        stats = import_statement(
+            args.user,
+            text_stream(f),
+            format_for(args.path, args.format),
+            rules=rules,
+            default_category_id=args.default_category,
+            debits_positive=args.debits_positive,
+            chunk_size=args.chunk_size,
+        )
+    stats['seconds'] = round((datetime.utcnow() - started).total_seconds(), 2)
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
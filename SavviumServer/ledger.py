@@ -0,0 +1,133 @@
+from datetime import datetime
+from sqlalchemy import insert
+from models import db, BudgetCategory, Expense, expense_fingerprint
+from changes import record_change
+from money import to_amount, to_cents
+import rollups
+
+# Upper bound on expenses accepted by one bulk request
+MAX_BULK_EXPENSES = 5000
+
+
+def owned_category_ids(user_id, category_ids):
+    """The subset of `category_ids` that belong to the user, in one query."""
+    if not category_ids:
+        return set()
+    rows = (
+        db.session.query(BudgetCategory.id)
+        .filter(BudgetCategory.user_id == user_id, BudgetCategory.id.in_(category_ids))
+        .all()
+    )
+    return {r.id for r in rows}
+
+
+def is_id(value):
+    # bool is an int subclass, but True is not a category id
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_expenses(user_id, items, today=None):
+    """Validate a batch of expense payloads together.
+
+    Returns (rows, errors): rows is a list of (index, values) ready for
+    insert_expenses, errors a list of (index, message). Category ownership
+    for the whole batch is checked with a single query.
+    """
+    today = today or datetime.utcnow().date()
+    # Only well-typed ids are looked up; anything else (a list, a dict) is
+    # reported against its own item below
+    owned = owned_category_ids(user_id, {
+        item['category_id'] for item in items
+        if isinstance(item, dict) and is_id(item.get('category_id'))
+    })
+
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append((index, 'Expense must be an object'))
+            continue
+        if not item.get('name') or item.get('amount') is None or item.get('category_id') is None:
+            errors.append((index, 'Missing required fields'))
+            continue
+        if not isinstance(item['name'], str):
+            errors.append((index, "'name' must be a string"))
+            continue
+        if not is_id(item['category_id']):
+            errors.append((index, "'category_id' must be an integer"))
+            continue
+        if item['category_id'] not in owned:
+            errors.append((index, 'Category not found'))
+            continue
+        try:
+            amount = to_amount(to_cents(item['amount']))
+        except ValueError:
+            errors.append((index, "'amount' must be a number"))
+            continue
+        try:
+            date = datetime.strptime(item['date'], '%Y-%m-%d').date() if item.get('date') else today
+        except (TypeError, ValueError):
+            errors.append((index, "'date' must be a date in YYYY-MM-DD format"))
+            continue
+        rows.append((index, {
+            'category_id': item['category_id'],
+            'name': item['name'],
+            'amount': amount,
+            'date': date,
+        }))
+    return rows, errors
+
+
+def insert_expenses(user_id, rows):
+    """Insert already-validated expense rows for one user in a single statement batch.
+
+    Uses an executemany-style INSERT ... RETURNING rather than the unit of
+    work, so the user's data version is bumped here explicitly and stamped on
+    every row. Returns the new ids in the order of `rows`. The caller owns
+    the transaction.
+    """
+    if not rows:
+        return []
+    result = db.session.execute(
+        insert(Expense).returning(Expense.id, sort_by_parameter_order=True), _expense_values(user_id, rows)
+    )
+    ids = result.scalars().all()
+    deltas = rollups.new_deltas()
+    rollups.add_rows(deltas, user_id, rows)
+    rollups.apply(db.session.connection(), deltas)
+    return ids
+
+
+def materialize_expenses(user_id, rows):
+    """Insert expenses generated from recurring bills, skipping any that exist.
+
+    Rows carry recurring_id and period; a row whose (recurring_id, period)
+    is already taken, e.g. by a concurrent scheduler run, is ignored by the
+    unique index rather than failing the batch. Returns the number inserted.
+    """
+    if not rows:
+        return 0
+    result = db.session.execute(
+        insert(Expense).prefix_with('OR IGNORE').returning(Expense.category_id, Expense.date, Expense.amount),
+        _expense_values(user_id, rows),
+    )
+    inserted = result.all()
+    # Only the rows actually inserted count towards the rollups
+    deltas = rollups.new_deltas()
+    rollups.add_rows(deltas, user_id, inserted)
+    rollups.apply(db.session.connection(), deltas)
+    return len(inserted)
+
+
+def _expense_values(user_id, rows):
+    version = record_change(user_id)
+    now = datetime.utcnow()
+    return [
+        dict(
+            row,
+            user_id=user_id,
+            version=version,
+            updated_at=now,
+            fingerprint=expense_fingerprint(user_id, row['date'], row['amount'], row['name']),
+        )
+        for row in rows
+    ]
@@ -0,0 +1,259 @@
+"""Request metrics, slow-query logging and an opt-in request profiler.
+
+Every request records its latency and the number and duration of the SQL
+statements it ran (counted with SQLAlchemy cursor events). /metrics
+serves these in the Prometheus text format, together with the response
+cache, connection pool and password pool statistics. Metrics are kept
+per process; with several workers, scrape each one or aggregate them.
+
+Statements slower than SLOW_QUERY_MS are logged with the endpoint that
+ran them. With METRICS_PROFILING set (on by default in debug mode),
+adding ?profile=1 to a request replaces its response with a JSON report
+of the statements it ran, the ones repeated (the N+1 signature) and the
+hottest functions.
+"""
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import Response, current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+log = logging.getLogger(__name__)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., sum, count]
+        self.series = defaultdict(lambda: [0] * len(buckets) + [0.0, 0])
+
+    def observe(self, labels, value):
+        series = self.series[labels]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+    """Process-wide request and database metrics (see the module docstring).
+
+    Configured with SLOW_QUERY_MS and METRICS_PROFILING.
+    """
+
+    REQUEST_LABELS = ('method', 'endpoint', 'status')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries_per_request = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_seconds = Counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.slow_queries = 0
+        self.slow_query_seconds = 0.2
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_MS', 200)
+        app.config.setdefault('METRICS_PROFILING', app.debug)
+        self.slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000
+
+        # Engine-level listeners see every engine, including the read bind
+        # and engines created after this point.
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+        app.before_request(_start_request)
+        app.after_request(_finish_request)
+
+        @app.route('/metrics', methods=['GET'])
+        def prometheus_metrics():
+            return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def record_query(self, statement, seconds):
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+            slow = seconds >= self.slow_query_seconds
+            if slow:
+                self.slow_queries += 1
+        if slow:
+            endpoint = request.endpoint if has_request_context() else None
+            log.warning('Slow query (%.0f ms) in %s: %s', 1000 * seconds, endpoint or 'no request',
+                        ' '.join(statement.split())[:500])
+
+    def record_request(self, method, endpoint, status, seconds, queries, query_seconds):
+        labels = (method, endpoint, str(status))
+        with self._lock:
+            self.requests[labels] += 1
+            self.latency.observe(labels, seconds)
+            self.queries_per_request.observe((method, endpoint), queries)
+            self.db_seconds[(method, endpoint)] += query_seconds
+
+    def render(self):
+        from cache import cache
+        from models import db
+        from passwords import hasher
+
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, hist, label_names):
+            for values, series in sorted(hist.series.items()):
+                for bound, count in zip(hist.buckets, series):
+                    lines.append(f'{name}_bucket{_labels(label_names, values, le=bound)} {count}')
+                lines.append(f'{name}_bucket{_labels(label_names, values, le="+Inf")} {series[-1]}')
+                lines.append(f'{name}_sum{_labels(label_names, values)} {series[-2]:.6f}')
+                lines.append(f'{name}_count{_labels(label_names, values)} {series[-1]}')
+
+        with self._lock:
+            family('savvium_requests_total', 'counter', 'HTTP requests handled.')
+            for values, count in sorted(self.requests.items()):
+                lines.append(f'savvium_requests_total{_labels(self.REQUEST_LABELS, values)} {count}')
+            family('savvium_request_duration_seconds', 'histogram', 'Time to handle a request.')
+            histogram('savvium_request_duration_seconds', self.latency, self.REQUEST_LABELS)
+            family('savvium_request_queries', 'histogram', 'SQL statements run per request.')
+            histogram('savvium_request_queries', self.queries_per_request, ('method', 'endpoint'))
+            family('savvium_request_db_seconds_total', 'counter', 'Time spent in SQL per endpoint.')
+            for values, seconds in sorted(self.db_seconds.items()):
+                lines.append(f"savvium_request_db_seconds_total{_labels(('method', 'endpoint'), values)} {seconds:.6f}")
+            family('savvium_db_queries_total', 'counter', 'SQL statements run, in or out of requests.')
+            lines.append(f'savvium_db_queries_total {self.queries}')
+            family('savvium_db_query_seconds_total', 'counter', 'Time spent running SQL statements.')
+            lines.append(f'savvium_db_query_seconds_total {self.query_seconds:.6f}')
+            family('savvium_db_slow_queries_total', 'counter', 'SQL statements slower than SLOW_QUERY_MS.')
+            lines.append(f'savvium_db_slow_queries_total {self.slow_queries}')
+
+        family('savvium_db_pool_connections', 'gauge', 'Connections per engine by state.')
+        for bind, engine in sorted(db.engines.items(), key=lambda item: str(item[0])):
+            pool = engine.pool
+            if not hasattr(pool, 'checkedout'):
+                continue
+            name = bind or 'default'
+            lines.append(f'savvium_db_pool_connections{_labels((), (), engine=name, state="checked_out")} {pool.checkedout()}')
+            lines.append(f'savvium_db_pool_connections{_labels((), (), engine=name, state="idle")} {pool.checkedin()}')
+            lines.append(f'savvium_db_pool_connections{_labels((), (), engine=name, state="overflow")} {max(pool.overflow(), 0)}')
+
+        cache_stats = cache.stats()
+        family('savvium_cache_lookups_total', 'counter', 'Response cache lookups by result.')
+        lines.append(f'savvium_cache_lookups_total{{result="hit"}} {cache_stats["hits"]}')
+        lines.append(f'savvium_cache_lookups_total{{result="miss"}} {cache_stats["misses"]}')
+        family('savvium_cache_invalidations_total', 'counter', 'Per-user response cache invalidations.')
+        lines.append(f'savvium_cache_invalidations_total {cache_stats["invalidations"]}')
+        family('savvium_cache_entries', 'gauge', 'Responses currently cached.')
+        lines.append(f'savvium_cache_entries {cache_stats["entries"]}')
+
+        password_stats = hasher.stats()
+        family('savvium_password_hashes_pending', 'gauge', 'Password hashes queued or running.')
+        lines.append(f'savvium_password_hashes_pending {password_stats["pending"]}')
+        family('savvium_password_hashes_total', 'counter', 'Password hashes by result.')
+        lines.append(f'savvium_password_hashes_total{{result="completed"}} {password_stats["completed"]}')
+        lines.append(f'savvium_password_hashes_total{{result="rejected"}} {password_stats["rejected"]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append((context, time.perf_counter()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_started'].pop()[1]
+    metrics.record_query(statement, seconds)
+    if has_request_context() and 'query_count' in g:
+        g.query_count += 1
+        g.query_seconds += seconds
+        if g.get('query_log') is not None:
+            g.query_log.append((statement, seconds))
+
+
+def _handle_error(error):
+    # A failed statement never reaches after_cursor_execute; drop its start
+    # time so later statements on the connection are not timed against it.
+    # Errors raised before the statement was sent have no entry to drop.
+    if error.connection is None or error.execution_context is None:
+        return
+    started = error.connection.info.get('query_started')
+    if started and started[-1][0] is error.execution_context:
+        started.pop()
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.query_count = 0
+    g.query_seconds = 0.0
+    g.query_log = None
+    if current_app.config['METRICS_PROFILING'] and request.args.get('profile') == '1':
+        g.query_log = []
+        g.profiler = cProfile.Profile()
+        try:
+            g.profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            g.profiler = None
+
+
+def _finish_request(response):
+    if 'request_started' not in g:
+        return response
+    seconds = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unmatched'
+    metrics.record_request(request.method, endpoint, response.status_code, seconds,
+                           g.query_count, g.query_seconds)
+    if g.query_log is not None:
+        return _profile_report(response, seconds)
+    return response
+
+
+def _profile_report(response, seconds):
+    profiler = g.get('profiler')
+    hot = ''
+    if profiler is not None:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+        hot = out.getvalue()
+    # The same statement run many times in one request is usually a query
+    # per row that should have been a join or an IN list.
+    repeated = Counter(' '.join(statement.split()) for statement, _ in g.query_log)
+    return jsonify({
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(1000 * seconds, 2),
+        'query_count': g.query_count,
+        'query_ms': round(1000 * g.query_seconds, 2),
+        'queries': [
+            {'statement': ' '.join(statement.split()), 'ms': round(1000 * s, 3)}
+            for statement, s in g.query_log
+        ],
+        'repeated': [
+            {'statement': statement, 'count': count}
+            for statement, count in repeated.most_common() if count > 1
+        ],
+        'profile': hot.splitlines(),
+    })
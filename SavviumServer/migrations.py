@@ -0,0 +1,385 @@
+import click
+from datetime import datetime
+from sqlalchemy import inspect, text
+from models import db, expense_fingerprint
+from money import to_cents
+
+
+def _backfill_fingerprints(conn, chunk_size=1000):
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            'SELECT id, user_id, date, amount, name FROM expenses WHERE id > :last ORDER BY id LIMIT :n'
+        ), {'last': last_id, 'n': chunk_size}).fetchall()
+        if not rows:
+            return
+        conn.execute(text('UPDATE expenses SET fingerprint = :fp WHERE id = :id'), [
+            {'id': r.id, 'fp': expense_fingerprint(r.user_id, datetime.strptime(r.date, '%Y-%m-%d').date(), r.amount, r.name)}
+            for r in rows
+        ])
+        last_id = rows[-1].id
+
+
+def _convert_to_cents(table, old, new, chunk_size=1000):
+    """A step that fills `new` with `old` dollars in cents, rounded exactly as money.to_cents does."""
+    def step(conn):
+        last_rowid = 0
+        while True:
+            rows = conn.execute(text(
+                f'SELECT rowid, {old} FROM {table} WHERE rowid > :last ORDER BY rowid LIMIT :n'
+            ), {'last': last_rowid, 'n': chunk_size}).fetchall()
+            if not rows:
+                return
+            conn.execute(text(f'UPDATE {table} SET {new} = :cents WHERE rowid = :rowid'), [
+                {'rowid': rowid, 'cents': to_cents(amount) if amount is not None else 0}
+                for rowid, amount in rows
+            ])
+            last_rowid = rows[-1][0]
+    return step
+
+
+def _autoincrement(table):
+    """A step that rebuilds `table` with an AUTOINCREMENT id, so SQLite never
+    gives a deleted row's id to a new row. Columns, foreign keys, indexes
+    and triggers are copied from the table as it is, not from the models."""
+    def step(conn):
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :t"), {'t': table}).scalar()
+        if 'AUTOINCREMENT' in sql.upper():
+            return
+        columns = conn.execute(text(f'PRAGMA table_info({table})')).fetchall()
+        definitions = []
+        for column in columns:
+            if column.pk:
+                definitions.append(f'"{column.name}" INTEGER PRIMARY KEY AUTOINCREMENT')
+                continue
+            definition = f'"{column.name}" {column.type}'
+            if column.notnull:
+                definition += ' NOT NULL'
+            if column.dflt_value is not None:
+                definition += f' DEFAULT {column.dflt_value}'
+            definitions.append(definition)
+        for fk in conn.execute(text(f'PRAGMA foreign_key_list({table})')).fetchall():
+            definition = f'FOREIGN KEY("{fk[3]}") REFERENCES {fk[2]} ({fk[4]})'
+            if fk[6] != 'NO ACTION':
+                definition += f' ON DELETE {fk[6]}'
+            definitions.append(definition)
+        # Indexes and triggers (e.g. the search index's) go with the old table
+        dependents = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = :t AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+        ), {'t': table}).scalars().all()
+        names = ', '.join(f'"{column.name}"' for column in columns)
+        conn.execute(text(f'CREATE TABLE {table}_rebuilt ({", ".join(definitions)})'))
+        conn.execute(text(f'INSERT INTO {table}_rebuilt ({names}) SELECT {names} FROM {table}'))
+        conn.execute(text(f'DROP TABLE {table}'))
+        conn.execute(text(f'ALTER TABLE {table}_rebuilt RENAME TO {table}'))
+        for statement in dependents:
+            conn.execute(text(statement))
+    return step
+
+
+def _complete_archives(kind, columns, indexes):
+    """A step that adds `columns` ((name, type) pairs) and `indexes` to
+    every archived year of `kind` that lacks them (see archive.py)."""
+    def step(conn):
+        years = conn.execute(text('SELECT year FROM archived_years WHERE kind = :k'), {'k': kind}).scalars().all()
+        for year in years:
+            table = f'{kind}_archive_{year}'
+            present = {column.name for column in conn.execute(text(f'PRAGMA table_info({table})'))}
+            for name, type_ in columns:
+                if name not in present:
+                    conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {type_}'))
+            for index in indexes:
+                conn.execute(text(
+                    f'CREATE INDEX IF NOT EXISTS ix_{table}_{"_".join(index)} ON {table} ({", ".join(index)})'
+                ))
+    return step
+
+
+def _index_archives(kind):
+    """A step that adds the rows of every archived year of `kind` to its
+    search index. Archiving used to leave them out."""
+    def step(conn):
+        years = conn.execute(text('SELECT year FROM archived_years WHERE kind = :k'), {'k': kind}).scalars().all()
+        for year in years:
+            conn.execute(text(
+                f"INSERT INTO {kind}_fts (rowid, name, owner) "
+                f"SELECT id, name, 'u' || user_id FROM {kind}_archive_{year}"
+            ))
+    return step
+
+
+# Ordered, append-only list of schema migrations. Each entry is
+# (version, description, steps) where a step is either a SQL string or a
+# callable taking the open connection. Never edit a migration that has
+# shipped; add a new one instead.
+MIGRATIONS = [
+    (1, 'secondary indexes for the list endpoints', [
+        'CREATE INDEX IF NOT EXISTS ix_budget_categories_user_id ON budget_categories (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_expenses_category_id_date ON expenses (category_id, date)',
+        'CREATE INDEX IF NOT EXISTS ix_expenses_date ON expenses (date)',
+        'CREATE INDEX IF NOT EXISTS ix_incomes_user_id_date ON incomes (user_id, date)',
+        'CREATE INDEX IF NOT EXISTS ix_recurring_expenses_user_id_due_day ON recurring_expenses (user_id, due_day)',
+    ]),
+    # SQLite cannot add a NOT NULL column without a default, so migrated
+    # databases get a nullable column that the backfill fills in.
+    (2, 'expenses.user_id for keyset pagination by user', [
+        'ALTER TABLE expenses ADD COLUMN user_id INTEGER REFERENCES users (id)',
+        'UPDATE expenses SET user_id = '
+        '(SELECT user_id FROM budget_categories WHERE budget_categories.id = expenses.category_id)',
+        'CREATE INDEX IF NOT EXISTS ix_expenses_user_id_date ON expenses (user_id, date)',
+    ]),
+    (3, 'users.data_version for ETags', [
+        'ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0',
+    ]),
+    (4, 'row versions and tombstones for delta sync', [
+        *[
+            statement
+            for table in ('budget_categories', 'expenses', 'incomes', 'recurring_expenses')
+            for statement in (
+                f'ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0',
+                f'ALTER TABLE {table} ADD COLUMN updated_at DATETIME',
+                f'CREATE INDEX IF NOT EXISTS ix_{table}_user_id_version ON {table} (user_id, version)',
+            )
+        ],
+        'CREATE TABLE IF NOT EXISTS tombstones ('
+        ' id INTEGER NOT NULL PRIMARY KEY,'
+        ' user_id INTEGER NOT NULL REFERENCES users (id),'
+        ' table_name VARCHAR NOT NULL,'
+        ' row_id INTEGER NOT NULL,'
+        ' version INTEGER NOT NULL,'
+        ' deleted_at DATETIME NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS ix_tombstones_user_id_version ON tombstones (user_id, version)',
+    ]),
+    (5, 'idempotency keys for bulk writes', [
+        'CREATE TABLE IF NOT EXISTS idempotency_keys ('
+        ' id INTEGER NOT NULL PRIMARY KEY,'
+        ' user_id INTEGER NOT NULL REFERENCES users (id),'
+        ' key VARCHAR(255) NOT NULL,'
+        ' request_hash VARCHAR(64) NOT NULL,'
+        ' status_code INTEGER NOT NULL,'
+        ' response TEXT NOT NULL,'
+        ' created_at DATETIME NOT NULL,'
+        ' CONSTRAINT uq_idempotency_keys_user_id_key UNIQUE (user_id, key))',
+    ]),
+    (6, 'expense fingerprints for import dedupe', [
+        'ALTER TABLE expenses ADD COLUMN fingerprint INTEGER',
+        _backfill_fingerprints,
+        'CREATE INDEX IF NOT EXISTS ix_expenses_user_id_fingerprint ON expenses (user_id, fingerprint)',
+    ]),
+    (7, 'recurring expense materialization', [
+        'ALTER TABLE expenses ADD COLUMN recurring_id INTEGER REFERENCES recurring_expenses (id) ON DELETE SET NULL',
+        'ALTER TABLE expenses ADD COLUMN period VARCHAR(7)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_expenses_recurring_id_period ON expenses (recurring_id, period)',
+        'ALTER TABLE recurring_expenses ADD COLUMN created_at DATETIME',
+        'CREATE INDEX IF NOT EXISTS ix_recurring_expenses_due_day ON recurring_expenses (due_day)',
+        'CREATE TABLE IF NOT EXISTS job_state ('
+        ' job VARCHAR(100) NOT NULL PRIMARY KEY,'
+        ' last_run_on DATE NOT NULL,'
+        ' updated_at DATETIME NOT NULL)',
+    ]),
+    (8, 'monthly expense rollups', [
+        'CREATE TABLE IF NOT EXISTS monthly_rollups ('
+        ' user_id INTEGER NOT NULL REFERENCES users (id),'
+        ' category_id INTEGER NOT NULL REFERENCES budget_categories (id),'
+        ' year_month VARCHAR(7) NOT NULL,'
+        ' total FLOAT NOT NULL,'
+        ' count INTEGER NOT NULL,'
+        ' PRIMARY KEY (user_id, category_id, year_month))',
+        'CREATE INDEX IF NOT EXISTS ix_monthly_rollups_user_id_year_month ON monthly_rollups (user_id, year_month)',
+        'CREATE INDEX IF NOT EXISTS ix_monthly_rollups_category_id ON monthly_rollups (category_id)',
+        'INSERT INTO monthly_rollups (user_id, category_id, year_month, total, count) '
+        "SELECT user_id, category_id, strftime('%Y-%m', date), SUM(amount), COUNT(*) "
+        "FROM expenses GROUP BY user_id, category_id, strftime('%Y-%m', date)",
+    ]),
+    # Each money column is copied to an INTEGER cents column with
+    # money.to_cents, and the float column is dropped (SQLite 3.35+). Rollup
+    # totals are then summed again from the expenses' cents, so they agree
+    # with the rows exactly.
+    (9, 'money as integer cents', [
+        *[
+            step
+            for table, old, new in (
+                ('budget_categories', 'budget', 'budget_cents'),
+                ('expenses', 'amount', 'amount_cents'),
+                ('incomes', 'amount', 'amount_cents'),
+                ('recurring_expenses', 'amount', 'amount_cents'),
+            )
+            for step in (
+                f'ALTER TABLE {table} ADD COLUMN {new} INTEGER NOT NULL DEFAULT 0',
+                _convert_to_cents(table, old, new),
+                f'ALTER TABLE {table} DROP COLUMN {old}',
+            )
+        ],
+        'ALTER TABLE monthly_rollups ADD COLUMN total_cents INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE monthly_rollups DROP COLUMN total',
+        'DELETE FROM monthly_rollups',
+        'INSERT INTO monthly_rollups (user_id, category_id, year_month, total_cents, count) '
+        "SELECT user_id, category_id, strftime('%Y-%m', date), SUM(amount_cents), COUNT(*) "
+        "FROM expenses GROUP BY user_id, category_id, strftime('%Y-%m', date)",
+    ]),
+    (10, 'plaid items', [
+        'CREATE TABLE IF NOT EXISTS plaid_items ('
+        ' id INTEGER NOT NULL PRIMARY KEY,'
+        ' user_id INTEGER NOT NULL REFERENCES users (id),'
+        ' item_id VARCHAR(100) NOT NULL UNIQUE,'
+        ' access_token VARCHAR(200) NOT NULL,'
+        ' created_at DATETIME NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS ix_plaid_items_user_id ON plaid_items (user_id)',
+    ]),
+    (11, 'plaid transaction sync', [
+        'ALTER TABLE plaid_items ADD COLUMN cursor TEXT',
+        'ALTER TABLE plaid_items ADD COLUMN default_category_id INTEGER REFERENCES budget_categories (id) ON DELETE SET NULL',
+        'ALTER TABLE plaid_items ADD COLUMN synced_at DATETIME',
+        'ALTER TABLE plaid_items ADD COLUMN sync_error TEXT',
+        'ALTER TABLE expenses ADD COLUMN plaid_transaction_id VARCHAR(100)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_expenses_plaid_transaction_id ON expenses (plaid_transaction_id)',
+    ]),
+    (12, 'full-text search over expense and income names', [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5("
+        "name, owner, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+        "INSERT INTO expenses_fts (expenses_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+        "CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN "
+        "INSERT INTO expenses_fts (rowid, name, owner) VALUES (new.id, new.name, 'u' || new.user_id); END",
+        "CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN "
+        "INSERT INTO expenses_fts (expenses_fts, rowid, name, owner) VALUES ('delete', old.id, old.name, 'u' || old.user_id); END",
+        "CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF name, user_id ON expenses BEGIN "
+        "INSERT INTO expenses_fts (expenses_fts, rowid, name, owner) VALUES ('delete', old.id, old.name, 'u' || old.user_id); "
+        "INSERT INTO expenses_fts (rowid, name, owner) VALUES (new.id, new.name, 'u' || new.user_id); END",
+        "INSERT INTO expenses_fts (rowid, name, owner) SELECT id, name, 'u' || user_id FROM expenses",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS incomes_fts USING fts5("
+        "name, owner, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+        "INSERT INTO incomes_fts (incomes_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+        "CREATE TRIGGER IF NOT EXISTS incomes_fts_insert AFTER INSERT ON incomes BEGIN "
+        "INSERT INTO incomes_fts (rowid, name, owner) VALUES (new.id, new.name, 'u' || new.user_id); END",
+        "CREATE TRIGGER IF NOT EXISTS incomes_fts_delete AFTER DELETE ON incomes BEGIN "
+        "INSERT INTO incomes_fts (incomes_fts, rowid, name, owner) VALUES ('delete', old.id, old.name, 'u' || old.user_id); END",
+        "CREATE TRIGGER IF NOT EXISTS incomes_fts_update AFTER UPDATE OF name, user_id ON incomes BEGIN "
+        "INSERT INTO incomes_fts (incomes_fts, rowid, name, owner) VALUES ('delete', old.id, old.name, 'u' || old.user_id); "
+        "INSERT INTO incomes_fts (rowid, name, owner) VALUES (new.id, new.name, 'u' || new.user_id); END",
+        "INSERT INTO incomes_fts (rowid, name, owner) SELECT id, name, 'u' || user_id FROM incomes",
+    ]),
+    (13, 'precomputed spending forecasts', [
+        'CREATE TABLE IF NOT EXISTS forecasts ('
+        ' user_id INTEGER NOT NULL PRIMARY KEY REFERENCES users (id),'
+        ' as_of DATE NOT NULL,'
+        ' data_version INTEGER NOT NULL,'
+        ' payload TEXT NOT NULL,'
+        ' computed_at DATETIME NOT NULL)',
+    ]),
+    (14, 'budget alert outbox', [
+        'CREATE TABLE IF NOT EXISTS alert_outbox ('
+        ' id INTEGER NOT NULL PRIMARY KEY,'
+        ' user_id INTEGER NOT NULL REFERENCES users (id),'
+        ' category_id INTEGER NOT NULL,'
+        ' year_month VARCHAR(7) NOT NULL,'
+        ' threshold INTEGER NOT NULL,'
+        ' payload TEXT NOT NULL,'
+        ' status VARCHAR(10) NOT NULL,'
+        ' attempts INTEGER NOT NULL,'
+        ' next_attempt_at DATETIME NOT NULL,'
+        ' last_error TEXT,'
+        ' created_at DATETIME NOT NULL,'
+        ' delivered_at DATETIME)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_alert_outbox_category_month_threshold '
+        'ON alert_outbox (category_id, year_month, threshold)',
+        "CREATE INDEX IF NOT EXISTS ix_alert_outbox_pending ON alert_outbox (next_attempt_at) WHERE status = 'pending'",
+    ]),
+    # The archive tables themselves are created by the archive job
+    (15, 'archived years of expenses and incomes', [
+        'CREATE TABLE IF NOT EXISTS archived_years ('
+        ' kind VARCHAR(20) NOT NULL,'
+        ' year INTEGER NOT NULL,'
+        ' archived_at DATETIME NOT NULL,'
+        ' PRIMARY KEY (kind, year))',
+        'CREATE INDEX IF NOT EXISTS ix_incomes_date ON incomes (date)',
+    ]),
+    # Without AUTOINCREMENT SQLite reuses the highest id once its row is
+    # deleted, and delta sync would then report one id as both deleted and
+    # updated.
+    (16, 'never reuse ids of synced rows', [
+        _autoincrement(table)
+        for table in ('budget_categories', 'expenses', 'incomes', 'recurring_expenses')
+    ]),
+    # Archive tables used to keep only the columns reads use, which lost
+    # the Plaid and recurring keys of archived expenses. Rows archived
+    # before this have NULL there (and version 0).
+    (17, 'archive tables keep every column', [
+        _complete_archives('expenses', [
+            ('version', 'INTEGER NOT NULL DEFAULT 0'),
+            ('updated_at', 'DATETIME'),
+            ('recurring_id', 'INTEGER'),
+            ('period', 'VARCHAR(7)'),
+            ('plaid_transaction_id', 'VARCHAR(100)'),
+        ], [('plaid_transaction_id',), ('recurring_id', 'period')]),
+        _complete_archives('incomes', [
+            ('version', 'INTEGER NOT NULL DEFAULT 0'),
+            ('updated_at', 'DATETIME'),
+        ], []),
+    ]),
+    (18, 'archived rows in search and delta sync', [
+        _complete_archives('expenses', [], [('user_id', 'version')]),
+        _complete_archives('incomes', [], [('user_id', 'version')]),
+        _index_archives('expenses'),
+        _index_archives('incomes'),
+    ]),
+]
+
+HEAD = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+    if conn.execute(text('SELECT COUNT(*) FROM schema_version')).scalar() == 0:
+        conn.execute(text('INSERT INTO schema_version (version) VALUES (0)'))
+
+
+def current_version(engine):
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return conn.execute(text('SELECT version FROM schema_version')).scalar()
+
+
+def upgrade(engine=None, target=HEAD):
+    """Bring the database up to `target`, returning the versions applied.
+
+    A brand new database is built with db.create_all() and stamped at HEAD,
+    since the models already describe the latest schema. An existing
+    database (e.g. a db.sqlite created before migrations existed) starts at
+    version 0 and has every pending migration applied in order, each in its
+    own transaction.
+    """
+    engine = engine or db.engine
+
+    if not inspect(engine).has_table('users'):
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            _ensure_version_table(conn)
+            conn.execute(text('UPDATE schema_version SET version = :v'), {'v': HEAD})
+        return []
+
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version > target:
+            break
+        with engine.begin() as conn:
+            _ensure_version_table(conn)
+            if conn.execute(text('SELECT version FROM schema_version')).scalar() >= version:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            conn.execute(text('UPDATE schema_version SET version = :v'), {'v': version})
+        applied.append((version, description))
+    return applied
+
+
+def init_app(app):
+    @app.cli.command('db-upgrade')
+    def db_upgrade_command():
+        """Apply pending schema migrations to the configured database."""
+        applied = upgrade()
+        for version, description in applied:
+            click.echo(f'Applied migration {version}: {description}')
+        click.echo(f'Database is at version {current_version(db.engine)}')
@@ -1,7 +1,12 @@
+import hashlib
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime
+from money import Cents
+from database import RoutingSession
 
-db = SQLAlchemy()
+# GET requests read through a separate engine (see database.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -12,52 +17,174 @@ class User(db.Model):
     phone = db.Column(db.String(50))
     email = db.Column(db.String(150), unique=True, nullable=False)
     password = db.Column(db.String(150), nullable=False)
+    # Bumped by every write to the user's data; drives ETags and cache keys
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     categories = db.relationship('BudgetCategory', backref='user', lazy=True, cascade='all, delete-orphan')
     
 
-class BudgetCategory(db.Model):
+class SyncMixin:
+    # `version` is the owner's data_version at the row's last write, so
+    # "everything changed since version N" is an index range scan. Both
+    # columns are maintained by changes.py, not by the route handlers.
+    # Synced tables are created with AUTOINCREMENT, so a deleted row's id
+    # (which a client may still hold as a tombstone) is never reused.
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class BudgetCategory(SyncMixin, db.Model):
     __tablename__ = 'budget_categories'
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String, nullable=False)
-    budget = db.Column(db.Float, nullable=False)
+    # Money is stored as integer cents and read back as dollars (see money.py)
+    budget = db.Column('budget_cents', Cents, nullable=False)
     color = db.Column(db.String, nullable=True)
 
     expenses = db.relationship('Expense', backref='category', lazy=True, cascade='all, delete-orphan')
 
-class Expense(db.Model):
+    __table_args__ = (
+        db.Index('ix_budget_categories_user_id', 'user_id'),
+        db.Index('ix_budget_categories_user_id_version', 'user_id', 'version'),
+        {'sqlite_autoincrement': True},
+    )
+
+class Expense(SyncMixin, db.Model):
     __tablename__ = 'expenses'
 
     id = db.Column(db.Integer, primary_key=True)
     category_id = db.Column(db.Integer, db.ForeignKey('budget_categories.id'), nullable=False)
+    # Denormalized from the category so a user's expenses can be listed in
+    # date order straight from ix_expenses_user_id_date.
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String, nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column('amount_cents', Cents, nullable=False)
     date = db.Column(db.Date, nullable=False)
+    # Hash of (user_id, date, amount, name), used to dedupe statement imports
+    fingerprint = db.Column(db.Integer)
+    # Set on expenses materialized from a recurring expense (see scheduler.py);
+    # the unique index lets each bill be materialized at most once a month.
+    recurring_id = db.Column(db.Integer, db.ForeignKey('recurring_expenses.id', ondelete='SET NULL'))
+    period = db.Column(db.String(7))
+    # Set on expenses synced from a bank through Plaid (see plaid_sync.py)
+    plaid_transaction_id = db.Column(db.String(100))
+
+    __table_args__ = (
+        db.Index('ix_expenses_category_id_date', 'category_id', 'date'),
+        db.Index('ix_expenses_user_id_date', 'user_id', 'date'),
+        db.Index('ix_expenses_date', 'date'),
+        db.Index('ix_expenses_user_id_version', 'user_id', 'version'),
+        db.Index('ix_expenses_user_id_fingerprint', 'user_id', 'fingerprint'),
+        db.Index('ux_expenses_recurring_id_period', 'recurring_id', 'period', unique=True),
+        db.Index('ux_expenses_plaid_transaction_id', 'plaid_transaction_id', unique=True),
+        {'sqlite_autoincrement': True},
+    )
+
+
+# Full-text indexes over expense and income names (see search.py). They are
+# contentless FTS5 tables kept in step by triggers, so every write path
+# (ORM, bulk inserts, deletes by cascade) updates them. Each row also
+# carries an "owner" token, u<user_id>, so a search is answered from the
+# index for that user alone. Not mapped, so create_all runs these instead.
+def _search_ddl(table):
+    values = "new.id, new.name, 'u' || new.user_id"
+    old_values = "'delete', old.id, old.name, 'u' || old.user_id"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+        f"name, owner, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+        # Rank by the name only; the owner token matches every row searched
+        f"INSERT INTO {table}_fts ({table}_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {table}_fts (rowid, name, owner) VALUES ({values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {table}_fts ({table}_fts, rowid, name, owner) VALUES ({old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF name, user_id ON {table} BEGIN "
+        f"INSERT INTO {table}_fts ({table}_fts, rowid, name, owner) VALUES ({old_values}); "
+        f"INSERT INTO {table}_fts (rowid, name, owner) VALUES ({values}); END",
+    ]
+
+
+SEARCH_DDL = _search_ddl('expenses') + _search_ddl('incomes')
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for statement in SEARCH_DDL:
+            connection.exec_driver_sql(statement)
+
+
+def expense_fingerprint(user_id, date, amount, name):
+    # Signed 64-bit so it fits an SQLite INTEGER
+    raw = f'{user_id}|{date.isoformat()}|{float(amount):.2f}|{" ".join(name.lower().split())}'
+    return int.from_bytes(hashlib.sha1(raw.encode()).digest()[:8], 'big', signed=True)
+
 
+@event.listens_for(Expense, 'before_insert')
+@event.listens_for(Expense, 'before_update')
+def _set_fingerprint(mapper, connection, target):
+    target.fingerprint = expense_fingerprint(target.user_id, target.date, target.amount, target.name)
 
-class Income(db.Model):
+
+class MonthlyRollup(db.Model):
+    """Sum and count of a user's expenses per category per month (see rollups.py)."""
+    __tablename__ = 'monthly_rollups'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('budget_categories.id'), primary_key=True)
+    year_month = db.Column(db.String(7), primary_key=True)
+    total_cents = db.Column(db.Integer, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_monthly_rollups_user_id_year_month', 'user_id', 'year_month'),
+        db.Index('ix_monthly_rollups_category_id', 'category_id'),
+    )
+
+
+class Income(SyncMixin, db.Model):
     __tablename__ = 'incomes'
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String, nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column('amount_cents', Cents, nullable=False)
     date = db.Column(db.Date, default=datetime.utcnow)
 
-class RecurringExpense(db.Model):
+    __table_args__ = (
+        db.Index('ix_incomes_user_id_date', 'user_id', 'date'),
+        db.Index('ix_incomes_user_id_version', 'user_id', 'version'),
+        # Lets the archive job find old incomes without a scan (see archive.py)
+        db.Index('ix_incomes_date', 'date'),
+        {'sqlite_autoincrement': True},
+    )
+
+class RecurringExpense(SyncMixin, db.Model):
     __tablename__ = 'recurring_expenses'
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String, nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column('amount_cents', Cents, nullable=False)
     category_id = db.Column(db.Integer, db.ForeignKey('budget_categories.id'), nullable=False)
     due_day = db.Column(db.Integer, nullable=False)
+    # Bills are not materialized for due dates before they existed. Rows
+    # created before this column was added have NULL and are always due.
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', backref='recurring_expenses')
-    category = db.relationship('BudgetCategory', backref='recurring_expenses')
+    category = db.relationship(
+        'BudgetCategory', backref=db.backref('recurring_expenses', cascade='all, delete-orphan')
+    )
+
+    __table_args__ = (
+        db.Index('ix_recurring_expenses_user_id_due_day', 'user_id', 'due_day'),
+        db.Index('ix_recurring_expenses_due_day', 'due_day'),
+        db.Index('ix_recurring_expenses_user_id_version', 'user_id', 'version'),
+        {'sqlite_autoincrement': True},
+    )
 
     def to_dict(self):
         return {
@@ -68,3 +195,117 @@ class RecurringExpense(db.Model):
             'category_id': self.category_id,
             'due_day': self.due_day,
         }
+
+
+class Tombstone(db.Model):
+    """Record of a deleted row, kept so delta sync can report deletions."""
+    __tablename__ = 'tombstones'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    table_name = db.Column(db.String, nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_tombstones_user_id_version', 'user_id', 'version'),
+    )
+
+
+class IdempotencyKey(db.Model):
+    """Stored response of a request made with an Idempotency-Key, replayed on retries."""
+    __tablename__ = 'idempotency_keys'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_id_key'),
+    )
+
+
+class JobState(db.Model):
+    """Last successful run of a background job, so it can catch up after downtime."""
+    __tablename__ = 'job_state'
+
+    job = db.Column(db.String(100), primary_key=True)
+    last_run_on = db.Column(db.Date, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PlaidItem(db.Model):
+    """A bank login linked through Plaid Link."""
+    __tablename__ = 'plaid_items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    item_id = db.Column(db.String(100), nullable=False, unique=True)
+    access_token = db.Column(db.String(200), nullable=False)
+    # Position in the item's /transactions/sync stream, None before the first sync
+    cursor = db.Column(db.Text)
+    # Category for synced transactions that no category name matches
+    default_category_id = db.Column(db.Integer, db.ForeignKey('budget_categories.id', ondelete='SET NULL'))
+    synced_at = db.Column(db.DateTime)
+    sync_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_plaid_items_user_id', 'user_id'),
+    )
+
+
+class Forecast(db.Model):
+    """A user's month-end spending forecast, precomputed by the nightly batch (see forecast.py)."""
+    __tablename__ = 'forecasts'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    as_of = db.Column(db.Date, nullable=False)
+    # The user's data_version it was computed from; any later write makes it stale
+    data_version = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class AlertOutbox(db.Model):
+    """A budget alert waiting to be delivered, written in the same transaction
+    as the expense that triggered it (see alerts.py)."""
+    __tablename__ = 'alert_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    category_id = db.Column(db.Integer, nullable=False)
+    year_month = db.Column(db.String(7), nullable=False)
+    # Percent of the budget crossed, e.g. 80 or 100
+    threshold = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    # pending, delivered or failed
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # When a pending alert may next be claimed: its retry time, or the end
+    # of the lease of the worker that is delivering it
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # Each threshold alerts at most once per category per month
+        db.Index('ux_alert_outbox_category_month_threshold', 'category_id', 'year_month', 'threshold', unique=True),
+        db.Index('ix_alert_outbox_pending', 'next_attempt_at', sqlite_where=db.text("status = 'pending'")),
+    )
+
+
+class ArchivedYear(db.Model):
+    """A year of expenses or incomes moved out to <kind>_archive_<year> (see archive.py)."""
+    __tablename__ = 'archived_years'
+
+    # 'expenses' or 'incomes'
+    kind = db.Column(db.String(20), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,55 @@
+"""Money is stored as integer cents and exposed to Python and JSON as dollars.
+
+Columns declared with the Cents type hold an INTEGER number of cents, so
+SQL SUM over them is exact integer arithmetic. Values bound to them may be
+ints, floats, strings or Decimals in dollars and are rounded half up to the
+cent once, on the way in; values read back are floats in dollars with at
+most two decimals, the same shape the API always returned. Code that
+aggregates should stay in cents (see cents() and to_cents()) and convert
+once at the end with to_amount().
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from sqlalchemy import Integer, type_coerce
+from sqlalchemy.types import TypeDecorator
+
+CENT = Decimal('0.01')
+
+
+def to_cents(amount):
+    """Dollars (int, float, str or Decimal) to integer cents. Raises ValueError if not a number."""
+    if isinstance(amount, bool):
+        raise ValueError(f'Not an amount: {amount!r}')
+    try:
+        # str() gives the shortest repr of a float, so 0.1 becomes exactly 10 cents
+        value = Decimal(str(amount).strip()).quantize(CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f'Not an amount: {amount!r}') from None
+    if not value.is_finite():
+        raise ValueError(f'Not an amount: {amount!r}')
+    return int(value * 100)
+
+
+def to_amount(cents):
+    """Integer cents to dollars, as returned in JSON."""
+    return cents / 100 if cents is not None else None
+
+
+def total(amounts):
+    """Exact sum of dollar amounts, in dollars."""
+    return to_amount(sum(to_cents(a) for a in amounts))
+
+
+def cents(expression):
+    """A Cents column or aggregate read as raw integer cents."""
+    return type_coerce(expression, Integer)
+
+
+class Cents(TypeDecorator):
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_cents(value) if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return to_amount(value)
@@ -0,0 +1,114 @@
+import base64
+from datetime import datetime
+from sqlalchemy import literal_column, tuple_, union_all
+from models import db
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def parse_date(value, field):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise PaginationError(f"'{field}' must be a date in YYYY-MM-DD format")
+
+
+def encode_cursor(date, id):
+    raw = f'{date.isoformat()}|{id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date_str, id_str = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.strptime(date_str, '%Y-%m-%d').date(), int(id_str)
+    except ValueError:
+        raise PaginationError("'cursor' is not a valid cursor")
+
+
+def page_args(args):
+    """Read limit/cursor/from/to from a request's query string.
+
+    `limit` is optional for backwards compatibility: without it (and without
+    a cursor) the whole date range is returned, still sorted by the server.
+    """
+    limit = args.get('limit')
+    cursor = args.get('cursor')
+
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise PaginationError("'limit' must be an integer")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise PaginationError(f"'limit' must be between 1 and {MAX_LIMIT}")
+    elif cursor:
+        limit = DEFAULT_LIMIT
+
+    return {
+        'limit': limit,
+        'cursor': decode_cursor(cursor) if cursor else None,
+        'date_from': parse_date(args['from'], 'from') if args.get('from') else None,
+        'date_to': parse_date(args['to'], 'to') if args.get('to') else None,
+    }
+
+
+def _page_filters(date_column, id_column, page):
+    filters = []
+    if page['date_from']:
+        filters.append(date_column >= page['date_from'])
+    if page['date_to']:
+        filters.append(date_column <= page['date_to'])
+    if page['cursor']:
+        filters.append(tuple_(date_column, id_column) < tuple_(*page['cursor']))
+    return filters
+
+
+def _trim(rows, limit):
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(last.date, last.id)
+
+
+def paginate(query, date_column, id_column, page):
+    """Apply date bounds and keyset pagination ordered by (date DESC, id DESC).
+
+    Returns (rows, next_cursor). next_cursor is None on the last page. The
+    caller's query must be filtered on the leading column of a
+    (<owner>, date) index so the ORDER BY and the cursor predicate are both
+    answered by that index.
+    """
+    query = query.filter(*_page_filters(date_column, id_column, page))
+    query = query.order_by(date_column.desc(), id_column.desc())
+
+    limit = page['limit']
+    if limit is None:
+        return query.all(), None
+    return _trim(query.limit(limit + 1).all(), limit)
+
+
+def paginate_union(arms, page):
+    """paginate() over the UNION ALL of several selects of the same rows,
+    e.g. a table and its archives (see archive.py).
+
+    `arms` is a list of (select, date_column, id_column), and each select
+    must label those columns 'date' and 'id'. SQLite merges the arms as
+    they come out of their indexes, so the same index requirement as
+    paginate() applies to each arm, and a page reads about `limit` rows
+    however many arms there are.
+    """
+    selects = [query.where(*_page_filters(d, i, page)) for query, d, i in arms]
+    statement = union_all(*selects) if len(selects) > 1 else selects[0]
+    statement = statement.order_by(literal_column('date').desc(), literal_column('id').desc())
+
+    limit = page['limit']
+    if limit is None:
+        return db.session.execute(statement).all(), None
+    return _trim(db.session.execute(statement.limit(limit + 1)).all(), limit)
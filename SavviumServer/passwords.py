@@ -0,0 +1,129 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from flask import jsonify
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PoolBusy(Exception):
+    """Raised when too many password hashes are already queued or running."""
+
+
+class PasswordHasher:
+    """Runs the deliberately slow password KDF in a bounded process pool.
+
+    Request threads wait on the pool instead of burning CPU (and holding
+    the GIL) themselves, and at most PASSWORD_MAX_PENDING hashes may be
+    queued or running at once: beyond that hash() and verify() raise
+    PoolBusy straight away, which the auth routes answer with a 503. A
+    hash that takes longer than PASSWORD_TIMEOUT raises PoolBusy too.
+
+    Configured with PASSWORD_WORKERS (processes; 0 runs the KDF inline),
+    PASSWORD_MAX_PENDING and PASSWORD_TIMEOUT (seconds).
+    """
+
+    def __init__(self):
+        self.workers = 0
+        self.max_pending = 0
+        self.timeout = None
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_WORKERS', 2)
+        app.config.setdefault('PASSWORD_MAX_PENDING', 16)
+        app.config.setdefault('PASSWORD_TIMEOUT', 10)
+
+        self.workers = app.config['PASSWORD_WORKERS']
+        self.max_pending = app.config['PASSWORD_MAX_PENDING']
+        self.timeout = app.config['PASSWORD_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+        @app.route('/auth/stats', methods=['GET'])
+        def password_stats():
+            return jsonify(self.stats())
+
+    def _pool(self):
+        # Created on first use, so forking servers start their own pool
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolBusy()
+        with self._lock:
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        started = time.perf_counter()
+        if not self.workers:
+            try:
+                return fn(*args)
+            finally:
+                self._finish(started)
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._finish(started)
+            raise
+        # The slot is freed when the job ends, not when the caller stops
+        # waiting for it, so jobs left running by a timeout still count
+        # against PASSWORD_MAX_PENDING.
+        future.add_done_callback(lambda _: self._finish(started))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Drops the job if it has not started yet
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise PoolBusy() from None
+
+    def _finish(self, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+        self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'peak_pending': self.peak_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_ms': round(1000 * self.total_seconds / self.completed, 1) if self.completed else 0.0,
+                'max_ms': round(1000 * self.max_seconds, 1),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,90 @@
+"""A small async client for the Plaid endpoints Savvium uses.
+
+It talks to Plaid's JSON API directly over a shared httpx.AsyncClient
+rather than through plaid-python, whose calls block a thread for the
+whole round trip.
+"""
+
+PLAID_HOSTS = {
+    'sandbox': 'https://sandbox.plaid.com',
+    'development': 'https://development.plaid.com',
+    'production': 'https://production.plaid.com',
+}
+
+# Worth retrying after a backoff; status 0 is a connection error or timeout
+RETRYABLE_STATUSES = {0, 429, 500, 502, 503, 504}
+
+
+class PlaidError(Exception):
+    """An error response from Plaid; `payload` is its JSON body."""
+
+    def __init__(self, status, payload):
+        super().__init__(payload.get('error_message') or f'Plaid returned {status}')
+        self.status = status
+        self.payload = payload
+
+    @property
+    def code(self):
+        return self.payload.get('error_code')
+
+    @property
+    def retryable(self):
+        return self.status in RETRYABLE_STATUSES
+
+
+class PlaidClient:
+    def __init__(self, http, base_url, client_id, secret):
+        self.http = http
+        self.base_url = base_url.rstrip('/')
+        self.client_id = client_id
+        self.secret = secret
+
+    async def _post(self, path, body):
+        try:
+            response = await self.http.post(
+                self.base_url + path,
+                json={'client_id': self.client_id, 'secret': self.secret, **body},
+            )
+        except Exception as e:
+            # The HTTP client's own errors (connect, read timeout, ...) are
+            # reported like a Plaid outage, so callers handle one exception.
+            raise PlaidError(0, {'error_code': 'TRANSPORT_ERROR', 'error_message': repr(e)}) from e
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        if response.status_code >= 400:
+            raise PlaidError(response.status_code, payload)
+        return payload
+
+    async def link_token_create(self, user_id, client_name):
+        return await self._post('/link/token/create', {
+            'user': {'client_user_id': str(user_id)},
+            'client_name': client_name,
+            'products': ['transactions'],
+            'country_codes': ['US'],
+            'language': 'en',
+        })
+
+    async def item_public_token_exchange(self, public_token):
+        return await self._post('/item/public_token/exchange', {'public_token': public_token})
+
+    async def transactions_get(self, access_token, start_date, end_date, count=500, offset=0):
+        return await self._post('/transactions/get', {
+            'access_token': access_token,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'options': {'count': count, 'offset': offset},
+        })
+
+    async def transactions_sync(self, access_token, cursor=None, count=500):
+        body = {'access_token': access_token, 'count': count}
+        if cursor:
+            body['cursor'] = cursor
+        return await self._post('/transactions/sync', body)
+
+
+def client_for(app, http):
+    config = app.config
+    base_url = config['PLAID_BASE_URL'] or PLAID_HOSTS[config['PLAID_ENV']]
+    return PlaidClient(http, base_url, config['PLAID_CLIENT_ID'], config['PLAID_SECRET'])
@@ -0,0 +1,251 @@
+"""Incremental bank transaction sync through Plaid's /transactions/sync.
+
+Each linked item keeps a cursor into Plaid's stream of changes. A sync
+pulls the transactions added, modified and removed since that cursor, one
+page at a time, and applies each page to the owner's expenses together
+with the page's cursor in a single transaction. An interrupted sync
+resumes from the last applied page, and applying a page twice is
+harmless, as expenses are keyed by plaid_transaction_id.
+
+Items are synced concurrently on one event loop, at most
+PLAID_SYNC_CONCURRENCY at a time, with retries and exponential backoff
+on rate limits and outages. HTTP calls overlap; database writes go
+through a single writer thread, as SQLite takes one writer at a time.
+
+Command line usage, e.g. from cron (see fake_plaid.py to run offline):
+
+    flask --app app plaid-sync [--user 1] [--concurrency 16]
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+import click
+from sqlalchemy import select
+from models import db, BudgetCategory, Expense, PlaidItem
+from importer import CategoryRules
+from money import to_amount, to_cents
+import archive
+import ledger
+import plaid
+
+# Plaid's answer when the item changed while we were paging; the whole
+# pagination loop has to start again from its first cursor.
+MUTATION_DURING_PAGINATION = 'TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION'
+# IN lists are kept under SQLite's bound parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+ItemRef = namedtuple('ItemRef', 'id user_id access_token cursor')
+
+log = logging.getLogger(__name__)
+
+# Shared by every sync in the process, so writes never contend with each other
+_writer = ThreadPoolExecutor(1, thread_name_prefix='plaid-sync-db')
+
+
+def load_items(user_id=None):
+    query = db.session.query(PlaidItem.id, PlaidItem.user_id, PlaidItem.access_token, PlaidItem.cursor)
+    if user_id is not None:
+        query = query.filter(PlaidItem.user_id == user_id)
+    return [ItemRef(*row) for row in query.order_by(PlaidItem.id)]
+
+
+def _category_mapper(item):
+    categories = (
+        db.session.query(BudgetCategory.id, BudgetCategory.name)
+        .filter(BudgetCategory.user_id == item.user_id)
+        .all()
+    )
+    return CategoryRules(categories, default_category_id=item.default_category_id)
+
+
+def _expense_values(transaction, mapper):
+    """Expense column values for a Plaid transaction, or None if it is not spending.
+
+    Plaid reports money out as positive amounts. Transactions that no
+    category matches are treated like credits and left out.
+    """
+    if transaction['amount'] <= 0:
+        return None
+    labels = transaction.get('category') or []
+    category_id = mapper.category_for(' '.join([transaction['name'], *labels]))
+    if category_id is None:
+        return None
+    return {
+        'category_id': category_id,
+        'name': transaction['name'],
+        'amount': to_amount(to_cents(transaction['amount'])),
+        'date': date.fromisoformat(transaction['date']),
+    }
+
+
+def _existing_expenses(user_id, transaction_ids):
+    found = {}
+    for start in range(0, len(transaction_ids), LOOKUP_BATCH_SIZE):
+        batch = transaction_ids[start:start + LOOKUP_BATCH_SIZE]
+        # Archived transactions are moved back, so Plaid's changes apply to
+        # them like to any other expense instead of adding a duplicate
+        archive.restore_where('expenses', lambda e: select(e.id).where(
+            e.user_id == user_id, e.plaid_transaction_id.in_(batch)
+        ))
+        for expense in Expense.query.filter(
+            Expense.user_id == user_id, Expense.plaid_transaction_id.in_(batch)
+        ):
+            found[expense.plaid_transaction_id] = expense
+    return found
+
+
+def apply_page(item_id, page):
+    """Apply one /transactions/sync page and store its next_cursor, in one transaction."""
+    item = db.session.get(PlaidItem, item_id)
+    stats = Counter()
+    # Modified entries come after added ones, so the latest version wins
+    changed = {t['transaction_id']: t for t in page['added'] + page['modified']}
+    removed = {t['transaction_id'] for t in page['removed']}
+    for transaction_id in removed:
+        changed.pop(transaction_id, None)
+    existing = _existing_expenses(item.user_id, list(changed) + list(removed))
+
+    mapper = _category_mapper(item)
+    new_rows = []
+    for transaction_id, transaction in changed.items():
+        values = _expense_values(transaction, mapper)
+        expense = existing.get(transaction_id)
+        if values is None:
+            if expense is not None:
+                db.session.delete(expense)
+                stats['removed'] += 1
+            else:
+                stats['skipped'] += 1
+        elif expense is None:
+            new_rows.append(dict(values, plaid_transaction_id=transaction_id))
+            stats['added'] += 1
+        else:
+            # The category is left alone, in case the user changed it
+            expense.name = values['name']
+            expense.amount = values['amount']
+            expense.date = values['date']
+            stats['modified'] += 1
+    for transaction_id in removed:
+        if transaction_id in existing:
+            db.session.delete(existing[transaction_id])
+            stats['removed'] += 1
+
+    db.session.flush()
+    ledger.insert_expenses(item.user_id, new_rows)
+    item.cursor = page['next_cursor']
+    item.synced_at = datetime.utcnow()
+    item.sync_error = None
+    db.session.commit()
+    return stats
+
+
+def record_error(item_id, message):
+    item = db.session.get(PlaidItem, item_id)
+    item.sync_error = message
+    db.session.commit()
+
+
+class PlaidSync:
+    def __init__(self, app, http, concurrency=None):
+        config = app.config
+        self.app = app
+        self.client = plaid.client_for(app, http)
+        self.concurrency = concurrency or config['PLAID_SYNC_CONCURRENCY']
+        self.page_size = config['PLAID_SYNC_PAGE_SIZE']
+        self.max_attempts = config['PLAID_SYNC_MAX_ATTEMPTS']
+        self.backoff = config['PLAID_SYNC_BACKOFF']
+
+    async def run(self, user_id=None):
+        """Sync every item (or one user's items) and return totals for the run."""
+        started = time.perf_counter()
+        items = await self._write(load_items, user_id)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(item):
+            async with semaphore:
+                return await self.sync_item(item)
+
+        totals = Counter(dict.fromkeys(['failed', 'added', 'modified', 'removed', 'skipped'], 0))
+        totals['items'] = len(items)
+        for stats in await asyncio.gather(*(bounded(item) for item in items)):
+            totals.update(stats)
+        totals['seconds'] = round(time.perf_counter() - started, 2)
+        return dict(totals)
+
+    async def sync_item(self, item):
+        try:
+            return await self._sync_pages(item)
+        except plaid.PlaidError as e:
+            log.warning('Plaid sync of item %s failed: %s', item.id, e)
+            await self._write(record_error, item.id, str(e))
+            return Counter({'failed': 1})
+
+    async def _sync_pages(self, item):
+        stats = Counter()
+        cursor = item.cursor
+        restarts = 0
+        while True:
+            try:
+                page = await self._call(self.client.transactions_sync, item.access_token, cursor, self.page_size)
+            except plaid.PlaidError as e:
+                if e.code != MUTATION_DURING_PAGINATION or restarts >= self.max_attempts:
+                    raise
+                # Pages already applied are applied again, which is harmless
+                restarts += 1
+                cursor = item.cursor
+                continue
+            stats.update(await self._write(apply_page, item.id, page))
+            cursor = page['next_cursor']
+            if not page['has_more']:
+                return stats
+
+    async def _call(self, method, *args):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return await method(*args)
+            except plaid.PlaidError as e:
+                if not e.retryable or attempt == self.max_attempts:
+                    raise
+                # Full jitter, so items throttled together do not retry together
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                log.info('Plaid returned %s (%s), retrying in %.2fs', e.status, e.code, delay)
+                await asyncio.sleep(delay)
+
+    def _write(self, function, *args):
+        def in_app_context():
+            with self.app.app_context():
+                return function(*args)
+        return asyncio.get_running_loop().run_in_executor(_writer, in_app_context)
+
+
+def init_app(app):
+    app.config.setdefault('PLAID_SYNC_CONCURRENCY', 8)
+    # Transactions per /transactions/sync page (Plaid allows up to 500)
+    app.config.setdefault('PLAID_SYNC_PAGE_SIZE', 500)
+    app.config.setdefault('PLAID_SYNC_MAX_ATTEMPTS', 5)
+    # Seconds; the nth retry waits up to BACKOFF * 2**n
+    app.config.setdefault('PLAID_SYNC_BACKOFF', 0.5)
+
+    @app.cli.command('plaid-sync')
+    @click.option('--user', 'user_id', type=int, help='Only sync this user\'s items.')
+    @click.option('--concurrency', type=int, help='Items synced at once.')
+    def plaid_sync_command(user_id, concurrency):
+        """Pull new, changed and removed bank transactions from Plaid."""
+        from aio import http_client
+
+        async def run():
+            try:
+                http = http_client(app.config)
+            except ImportError:
+                raise click.ClickException('plaid-sync needs httpx: pip install httpx')
+            try:
+                return await PlaidSync(app, http, concurrency).run(user_id)
+            finally:
+                await http.aclose()
+
+        click.echo(json.dumps(asyncio.run(run())))
@@ -0,0 +1,166 @@
+import calendar
+from datetime import date
+from sqlalchemy import func, select
+from models import db, BudgetCategory, RecurringExpense
+import serializers
+import rollups
+import archive
+from money import cents, to_amount
+
+PERIOD_FORMATS = {
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+}
+
+
+def _date_bounds(column, date_from, date_to):
+    bounds = []
+    if date_from:
+        bounds.append(column >= date_from)
+    if date_to:
+        bounds.append(column <= date_to)
+    return bounds
+
+
+def category_totals(user_id, date_from=None, date_to=None):
+    """Spent total and expense count per category of a user.
+
+    Sums come from the monthly rollups (see rollups.py), so the cost is
+    proportional to the number of categories and months rather than the
+    number of expenses. Categories with no expenses in the range are
+    included with a zero total.
+    """
+    categories = (
+        db.session.query(
+            BudgetCategory.id,
+            BudgetCategory.name,
+            cents(BudgetCategory.budget).label('budget'),
+            BudgetCategory.color,
+        )
+        .filter(BudgetCategory.user_id == user_id)
+        .order_by(BudgetCategory.id)
+        .all()
+    )
+    sums = rollups.totals(user_id, date_from, date_to, by_category=True)
+    result = []
+    for c in categories:
+        spent, count = sums.get((c.id,), (0, 0))
+        result.append({
+            "id": c.id,
+            "name": c.name,
+            "budget": to_amount(c.budget),
+            "color": c.color,
+            "spent": to_amount(spent),
+            "count": count,
+            "remaining": to_amount(c.budget - spent),
+        })
+    return result
+
+
+def spending_by_period(user_id, period, date_from=None, date_to=None, by_category=False):
+    """Expense sums per day or month (optionally split by category).
+
+    Monthly sums are read from the rollups; daily ones are a GROUP BY over
+    the user's expenses in the range, archived ones included.
+    """
+    if period == 'month':
+        return _spending_by_month(user_id, date_from, date_to, by_category)
+
+    def build(source):
+        bucket = func.strftime(PERIOD_FORMATS[period], source.date).label('period')
+        columns = [bucket]
+        group_by = [bucket]
+        if by_category:
+            columns += [BudgetCategory.id.label('category_id'), BudgetCategory.name.label('category_name')]
+            group_by.append(BudgetCategory.id)
+        return (
+            select(*columns, cents(func.sum(source.amount)).label('total'), func.count(source.id).label('count'))
+            .join(BudgetCategory, source.category_id == BudgetCategory.id)
+            .where(source.user_id == user_id, *_date_bounds(source.date, date_from, date_to))
+            .group_by(*group_by)
+        )
+
+    # A day can have rows in both the hot table and an archive
+    sums = {}
+    for r in db.session.execute(archive.union('expenses', build, date_from, date_to)):
+        key = (r.period, r.category_id, r.category_name) if by_category else (r.period,)
+        total, count = sums.get(key, (0, 0))
+        sums[key] = (total + r.total, count + r.count)
+
+    result = []
+    for key in sorted(sums):
+        total, count = sums[key]
+        row = {"period": key[0], "total": to_amount(total), "count": count}
+        if by_category:
+            row["category_id"] = key[1]
+            row["category_name"] = key[2]
+        result.append(row)
+    return result
+
+
+def _spending_by_month(user_id, date_from, date_to, by_category):
+    sums = rollups.totals(user_id, date_from, date_to, by_month=True, by_category=by_category)
+    names = {}
+    if by_category:
+        names = dict(
+            db.session.query(BudgetCategory.id, BudgetCategory.name).filter(BudgetCategory.user_id == user_id).all()
+        )
+
+    result = []
+    for key in sorted(sums):
+        total, count = sums[key]
+        row = {"period": key[0], "total": to_amount(total), "count": count}
+        if by_category:
+            row["category_id"] = key[1]
+            row["category_name"] = names.get(key[1])
+        result.append(row)
+    return result
+
+
+def _first_page(limit):
+    return {'limit': limit, 'cursor': None, 'date_from': None, 'date_to': None}
+
+
+def recent_expenses(user_id, limit):
+    rows, _ = archive.paginate(
+        'expenses', lambda e: serializers.expense_select(e).where(e.user_id == user_id), _first_page(limit)
+    )
+    return [serializers.expense_to_dict(r) for r in rows]
+
+
+def recent_incomes(user_id, limit):
+    rows, _ = archive.paginate(
+        'incomes', lambda i: serializers.income_select(i).where(i.user_id == user_id), _first_page(limit)
+    )
+    return [serializers.income_to_dict(r) for r in rows]
+
+
+def income_total(user_id):
+    statement = archive.union(
+        'incomes', lambda i: select(cents(func.coalesce(func.sum(i.amount), 0))).where(i.user_id == user_id)
+    )
+    return to_amount(sum(db.session.execute(statement).scalars()))
+
+
+def due_date_in_month(due_day, year, month):
+    # A due_day of 29-31 falls on the last day of shorter months
+    return date(year, month, min(due_day, calendar.monthrange(year, month)[1]))
+
+
+def next_due_date(due_day, today):
+    due = due_date_in_month(due_day, today.year, today.month)
+    if due >= today:
+        return due
+    year, month = (today.year + 1, 1) if today.month == 12 else (today.year, today.month + 1)
+    return due_date_in_month(due_day, year, month)
+
+
+def upcoming_recurring(user_id, today):
+    """A user's recurring bills ordered by their next due date."""
+    rows = serializers.recurring_query().filter(RecurringExpense.user_id == user_id).all()
+    bills = []
+    for r in rows:
+        bill = serializers.recurring_to_dict(r)
+        bill["next_due"] = next_due_date(r.due_day, today).isoformat()
+        bills.append(bill)
+    return sorted(bills, key=lambda b: (b["next_due"], b["id"]))
@@ -0,0 +1,275 @@
+"""Monthly spending rollups, kept in step with the expenses table.
+
+monthly_rollups holds the sum and count of a user's expenses per
+(category, month). Every write path adjusts it in the same transaction as
+the expense rows: ORM inserts, updates and deletes through the
+before_flush hook below, and statement-level bulk inserts through
+ledger.py. Reports read whole months from it instead of rescanning the
+user's expenses. Archiving old expenses (see archive.py) leaves it as it
+is, so archived months keep their totals.
+"""
+from collections import defaultdict
+from datetime import timedelta
+import click
+from sqlalchemy import bindparam, delete, event, inspect, select, union_all
+from sqlalchemy.dialects.sqlite import insert
+from models import db, ArchivedYear, BudgetCategory, Expense, MonthlyRollup
+from money import cents, to_cents, to_amount
+import alerts
+import archive
+
+rollups = MonthlyRollup.__table__
+
+
+def year_month(day):
+    return day.strftime('%Y-%m')
+
+
+def add_rows(deltas, user_id, rows, sign=1):
+    """Accumulate expense rows (dicts or rows with category_id, date, amount) into `deltas`."""
+    for row in rows:
+        if isinstance(row, dict):
+            category_id, day, amount = row['category_id'], row['date'], row['amount']
+        else:
+            category_id, day, amount = row.category_id, row.date, row.amount
+        delta = deltas[(user_id, category_id, year_month(day))]
+        delta[0] += sign * to_cents(amount)
+        delta[1] += sign
+
+
+def new_deltas():
+    # (user_id, category_id, year_month) -> [cents, count]
+    return defaultdict(lambda: [0, 0])
+
+
+def apply(connection, deltas):
+    """Upsert accumulated (total, count) deltas, dropping months left empty,
+    and queue any budget alerts the new totals trigger."""
+    changed = [
+        {'user_id': u, 'category_id': c, 'year_month': m, 'total_cents': total, 'count': count}
+        for (u, c, m), (total, count) in deltas.items()
+        if count or total
+    ]
+    if not changed:
+        return
+    stmt = insert(rollups)
+    connection.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[rollups.c.user_id, rollups.c.category_id, rollups.c.year_month],
+            set_={
+                'total_cents': rollups.c.total_cents + stmt.excluded.total_cents,
+                'count': rollups.c.count + stmt.excluded.count,
+            },
+        ),
+        changed,
+    )
+    connection.execute(
+        delete(rollups).where(
+            rollups.c.user_id == bindparam('u'),
+            rollups.c.category_id == bindparam('c'),
+            rollups.c.year_month == bindparam('m'),
+            rollups.c.count <= 0,
+        ),
+        [{'u': r['user_id'], 'c': r['category_id'], 'm': r['year_month']} for r in changed],
+    )
+    alerts.check(connection, deltas)
+
+
+def _old_values(session, obj):
+    # Values as last flushed, from attribute history where it was loaded
+    state = inspect(obj)
+    old = {}
+    for name in ('user_id', 'category_id', 'date', 'amount'):
+        history = state.attrs[name].history
+        if history.deleted:
+            old[name] = history.deleted[0]
+        elif history.unchanged:
+            old[name] = history.unchanged[0]
+        else:
+            row = session.connection().execute(
+                select(Expense.user_id, Expense.category_id, Expense.date, Expense.amount).where(Expense.id == obj.id)
+            ).one()
+            return row._asdict()
+    return old
+
+
+def _before_flush(session, flush_context, instances):
+    deltas = new_deltas()
+    # A deleted category takes its rollups with it; its cascaded expenses
+    # need no separate adjustment.
+    dropped = {obj.id for obj in session.deleted if isinstance(obj, BudgetCategory)}
+
+    for obj in session.new:
+        if isinstance(obj, Expense):
+            add_rows(deltas, obj.user_id, [obj])
+    for obj in session.dirty:
+        if isinstance(obj, Expense) and session.is_modified(obj):
+            state = inspect(obj)
+            if not any(state.attrs[n].history.has_changes() for n in ('user_id', 'category_id', 'date', 'amount')):
+                continue
+            old = _old_values(session, obj)
+            add_rows(deltas, old['user_id'], [old], sign=-1)
+            add_rows(deltas, obj.user_id, [obj])
+    for obj in session.deleted:
+        if isinstance(obj, Expense) and obj.category_id not in dropped:
+            add_rows(deltas, obj.user_id, [_old_values(session, obj)], sign=-1)
+
+    if deltas or dropped:
+        connection = session.connection()
+        apply(connection, deltas)
+        if dropped:
+            connection.execute(delete(rollups).where(rollups.c.category_id.in_(dropped)))
+
+
+def totals(user_id, date_from=None, date_to=None, by_month=False, by_category=False):
+    """Expense sum and count for a user between two dates, grouped as asked.
+
+    Returns {key: (cents, count)} where key is a tuple of (year_month,) if
+    by_month and (category_id,) if by_category, in that order. Whole
+    months are read from monthly_rollups; only the partial months at either
+    end of the range are summed from the expenses themselves, archived
+    ones included.
+    """
+    whole_from, whole_to, edges = _split_range(date_from, date_to)
+    result = defaultdict(lambda: [0, 0])
+
+    if whole_from is None or whole_to is None or whole_from <= whole_to:
+        keys = ([rollups.c.year_month] if by_month else []) + ([rollups.c.category_id] if by_category else [])
+        query = select(*keys, db.func.sum(rollups.c.total_cents), db.func.sum(rollups.c.count)).where(
+            rollups.c.user_id == user_id
+        )
+        if whole_from:
+            query = query.where(rollups.c.year_month >= year_month(whole_from))
+        if whole_to:
+            query = query.where(rollups.c.year_month <= year_month(whole_to))
+        if keys:
+            query = query.group_by(*keys)
+        for *key, total, count in db.session.execute(query):
+            if count:
+                result[tuple(key)][0] += total
+                result[tuple(key)][1] += count
+
+    def edge(lo, hi):
+        def build(source):
+            month = db.func.strftime('%Y-%m', source.date)
+            keys = ([month] if by_month else []) + ([source.category_id] if by_category else [])
+            query = select(*keys, cents(db.func.sum(source.amount)), db.func.count(source.id)).where(
+                source.user_id == user_id, source.date >= lo, source.date <= hi
+            )
+            return query.group_by(*keys) if keys else query
+        return archive.union('expenses', build, lo, hi)
+
+    for lo, hi in edges:
+        for *key, total, count in db.session.execute(edge(lo, hi)):
+            if count:
+                result[tuple(key)][0] += total
+                result[tuple(key)][1] += count
+
+    return {key: (total, count) for key, (total, count) in result.items()}
+
+
+def _month_end(day):
+    next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+def _split_range(date_from, date_to):
+    # (first whole-month day, last whole-month day, [partial (lo, hi) ranges])
+    edges = []
+    lo, hi = date_from, date_to
+    if date_from and date_from.day != 1:
+        end = _month_end(date_from)
+        edges.append((date_from, min(end, date_to) if date_to else end))
+        lo = end + timedelta(days=1)
+    if date_to and date_to != _month_end(date_to):
+        start = date_to.replace(day=1)
+        if lo is None or start >= lo:
+            edges.append((start, date_to))
+        hi = start - timedelta(days=1)
+    return lo, hi, edges
+
+
+def _aggregate(connection, user_id=None):
+    # Sum and count per (user_id, category_id, year_month) over the
+    # expenses and their archives
+    years = connection.execute(
+        select(ArchivedYear.year).where(ArchivedYear.kind == 'expenses')
+    ).scalars().all()
+    selects = []
+    for source in [Expense] + [archive.entity('expenses', year) for year in years]:
+        month = db.func.strftime('%Y-%m', source.date)
+        query = select(
+            source.user_id.label('user_id'),
+            source.category_id.label('category_id'),
+            month.label('year_month'),
+            cents(source.amount).label('amount_cents'),
+        )
+        if user_id is not None:
+            query = query.where(source.user_id == user_id)
+        selects.append(query)
+    rows = union_all(*selects).subquery()
+    return select(
+        rows.c.user_id, rows.c.category_id, rows.c.year_month,
+        db.func.sum(rows.c.amount_cents), db.func.count(),
+    ).group_by(rows.c.user_id, rows.c.category_id, rows.c.year_month)
+
+
+def rebuild(connection, user_id=None):
+    """Recompute the rollups (of one user, or everyone) from the expenses and their archives."""
+    if user_id is None:
+        connection.execute(delete(rollups))
+    else:
+        connection.execute(delete(rollups).where(rollups.c.user_id == user_id))
+    connection.execute(
+        insert(rollups).from_select(
+            ['user_id', 'category_id', 'year_month', 'total_cents', 'count'], _aggregate(connection, user_id)
+        )
+    )
+
+
+def verify(connection, user_id=None):
+    """Compare the rollups with a fresh aggregate of the expenses and their archives.
+
+    Returns a list of (key, expected (cents, count), stored (cents, count))
+    for every (user_id, category_id, year_month) that differs. Both sides
+    are integers, so any difference at all is a mismatch.
+    """
+    stored_query = select(
+        rollups.c.user_id, rollups.c.category_id, rollups.c.year_month, rollups.c.total_cents, rollups.c.count
+    )
+    if user_id is not None:
+        stored_query = stored_query.where(rollups.c.user_id == user_id)
+
+    expected = {(u, c, m): (t, n) for u, c, m, t, n in connection.execute(_aggregate(connection, user_id))}
+    stored = {(u, c, m): (t, n) for u, c, m, t, n in connection.execute(stored_query)}
+    mismatches = []
+    for key in sorted(expected.keys() | stored.keys()):
+        want, got = expected.get(key, (0, 0)), stored.get(key, (0, 0))
+        if want != got:
+            mismatches.append((key, want, got))
+    return mismatches
+
+
+def init_app(app):
+    if not event.contains(db.session, 'before_flush', _before_flush):
+        event.listen(db.session, 'before_flush', _before_flush)
+
+    @app.cli.command('rollup-rebuild')
+    @click.option('--user', 'user_id', type=int, help='Only rebuild this user.')
+    def rollup_rebuild_command(user_id):
+        """Recompute monthly_rollups from the expenses, archived ones included."""
+        with db.engine.begin() as conn:
+            rebuild(conn, user_id)
+        click.echo('Monthly rollups rebuilt.')
+
+    @app.cli.command('rollup-verify')
+    @click.option('--user', 'user_id', type=int, help='Only verify this user.')
+    def rollup_verify_command(user_id):
+        """Fail if monthly_rollups disagrees with the expenses, archived ones included."""
+        with db.engine.connect() as conn:
+            mismatches = verify(conn, user_id)
+        for (u, c, m), want, got in mismatches:
+            click.echo(f'user {u} category {c} {m}: expected {to_amount(want[0]):.2f} ({want[1]}), stored {to_amount(got[0]):.2f} ({got[1]})')
+        if mismatches:
+            raise SystemExit(1)
+        click.echo('Monthly rollups match the expenses and their archives.')
@@ -0,0 +1,158 @@
+"""Materialize recurring expenses into expense rows as they fall due.
+
+Each run processes every day from the last recorded run up to today, so
+a server that was down over a due date catches up on its next run. For a
+given day only the bills due that day are read (through the due_day
+index), and an expense is created per bill per month at most once, so
+runs can overlap or repeat safely.
+"""
+import calendar
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import select
+from models import db, BudgetCategory, JobState, RecurringExpense
+import archive
+import ledger
+
+JOB_NAME = 'materialize-recurring'
+BATCH_SIZE = 500
+# Longest gap a single run catches up on
+MAX_CATCH_UP_DAYS = 366
+
+log = logging.getLogger(__name__)
+
+
+def due_days_on(day):
+    """The due_day values that fall due on `day`.
+
+    A due_day of 29-31 falls on the last day of shorter months, so on the
+    last day of a month every due_day from that day to 31 is due.
+    """
+    last_day = calendar.monthrange(day.year, day.month)[1]
+    if day.day == last_day:
+        return list(range(day.day, 32))
+    return [day.day]
+
+
+def materialize_day(day, batch_size=BATCH_SIZE):
+    """Create the expenses due on `day`, one batch of bills per transaction."""
+    period = day.strftime('%Y-%m')
+    created = 0
+    last_id = 0
+    while True:
+        bills = (
+            db.session.query(
+                RecurringExpense.id,
+                RecurringExpense.user_id,
+                RecurringExpense.category_id,
+                RecurringExpense.name,
+                RecurringExpense.amount,
+                RecurringExpense.created_at,
+            )
+            # Bills stored before categories were checked may point at
+            # another user's category; those are skipped
+            .join(BudgetCategory, BudgetCategory.id == RecurringExpense.category_id)
+            .filter(RecurringExpense.due_day.in_(due_days_on(day)), RecurringExpense.id > last_id,
+                    BudgetCategory.user_id == RecurringExpense.user_id)
+            .order_by(RecurringExpense.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not bills:
+            return created
+        last_id = bills[-1].id
+
+        bills = [b for b in bills if b.created_at is None or b.created_at.date() <= day]
+        # A catch-up run can reach back past the archive horizon
+        done = set(db.session.execute(archive.union('expenses', lambda e: select(e.recurring_id).where(
+            e.recurring_id.in_([b.id for b in bills]), e.period == period
+        ), day, day)).scalars()) if bills else set()
+
+        rows_by_user = defaultdict(list)
+        for b in bills:
+            if b.id not in done:
+                rows_by_user[b.user_id].append({
+                    'category_id': b.category_id,
+                    'name': b.name,
+                    'amount': b.amount,
+                    'date': day,
+                    'recurring_id': b.id,
+                    'period': period,
+                })
+        for user_id, rows in rows_by_user.items():
+            created += ledger.materialize_expenses(user_id, rows)
+        db.session.commit()
+
+
+def run_due(today=None, batch_size=BATCH_SIZE):
+    """Materialize everything due since the last run, up to and including today.
+
+    The last run's day is processed again, which picks up bills added
+    later that day. The first run only processes today.
+    """
+    today = today or datetime.utcnow().date()
+    state = db.session.get(JobState, JOB_NAME)
+    start = today
+    if state is not None:
+        start = min(today, max(state.last_run_on, today - timedelta(days=MAX_CATCH_UP_DAYS)))
+
+    created = 0
+    day = start
+    while day <= today:
+        created += materialize_day(day, batch_size)
+        day += timedelta(days=1)
+
+    state = db.session.get(JobState, JOB_NAME)
+    if state is None:
+        state = JobState(job=JOB_NAME, last_run_on=today)
+        db.session.add(state)
+    state.last_run_on = max(state.last_run_on, today)
+    db.session.commit()
+    return {'from': start.isoformat(), 'to': today.isoformat(), 'created': created}
+
+
+def _loop(app, stop, interval):
+    while True:
+        with app.app_context():
+            try:
+                result = run_due()
+                if result['created']:
+                    log.info('Materialized %(created)d recurring expenses (%(from)s to %(to)s)', result)
+            except Exception:
+                db.session.rollback()
+                log.exception('Recurring expense materialization failed')
+        if stop.wait(interval):
+            return
+
+
+def start(app, use_reloader=False):
+    """Run the job in a daemon thread every RECURRING_INTERVAL seconds.
+
+    Returns the event that stops the thread, or None when the scheduler is
+    disabled. With the reloader only the serving child process runs it.
+    """
+    if not app.config['RECURRING_SCHEDULER']:
+        return None
+    if use_reloader and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return None
+    stop = threading.Event()
+    threading.Thread(
+        target=_loop, args=(app, stop, app.config['RECURRING_INTERVAL']), name=JOB_NAME, daemon=True
+    ).start()
+    return stop
+
+
+def init_app(app):
+    app.config.setdefault('RECURRING_SCHEDULER', True)
+    app.config.setdefault('RECURRING_INTERVAL', 3600)
+
+    @app.cli.command('materialize-recurring')
+    @click.option('--date', 'today', type=click.DateTime(formats=['%Y-%m-%d']), help='Run as of this day.')
+    def materialize_recurring_command(today):
+        """Create expenses for recurring bills due since the last run."""
+        result = run_due(today.date() if today else None)
+        click.echo(f"Created {result['created']} expenses for {result['from']} to {result['to']}")
@@ -0,0 +1,121 @@
+"""Full-text search over a user's expense and income names.
+
+Queries run against the FTS5 indexes created in models.SEARCH_DDL. The
+index holds an owner token per row, so MATCH narrows to one user's rows
+inside the index and only the matching rows are read from the tables.
+Archived rows stay in the index (see archive.py): the matches are joined
+to the hot table and the archived years the date range overlaps, as one
+UNION ALL. Results are ranked by bm25 and paginated with a (rank, id) keyset
+cursor.
+"""
+import base64
+import re
+import click
+from sqlalchemy import and_, column, literal_column, or_, select, table
+from models import db
+from pagination import DEFAULT_LIMIT, PaginationError
+import archive
+import serializers
+
+# Words beyond this are ignored; a longer query only narrows the results
+MAX_TERMS = 8
+
+# kind -> (index, select of a source's rows, row serializer)
+INDEXES = {
+    'expenses': (
+        table('expenses_fts', column('rowid'), column('rank')),
+        serializers.expense_select,
+        serializers.expense_to_dict,
+    ),
+    'incomes': (
+        table('incomes_fts', column('rowid'), column('rank')),
+        serializers.income_select,
+        serializers.income_to_dict,
+    ),
+}
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def match_expression(user_id, text):
+    """An FTS5 query matching rows of `user_id` whose name has every word of
+    `text` as a prefix, e.g. "cof sho" finds "Coffee shop".
+
+    Words are quoted, so FTS5 operators in the input are taken literally.
+    """
+    terms = WORD.findall(text)[:MAX_TERMS]
+    if not terms:
+        raise PaginationError("'q' must contain at least one word")
+    phrases = ' '.join(f'"{term}"*' for term in terms)
+    return f'{{owner}}: u{int(user_id)} AND {{name}}: ({phrases})'
+
+
+def encode_cursor(rank, id):
+    raw = f'{rank!r}|{id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rank, id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return float(rank), int(id)
+    except ValueError:
+        raise PaginationError("'cursor' is not a valid cursor")
+
+
+def search(user_id, text, kind='expenses', category_id=None, date_from=None, date_to=None,
+           limit=DEFAULT_LIMIT, cursor=None):
+    """Return (rows, next_cursor) for a user's best matches, best first.
+
+    Rows are serialized like the matching list endpoint's. `category_id`
+    only applies to expenses.
+    """
+    fts, select_rows, to_dict = INDEXES[kind]
+    # The index is searched once, and every source joins the hits by id
+    hits = select(fts.c.rowid.label('id'), fts.c.rank.label('rank')).where(
+        literal_column(fts.name).op('MATCH')(match_expression(user_id, text))
+    )
+    if cursor:
+        rank, last_id = cursor
+        hits = hits.where(or_(fts.c.rank > rank, and_(fts.c.rank == rank, fts.c.rowid > last_id)))
+    hits = hits.cte('hits').prefix_with('MATERIALIZED')
+
+    def build(source):
+        query = select_rows(source).add_columns(hits.c.rank).join(hits, hits.c.id == source.id)
+        if category_id is not None:
+            query = query.where(source.category_id == category_id)
+        if date_from:
+            query = query.where(source.date >= date_from)
+        if date_to:
+            query = query.where(source.date <= date_to)
+        return query
+
+    statement = archive.union(kind, build, date_from, date_to)
+    statement = statement.order_by(literal_column('rank'), literal_column('id')).limit(limit + 1)
+    rows = db.session.execute(statement).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].rank, rows[-1].id)
+    return [to_dict(row) for row in rows], next_cursor
+
+
+def rebuild(connection):
+    """Re-index every expense and income name, archived ones included, e.g. after restoring a backup."""
+    for name in INDEXES:
+        connection.exec_driver_sql(f"INSERT INTO {name}_fts ({name}_fts) VALUES ('delete-all')")
+        connection.exec_driver_sql(
+            f"INSERT INTO {name}_fts (rowid, name, owner) SELECT id, name, 'u' || user_id FROM {name}"
+        )
+        for year in archive.years(name):
+            connection.execute(archive.search_index(name, year))
+
+
+def init_app(app):
+    @app.cli.command('search-rebuild')
+    def search_rebuild_command():
+        """Rebuild the full-text indexes over expense and income names."""
+        rebuild(db.session.connection())
+        db.session.commit()
+        click.echo('Search indexes rebuilt.')
@@ -0,0 +1,124 @@
+from sqlalchemy import select
+from models import db, BudgetCategory, Expense, Income, RecurringExpense
+
+# Shared read path for the list endpoints. Queries select plain columns
+# instead of ORM entities, so rows skip identity-map hydration and there is
+# no relationship to lazy load (e.g. expense.category.name was one extra
+# SELECT per expense). The category name comes from a join in the same
+# statement.
+
+CATEGORY_COLUMNS = (
+    BudgetCategory.id,
+    BudgetCategory.user_id,
+    BudgetCategory.name,
+    BudgetCategory.budget,
+    BudgetCategory.color,
+)
+
+EXPENSE_COLUMNS = (
+    Expense.id,
+    Expense.category_id,
+    Expense.name,
+    Expense.amount,
+    Expense.date,
+    BudgetCategory.name.label('category_name'),
+)
+
+INCOME_COLUMNS = (
+    Income.id,
+    Income.user_id,
+    Income.name,
+    Income.amount,
+    Income.date,
+)
+
+RECURRING_COLUMNS = (
+    RecurringExpense.id,
+    RecurringExpense.user_id,
+    RecurringExpense.name,
+    RecurringExpense.amount,
+    RecurringExpense.category_id,
+    RecurringExpense.due_day,
+)
+
+
+def category_query():
+    return db.session.query(*CATEGORY_COLUMNS)
+
+
+def expense_query():
+    return db.session.query(*EXPENSE_COLUMNS).join(BudgetCategory, Expense.category_id == BudgetCategory.id)
+
+
+def income_query():
+    return db.session.query(*INCOME_COLUMNS)
+
+
+def recurring_query():
+    return db.session.query(*RECURRING_COLUMNS)
+
+
+# The same rows as selects over `source`: Expense or Income, or an archived
+# year of them (see archive.py). Columns are labelled so a UNION ALL of
+# several sources can be ordered by name.
+def expense_select(source=Expense):
+    return select(
+        source.id.label('id'),
+        source.category_id.label('category_id'),
+        source.name.label('name'),
+        source.amount.label('amount'),
+        source.date.label('date'),
+        BudgetCategory.name.label('category_name'),
+    ).join(BudgetCategory, source.category_id == BudgetCategory.id)
+
+
+def income_select(source=Income):
+    return select(
+        source.id.label('id'),
+        source.user_id.label('user_id'),
+        source.name.label('name'),
+        source.amount.label('amount'),
+        source.date.label('date'),
+    )
+
+
+def category_to_dict(row):
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "name": row.name,
+        "budget": row.budget,
+        "color": row.color,
+    }
+
+
+def expense_to_dict(row):
+    return {
+        "id": row.id,
+        "category_id": row.category_id,
+        "name": row.name,
+        "amount": row.amount,
+        "category_name": row.category_name,
+        "date": row.date.isoformat(),
+    }
+
+
+def income_to_dict(row):
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "name": row.name,
+        "amount": row.amount,
+        "date": row.date.isoformat() if row.date else None,
+    }
+
+
+def recurring_to_dict(row):
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "name": row.name,
+        "amount": row.amount,
+        "category_id": row.category_id,
+        "due_day": row.due_day,
+    }
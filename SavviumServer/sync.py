@@ -0,0 +1,71 @@
+from sqlalchemy import literal_column
+from models import db, User, BudgetCategory, Expense, Income, RecurringExpense, Tombstone
+import archive
+import serializers
+
+# (response key, model, column query, row serializer) for every synced
+# table. Tables that can be archived (see archive.py) have a select that
+# takes the source to read instead.
+SYNC_TABLES = (
+    ('categories', BudgetCategory, serializers.category_query, serializers.category_to_dict),
+    ('expenses', Expense, serializers.expense_select, serializers.expense_to_dict),
+    ('incomes', Income, serializers.income_select, serializers.income_to_dict),
+    ('recurring_expenses', RecurringExpense, serializers.recurring_query, serializers.recurring_to_dict),
+)
+
+
+def _changed(query, source, user_id, since):
+    query = query.add_columns(source.version.label('version')).filter(source.user_id == user_id)
+    # Rows written before versioning existed have version 0
+    if since > 0:
+        query = query.filter(source.version > since)
+    return query
+
+
+def changes_since(user_id, since):
+    """Rows of a user created, updated or deleted after version `since`.
+
+    Versions are the user's data_version (see changes.py), so the returned
+    sync_token is simply the current data_version and the next call passes
+    it back as `since`. since=0 returns a full snapshot. Archived rows are
+    included: they keep the version of their last write, so one archived
+    after a client's last sync still reaches it. Returns None for an
+    unknown user.
+    """
+    sync_token = db.session.query(User.data_version).filter(User.id == user_id).scalar()
+    if sync_token is None:
+        return None
+
+    result = {"sync_token": sync_token, "full": since == 0}
+    for key, model, query, to_dict in SYNC_TABLES:
+        if key in archive.KINDS:
+            statement = archive.union(key, lambda source: _changed(query(source), source, user_id, since))
+            rows = db.session.execute(statement.order_by(literal_column('version'), literal_column('id'))).all()
+        else:
+            rows = _changed(query(), model, user_id, since).order_by(model.version, model.id).all()
+        result[key] = {
+            "updated": [dict(to_dict(r), version=r.version) for r in rows],
+            "deleted": [],
+        }
+
+    # A full snapshot already omits deleted rows
+    if since > 0:
+        keys = {model.__tablename__: key for key, model, _, _ in SYNC_TABLES}
+        tombstones = (
+            db.session.query(Tombstone.table_name, Tombstone.row_id, Tombstone.version)
+            .filter(Tombstone.user_id == user_id, Tombstone.version > since)
+            .order_by(Tombstone.version, Tombstone.id)
+            .all()
+        )
+        # Ids are no longer reused (see migration 16), but a row created
+        # before that may have taken a deleted row's id. The live row wins.
+        live = {
+            (model.__tablename__, row["id"]): row["version"]
+            for key, model, _, _ in SYNC_TABLES
+            for row in result[key]["updated"]
+        }
+        for t in tombstones:
+            if live.get((t.table_name, t.row_id), 0) < t.version:
+                result[keys[t.table_name]]["deleted"].append(t.row_id)
+
+    return result
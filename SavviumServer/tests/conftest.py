@@ -0,0 +1,54 @@
+import os
+import sys
+from datetime import date
+import pytest
+
+# The server modules import each other as top-level modules (see app.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, User, BudgetCategory, Expense, Income, RecurringExpense
+import migrations
+
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'SECRET_KEY': 'test-secret-key',
+        # Hash passwords inline rather than in a process pool
+        'PASSWORD_WORKERS': 0,
+    })
+    with app.app_context():
+        migrations.upgrade()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    """User 1 with two categories, a year of expenses and incomes, and a bill."""
+    with app.app_context():
+        user = User(name='Test', email='test@savvium.invalid', password='!')
+        db.session.add(user)
+        db.session.flush()
+        categories = [BudgetCategory(user_id=user.id, name=name, budget=500) for name in ('Blah', 'Salary')]
+        db.session.add_all(categories)
+        db.session.flush()
+        for month in range(1, 13):
+            for category in categories:
+                db.session.add(Expense(category_id=category.id, user_id=user.id, name=f'Blah {month}',
+                                       amount=12.5, date=date(2025, month, 1)))
+            db.session.add(Income(user_id=user.id, name='Salary', amount=1000, date=date(2025, month, 1)))
+        db.session.add(RecurringExpense(user_id=user.id, category_id=categories[0].id, name='Rent',
+                                        amount=900, due_day=1))
+        db.session.commit()
+        return user.id
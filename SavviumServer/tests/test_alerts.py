@@ -0,0 +1,31 @@
+import threading
+import time
+import alerts
+
+
+class RecordingSink:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, alert):
+        self.sent.append(alert)
+
+
+def test_worker_stops_promptly_while_waiting(app):
+    app.config['ALERT_POLL_INTERVAL'] = 60
+    stop = alerts.start(app)
+    time.sleep(0.2)
+    worker = next(t for t in threading.enumerate() if t.name == 'budget-alerts')
+
+    started = time.perf_counter()
+    stop.set()
+    worker.join(5)
+    assert not worker.is_alive()
+    assert time.perf_counter() - started < 1
+
+
+def test_drain_checks_stop_before_each_claim(app):
+    stop = threading.Event()
+    stop.set()
+    with app.app_context():
+        assert alerts.drain(RecordingSink(), stop=stop) == {'delivered': 0, 'retried': 0, 'failed': 0}
@@ -0,0 +1,35 @@
+import pytest
+from models import db, Expense
+
+BAD_AMOUNTS = ['abc', None, [], 'NaN', True]
+
+
+def assert_rejected(response, field='amount'):
+    assert response.status_code == 400
+    assert response.get_json() == {'message': f"'{field}' must be a number"}
+
+
+@pytest.mark.parametrize('amount', BAD_AMOUNTS)
+def test_new_expenses_need_a_numeric_amount(app, client, user, amount):
+    assert_rejected(client.post('/expenses', json={'category_id': 1, 'name': 'Coffee', 'amount': amount}))
+    with app.app_context():
+        assert Expense.query.filter_by(name='Coffee').count() == 0
+
+
+def test_every_money_field_is_checked_before_saving(app, client, user):
+    assert_rejected(client.patch('/expenses/1', json={'name': 'Renamed', 'amount': 'abc'}))
+    with app.app_context():
+        assert db.session.get(Expense, 1).name == 'Blah 1'
+
+    assert_rejected(client.post('/categories', json={'user_id': 1, 'name': 'Fun', 'budget': 'lots'}), 'budget')
+    assert_rejected(client.patch('/categories/1', json={'budget': 'lots'}), 'budget')
+    assert_rejected(client.post('/incomes', json={'user_id': 1, 'name': 'Pay', 'amount': 'abc'}))
+    assert_rejected(client.post('/recurring-expenses', json={
+        'user_id': 1, 'name': 'Gym', 'amount': 'abc', 'category_id': 1, 'due_day': 5,
+    }))
+    assert_rejected(client.patch('/recurring-expenses/1', json={'due_day': 2, 'amount': 'abc'}))
+
+
+def test_amounts_are_rounded_to_the_cent(client, user):
+    created = client.post('/expenses', json={'category_id': 1, 'name': 'Coffee', 'amount': '2.675'})
+    assert created.get_json()['expense']['amount'] == 2.68
@@ -0,0 +1,115 @@
+from datetime import date, datetime
+from models import db, Expense, PlaidItem, RecurringExpense
+import archive
+import plaid_sync
+import scheduler
+import search
+
+
+def run_archive(app, before):
+    with app.app_context():
+        return {kind: archive.archive(kind, before, batch_size=10) for kind in archive.KINDS}
+
+
+def test_archived_ids_are_not_reused(app, client, user):
+    with app.app_context():
+        # An old expense entered last has the highest id of all
+        old = Expense(category_id=1, user_id=user, name='Old', amount=5, date=date(2020, 3, 1))
+        db.session.add(old)
+        db.session.commit()
+        old_id = old.id
+
+    moved = run_archive(app, date(2025, 1, 1))
+    assert moved['expenses'] == {2020: 1}
+
+    created = client.post('/expenses', json={'category_id': 1, 'name': 'New', 'amount': 3, 'date': '2025-12-02'})
+    new_id = created.get_json()['expense']['id']
+    assert new_id > old_id
+
+    assert client.delete(f'/expenses/{new_id}').status_code == 200
+    assert client.delete(f'/expenses/{new_id}').status_code == 404
+    listed = client.get('/users/1/expenses?from=2020-01-01&to=2020-12-31').get_json()
+    assert [e['id'] for e in listed] == [old_id]
+
+
+def test_plaid_changes_to_archived_transactions_apply_to_them(app, user):
+    with app.app_context():
+        db.session.add(PlaidItem(user_id=user, item_id='item', access_token='token', default_category_id=1))
+        db.session.add(Expense(category_id=1, user_id=user, name='Shop', amount=5, date=date(2020, 3, 1),
+                               plaid_transaction_id='tx-1'))
+        db.session.commit()
+    run_archive(app, date(2025, 1, 1))
+
+    page = {
+        'added': [],
+        'modified': [{'transaction_id': 'tx-1', 'name': 'Shop', 'amount': 7, 'date': '2020-03-02'}],
+        'removed': [],
+        'next_cursor': 'c1',
+    }
+    with app.app_context():
+        stats = plaid_sync.apply_page(1, page)
+        assert stats['modified'] == 1 and stats['added'] == 0
+        expenses = Expense.query.filter_by(plaid_transaction_id='tx-1').all()
+        assert [(e.amount, e.date) for e in expenses] == [(7, date(2020, 3, 2))]
+
+
+def test_archived_recurring_expenses_are_not_materialized_again(app, user):
+    day = date(2020, 3, 1)
+    with app.app_context():
+        db.session.get(RecurringExpense, 1).created_at = datetime(2020, 1, 1)
+        db.session.commit()
+        assert scheduler.materialize_day(day) == 1
+    run_archive(app, date(2025, 1, 1))
+    with app.app_context():
+        assert Expense.query.filter_by(recurring_id=1).count() == 0
+        assert scheduler.materialize_day(day) == 0
+
+
+def add_old_expense(app, user, name='Old lamp'):
+    with app.app_context():
+        expense = Expense(category_id=1, user_id=user, name=name, amount=5, date=date(2020, 3, 1))
+        db.session.add(expense)
+        db.session.commit()
+        return expense.id
+
+
+def search_ids(client, q):
+    response = client.get(f'/users/1/search?q={q}')
+    assert response.status_code == 200
+    return [e['id'] for e in response.get_json()]
+
+
+def test_search_covers_archived_rows(app, client, user):
+    old_id = add_old_expense(app, user)
+    run_archive(app, date(2025, 1, 1))
+    assert search_ids(client, 'lamp') == [old_id]
+    assert search_ids(client, 'blah')[:1] != [old_id]
+
+    with app.app_context():
+        search.rebuild(db.session.connection())
+        db.session.commit()
+    assert search_ids(client, 'lamp') == [old_id]
+
+    # Moved back, the row is indexed once
+    assert client.patch(f'/expenses/{old_id}', json={'amount': 6}).status_code == 200
+    assert search_ids(client, 'lamp') == [old_id]
+    assert client.delete(f'/expenses/{old_id}').status_code == 200
+    assert search_ids(client, 'lamp') == []
+
+
+def test_sync_covers_archived_rows(app, client, user):
+    token = client.get('/users/1/sync?since=0').get_json()['sync_token']
+    old_id = add_old_expense(app, user)
+    run_archive(app, date(2025, 1, 1))
+
+    full = client.get('/users/1/sync?since=0').get_json()
+    assert old_id in [e['id'] for e in full['expenses']['updated']]
+    assert len(full['incomes']['updated']) == 12
+    changes = client.get(f'/users/1/sync?since={token}').get_json()
+    assert [e['id'] for e in changes['expenses']['updated']] == [old_id]
+
+    token = changes['sync_token']
+    assert client.delete('/categories/1').status_code == 200
+    deleted = client.get(f'/users/1/sync?since={token}').get_json()['expenses']['deleted']
+    assert old_id in deleted
+    assert search_ids(client, 'lamp') == []
@@ -0,0 +1,40 @@
+from itsdangerous import URLSafeTimedSerializer
+from config import INSECURE_SECRET_KEY
+
+
+def signup_and_login(client):
+    client.post('/signup', json={'name': 'Ada', 'email': 'ada@savvium.invalid', 'password': 'correct horse'})
+    return client.post('/login', json={'email': 'ada@savvium.invalid', 'password': 'correct horse'})
+
+
+def test_login_issues_a_token_for_the_caller(client, user):
+    response = signup_and_login(client)
+    assert response.status_code == 200
+    token = response.get_json()['token']
+    user_id = response.get_json()['user']['id']
+
+    assert client.get(f'/users/{user_id}/categories', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+    assert client.get(f'/users/{user}/categories', headers={'Authorization': f'Bearer {token}'}).status_code == 403
+
+
+def test_token_signed_with_the_placeholder_key_is_rejected(client):
+    user_id = signup_and_login(client).get_json()['user']['id']
+    forged = URLSafeTimedSerializer(INSECURE_SECRET_KEY, salt='savvium-access-token').dumps({'uid': user_id})
+    assert client.get(f'/users/{user_id}/categories', headers={'Authorization': f'Bearer {forged}'}).status_code == 401
+
+
+def test_no_tokens_while_secret_key_is_the_placeholder(app, client):
+    app.config['SECRET_KEY'] = INSECURE_SECRET_KEY
+    response = signup_and_login(client)
+    assert response.status_code == 500
+    assert 'token' not in response.get_json()
+    assert client.get('/users/1/categories', headers={'Authorization': 'Bearer anything'}).status_code == 500
+
+
+def test_operational_stats_need_a_token(app, client):
+    token = signup_and_login(client).get_json()['token']
+    for required in (False, True):
+        app.config['AUTH_REQUIRED'] = required
+        for url in ('/auth/stats', '/cache/stats'):
+            assert client.get(url).status_code == 401
+            assert client.get(url, headers={'Authorization': f'Bearer {token}'}).status_code == 200
@@ -0,0 +1,14 @@
+def test_malformed_items_are_reported_per_item(client, user):
+    response = client.post('/expenses/bulk', json={'user_id': 1, 'expenses': [
+        {'category_id': [1], 'name': 'List category', 'amount': 1},
+        {'category_id': {'id': 1}, 'name': 'Dict category', 'amount': 1},
+        {'category_id': 1, 'name': ['not', 'a', 'string'], 'amount': 1},
+        {'category_id': 1, 'name': 'Lunch', 'amount': [1]},
+        {'category_id': 1, 'name': 'Lunch', 'amount': 12.5, 'date': '2025-03-04'},
+    ]})
+
+    assert response.status_code == 207
+    results = response.get_json()['results']
+    assert [r['status'] for r in results] == ['error', 'error', 'error', 'error', 'created']
+    assert results[0]['error'] == results[1]['error'] == "'category_id' must be an integer"
+    assert results[2]['error'] == "'name' must be a string"
@@ -0,0 +1,33 @@
+from models import db, User, BudgetCategory
+from cache import cache
+
+
+def delta(before):
+    after = cache.stats()
+    return {key: after[key] - before[key] for key in ('hits', 'misses', 'invalidations')}
+
+
+def test_reads_are_cached_until_the_user_writes(client, user):
+    before = cache.stats()
+    first = client.get('/users/1/categories')
+    assert client.get('/users/1/categories').get_json() == first.get_json()
+    assert delta(before) == {'hits': 1, 'misses': 1, 'invalidations': 0}
+
+    assert client.patch('/categories/1', json={'budget': 750}).status_code == 200
+    budgets = {c['id']: c['budget'] for c in client.get('/users/1/categories').get_json()}
+    assert budgets[1] == 750
+    assert delta(before) == {'hits': 1, 'misses': 2, 'invalidations': 1}
+
+
+def test_another_users_write_keeps_the_entries(app, client, user):
+    client.get('/users/1/categories')
+    with app.app_context():
+        other = User(name='Other', email='other@savvium.invalid', password='!')
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(BudgetCategory(user_id=other.id, name='Food', budget=100))
+        db.session.commit()
+
+    before = cache.stats()
+    client.get('/users/1/categories')
+    assert delta(before)['hits'] == 1
@@ -0,0 +1,26 @@
+def test_unchanged_data_answers_304_until_a_write(client, user):
+    first = client.get('/users/1/expenses')
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    again = client.get('/users/1/expenses', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag
+    assert again.data == b''
+
+    client.post('/expenses', json={'category_id': 1, 'name': 'Coffee', 'amount': 3, 'date': '2025-12-02'})
+    changed = client.get('/users/1/expenses', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()[0]['name'] == 'Coffee'
+
+
+def test_etags_differ_per_query_and_follow_the_owners_writes(client, user):
+    page = client.get('/users/1/expenses?limit=5').headers['ETag']
+    assert client.get('/users/1/expenses?limit=6').headers['ETag'] != page
+
+    etag = client.get('/categories/1/expenses').headers['ETag']
+    assert client.get('/categories/1/expenses', headers={'If-None-Match': etag}).status_code == 304
+    client.patch('/categories/2', json={'budget': 10})
+    assert client.get('/categories/1/expenses', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,55 @@
+import csv
+import io
+import json
+from datetime import date
+import archive
+import export
+
+
+def ndjson_lines(client):
+    response = client.get('/users/1/export')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.headers['Content-Disposition'] == 'attachment; filename="savvium-1-all.ndjson"'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_ndjson_holds_every_row_like_the_list_endpoints(client, user):
+    lines = ndjson_lines(client)
+    assert [line['type'] for line in lines] == (
+        ['category'] * 2 + ['recurring_expense'] + ['expense'] * 24 + ['income'] * 12
+    )
+    expenses = [{k: v for k, v in line.items() if k != 'type'} for line in lines if line['type'] == 'expense']
+    listed = client.get('/users/1/expenses').get_json()
+    assert sorted(expenses, key=lambda e: e['id']) == sorted(listed, key=lambda e: e['id'])
+
+
+def test_archived_rows_are_exported_too(app, client, user):
+    before = ndjson_lines(client)
+    with app.app_context():
+        assert archive.archive('expenses', date(2025, 7, 1), batch_size=5)
+        assert archive.archive('incomes', date(2025, 7, 1), batch_size=5)
+    assert sorted(ndjson_lines(client), key=json.dumps) == sorted(before, key=json.dumps)
+
+
+def test_csv_has_one_kind_under_a_header(client, user):
+    response = client.get('/users/1/export?format=csv&type=incomes')
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert list(rows[0]) == ['id', 'user_id', 'name', 'amount', 'date']
+    assert len(rows) == 12 and {r['amount'] for r in rows} == {'1000.0'}
+
+    assert client.get('/users/1/export?format=csv').status_code == 400
+    assert client.get('/users/1/export?type=budgets').status_code == 400
+    assert client.get('/users/99/export').status_code == 404
+
+
+def test_rows_are_sent_in_chunks(app, user, monkeypatch):
+    monkeypatch.setattr(export, 'CHUNK_BYTES', 512)
+    with app.app_context():
+        chunks = list(export.ndjson(user))
+        monkeypatch.setattr(export, 'CHUNK_BYTES', 1 << 20)
+        whole = list(export.ndjson(user))
+    assert len(chunks) > 1 and len(whole) == 1
+    assert ''.join(chunks) == whole[0]
+    assert all(chunk.endswith('\n') for chunk in chunks)
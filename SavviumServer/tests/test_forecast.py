@@ -0,0 +1,53 @@
+import json
+from datetime import date
+import pytest
+from models import db, Forecast, User
+import forecast
+
+pytest.importorskip('numpy')
+
+TODAY = date(2025, 6, 15)
+
+
+def get_forecast(client):
+    response = client.get(f'/users/1/forecast?date={TODAY.isoformat()}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_projection_blends_pace_and_history(client, user):
+    # 12.50 spent on June 1st; past months spent nothing after the 1st
+    client.patch('/categories/1', json={'budget': 18})
+    client.post('/expenses', json={'category_id': 2, 'name': 'Big', 'amount': 600, 'date': '2025-06-10'})
+    result = get_forecast(client)
+
+    assert (result['month'], result['days_left'], result['history_months']) == ('2025-06', 15, 5)
+    blah, salary = result['categories']
+    # Half the month gone: half the pace (12.50 more) and half the history (0)
+    assert (blah['spent'], blah['projected'], blah['bills_due']) == (12.5, 18.75, 0)
+    assert blah['status'] == 'likely_over'
+    assert (salary['spent'], salary['status']) == (612.5, 'over')
+    assert result['income'] == {'received': 1000, 'projected': 1000}
+
+
+def test_stored_forecast_is_served_until_the_data_changes(app, client, user):
+    with app.app_context():
+        version = db.session.get(User, user).data_version
+        forecast.store([(user, version, json.dumps({'stored': True}))], TODAY)
+        db.session.commit()
+    assert get_forecast(client) == {'stored': True}
+
+    client.post('/expenses', json={'category_id': 1, 'name': 'Coffee', 'amount': 3, 'date': '2025-06-14'})
+    assert get_forecast(client)['categories'][0]['spent'] == 15.5
+
+
+def test_nightly_batch_stores_what_the_endpoint_computes(app, client, user):
+    computed = get_forecast(client)
+    with app.app_context():
+        assert forecast.run_batch(app, TODAY, workers=0)['users'] == 1
+        stored = db.session.query(Forecast.payload).filter_by(user_id=user, as_of=TODAY).scalar()
+    assert json.loads(stored) == computed
+
+
+def test_unknown_user_is_404(client):
+    assert client.get('/users/99/forecast').status_code == 404
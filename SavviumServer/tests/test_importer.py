@@ -0,0 +1,27 @@
+import io
+import json
+
+
+def upload(client, csv, **form):
+    data = {'file': (io.BytesIO(csv.encode()), 'statement.csv'), **form}
+    return client.post('/users/1/imports', data=data, content_type='multipart/form-data')
+
+
+def test_imports_new_rows_and_skips_duplicates(client, user):
+    csv = 'date,description,amount\n2025-03-04,Coffee,-3.50\n2025-03-05,Salary,2000\n'
+    assert upload(client, csv, default_category_id='1').get_json()['imported'] == 1
+    assert upload(client, csv, default_category_id='1').get_json()['duplicates'] == 1
+
+
+def test_invalid_rule_is_a_bad_request(client, user):
+    csv = 'date,description,amount\n2025-03-04,Coffee,-3.50\n'
+    response = upload(client, csv, rules=json.dumps([{'match': '(coffee', 'category_id': 1}]))
+    assert response.status_code == 400
+    assert 'Invalid rule' in response.get_json()['message']
+
+
+def test_short_csv_line_is_a_bad_request(client, user):
+    csv = 'date,description,amount\n2025-03-04,Coffee,-3.50\n2025-03-05\n'
+    response = upload(client, csv, default_category_id='1')
+    assert response.status_code == 400
+    assert 'Line 3' in response.get_json()['message']
@@ -0,0 +1,14 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from models import db
+
+
+def test_failed_statement_does_not_leave_its_start_time_behind(app):
+    with app.app_context(), db.engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text('SELECT * FROM no_such_table'))
+        assert conn.info['query_started'] == []
+
+        conn.execute(text('SELECT 1'))
+        assert conn.info['query_started'] == []
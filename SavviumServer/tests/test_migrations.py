@@ -0,0 +1,57 @@
+import os
+import shutil
+from sqlalchemy import create_engine, text
+import migrations
+
+LEGACY_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'db.sqlite')
+
+
+def test_legacy_database_upgrades_to_cents_like_to_cents(app, tmp_path):
+    # A copy of the database from before migrations existed
+    path = tmp_path / 'legacy.sqlite'
+    shutil.copy(LEGACY_DB, path)
+    engine = create_engine(f'sqlite:///{path}')
+
+    with app.app_context():
+        migrations.upgrade(engine, target=8)
+        with engine.begin() as conn:
+            for amount in (1.005, 0.285, 2.675):
+                conn.execute(text(
+                    "INSERT INTO expenses (category_id, user_id, name, amount, date) VALUES (1, 1, 'Half', :a, '2025-02-03')"
+                ), {'a': amount})
+            conn.execute(text(
+                "INSERT INTO monthly_rollups (user_id, category_id, year_month, total, count) "
+                "VALUES (1, 1, '2025-02', 3.965, 3)"
+            ))
+        migrations.upgrade(engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT amount_cents FROM expenses WHERE name = 'Half' ORDER BY id")).scalars().all() == [101, 29, 268]
+        assert conn.execute(text(
+            "SELECT total_cents, count FROM monthly_rollups WHERE year_month = '2025-02'"
+        )).one() == (398, 3)
+        assert conn.execute(text('SELECT version FROM schema_version')).scalar() == migrations.HEAD
+        assert 'AUTOINCREMENT' in conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'expenses'")).scalar()
+    engine.dispose()
+
+
+def test_archives_made_before_every_column_was_kept_are_completed(app, tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "archived.sqlite"}')
+    with app.app_context():
+        migrations.upgrade(engine)
+        with engine.begin() as conn:
+            conn.execute(text('UPDATE schema_version SET version = 16'))
+            conn.execute(text(
+                'CREATE TABLE expenses_archive_2020 (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+                'category_id INTEGER NOT NULL, name VARCHAR NOT NULL, amount_cents INTEGER NOT NULL, '
+                'date DATE NOT NULL, fingerprint INTEGER)'
+            ))
+            conn.execute(text("INSERT INTO expenses_archive_2020 VALUES (1, 1, 1, 'Old', 500, '2020-03-01', 0)"))
+            conn.execute(text("INSERT INTO archived_years VALUES ('expenses', 2020, '2025-01-01')"))
+        assert (17, 'archive tables keep every column') in migrations.upgrade(engine)
+
+    with engine.connect() as conn:
+        row = conn.execute(text('SELECT * FROM expenses_archive_2020')).mappings().one()
+        assert (row['version'], row['plaid_transaction_id'], row['recurring_id']) == (0, None, None)
+        indexes = conn.execute(text('PRAGMA index_list(expenses_archive_2020)')).scalars(1).all()
+        assert 'ix_expenses_archive_2020_plaid_transaction_id' in indexes
@@ -0,0 +1,33 @@
+import time
+import pytest
+from flask import Flask
+from passwords import PasswordHasher, PoolBusy
+
+
+def slow_hash(seconds):
+    time.sleep(seconds)
+    return 'hash'
+
+
+@pytest.fixture
+def hasher():
+    app = Flask(__name__)
+    app.config.update(PASSWORD_WORKERS=1, PASSWORD_MAX_PENDING=1, PASSWORD_TIMEOUT=0.2)
+    hasher = PasswordHasher()
+    hasher.init_app(app)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_timeout_is_pool_busy_and_keeps_the_slot_until_the_job_ends(hasher):
+    with pytest.raises(PoolBusy):
+        hasher._run(slow_hash, 1)
+    assert hasher.stats()['timed_out'] == 1
+    # The timed-out job is still running in the pool and holds the only slot
+    with pytest.raises(PoolBusy):
+        hasher._run(slow_hash, 0)
+    assert hasher.stats()['rejected'] == 1
+
+    time.sleep(1.5)
+    assert hasher.stats()['pending'] == 0
+    assert hasher._run(slow_hash, 0) == 'hash'
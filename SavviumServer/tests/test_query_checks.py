@@ -0,0 +1,13 @@
+import pytest
+import checks
+
+
+@pytest.mark.parametrize('url', checks.COUNTED_ENDPOINTS)
+def test_query_count_does_not_grow_with_rows(app, url):
+    few, many = checks.query_counts(app, endpoints=[url])[url]
+    assert isinstance(few, int), few
+    assert few == many
+
+
+def test_list_endpoints_use_an_index(app, user):
+    assert checks.check_query_plans(app) == []
@@ -0,0 +1,69 @@
+from datetime import date, datetime
+from models import db, User, BudgetCategory, Expense, JobState, RecurringExpense
+import scheduler
+
+
+def other_users_category(app):
+    with app.app_context():
+        other = User(name='Other', email='other@savvium.invalid', password='!')
+        db.session.add(other)
+        db.session.flush()
+        category = BudgetCategory(user_id=other.id, name='B-Food', budget=100)
+        db.session.add(category)
+        db.session.commit()
+        return category.id
+
+
+def bill(**fields):
+    return dict({'user_id': 1, 'name': 'Gym', 'amount': 30, 'category_id': 1, 'due_day': 5}, **fields)
+
+
+def test_bills_need_a_category_of_their_user(app, client, user):
+    category_id = other_users_category(app)
+    response = client.post('/recurring-expenses', json=bill(category_id=category_id))
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Category not found'
+    assert client.post('/recurring-expenses', json=bill(category_id='1')).status_code == 400
+    assert client.post('/recurring-expenses', json=bill()).status_code == 201
+
+
+def test_due_day_is_a_day_of_the_month(client, user):
+    for due_day in (45, -1, '5', 5.5, True):
+        response = client.post('/recurring-expenses', json=bill(due_day=due_day))
+        assert response.status_code == 400, due_day
+        assert response.get_json()['message'] == "'due_day' must be an integer from 1 to 31"
+    assert client.post('/recurring-expenses', json=bill(due_day=31)).status_code == 201
+
+    assert client.patch('/recurring-expenses/1', json={'due_day': 32}).status_code == 400
+    assert client.patch('/recurring-expenses/1', json={'due_day': 15}).status_code == 200
+
+
+def test_stored_bills_in_another_users_category_are_skipped(app, user):
+    category_id = other_users_category(app)
+    with app.app_context():
+        db.session.add(RecurringExpense(user_id=user, category_id=category_id, name='Stray', amount=10,
+                                        due_day=1, created_at=datetime(2025, 1, 1)))
+        db.session.get(RecurringExpense, 1).created_at = datetime(2025, 1, 1)
+        db.session.commit()
+
+        assert scheduler.materialize_day(date(2025, 3, 1)) == 1
+        assert Expense.query.filter_by(category_id=category_id).count() == 0
+
+
+def test_late_due_days_fall_on_the_last_day_of_short_months(app, user):
+    assert scheduler.due_days_on(date(2025, 2, 28)) == [28, 29, 30, 31]
+    assert scheduler.due_days_on(date(2024, 2, 28)) == [28]
+    assert scheduler.due_days_on(date(2025, 4, 30)) == [30, 31]
+
+    with app.app_context():
+        rent = db.session.get(RecurringExpense, 1)
+        rent.due_day = 31
+        rent.created_at = datetime(2025, 1, 1)
+        db.session.add(JobState(job=scheduler.JOB_NAME, last_run_on=date(2025, 1, 29)))
+        db.session.commit()
+
+        # Catching up from Jan 29 creates January's and February's rent once each
+        assert scheduler.run_due(date(2025, 3, 1))['created'] == 2
+        assert scheduler.run_due(date(2025, 3, 1))['created'] == 0
+        dates = [e.date for e in Expense.query.filter_by(recurring_id=1).order_by(Expense.date)]
+        assert dates == [date(2025, 1, 31), date(2025, 2, 28)]
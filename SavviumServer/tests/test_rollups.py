@@ -0,0 +1,60 @@
+from sqlalchemy import text
+from models import db, MonthlyRollup
+import rollups
+
+
+def stored(app, year_month, category_id=1):
+    with app.app_context():
+        row = db.session.get(MonthlyRollup, (1, category_id, year_month))
+        return (row.total_cents, row.count) if row else None
+
+
+def verify(app):
+    with app.app_context():
+        return rollups.verify(db.session.connection())
+
+
+def test_writes_keep_the_rollups_in_step(app, client, user):
+    assert stored(app, '2025-03') == (1250, 1)
+    created = client.post('/expenses', json={'category_id': 1, 'name': 'Coffee', 'amount': 3.5, 'date': '2025-03-09'})
+    expense_id = created.get_json()['expense']['id']
+    assert stored(app, '2025-03') == (1600, 2)
+
+    # Moving an expense to another month moves its amount too
+    client.patch(f'/expenses/{expense_id}', json={'amount': 4, 'date': '2025-04-02'})
+    assert stored(app, '2025-03') == (1250, 1)
+    assert stored(app, '2025-04') == (1650, 2)
+
+    client.delete(f'/expenses/{expense_id}')
+    assert stored(app, '2025-04') == (1250, 1)
+    assert verify(app) == []
+
+    client.delete('/categories/2')
+    assert stored(app, '2025-04', category_id=2) is None
+    assert verify(app) == []
+
+
+def test_verify_reports_drift_and_rebuild_repairs_it(app, user):
+    with app.app_context():
+        db.session.execute(text("UPDATE monthly_rollups SET total_cents = 1 WHERE year_month = '2025-05'"))
+        db.session.commit()
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['rollup-verify'])
+    assert result.exit_code == 1
+    assert 'user 1 category 1 2025-05: expected 12.50 (1), stored 0.01 (1)' in result.output
+
+    assert runner.invoke(args=['rollup-rebuild', '--user', '1']).exit_code == 0
+    assert runner.invoke(args=['rollup-verify']).exit_code == 0
+    assert stored(app, '2025-05') == (1250, 1)
+
+
+def test_totals_over_partial_months_add_up(client, user):
+    summary = client.get('/users/1/summary?from=2025-01-15&to=2025-03-10').get_json()
+    # February and March 1st, in both categories
+    assert summary['total_spent'] == 50
+    spending = client.get('/users/1/spending?group=month&from=2025-01-15&to=2025-03-10').get_json()
+    assert spending == [
+        {'period': '2025-02', 'total': 25.0, 'count': 2},
+        {'period': '2025-03', 'total': 25.0, 'count': 2},
+    ]
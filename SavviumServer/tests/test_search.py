@@ -0,0 +1,61 @@
+from datetime import date
+from models import db, User, BudgetCategory, Expense
+
+
+def search(client, query):
+    response = client.get(f'/users/1/search?{query}')
+    assert response.status_code == 200
+    return response
+
+
+def names(client, query):
+    return [row['name'] for row in search(client, query).get_json()]
+
+
+def add_expense(client, name, category_id=1):
+    response = client.post('/expenses', json={'category_id': category_id, 'name': name, 'amount': 3, 'date': '2025-06-02'})
+    return response.get_json()['expense']['id']
+
+
+def test_every_word_matches_as_a_prefix(client, user):
+    add_expense(client, 'Coffee shop')
+    add_expense(client, 'Café Olé')
+    assert names(client, 'q=cof+sho') == ['Coffee shop']
+    assert names(client, 'q=cof+bar') == []
+    # Diacritics are folded, and FTS5 syntax in the query is taken literally
+    assert names(client, 'q=cafe') == ['Café Olé']
+    assert names(client, 'q=cafe+OR+coffee') == []
+    assert client.get('/users/1/search?q=%2A%22').status_code == 400
+
+
+def test_only_the_users_own_rows_match(app, client, user):
+    with app.app_context():
+        other = User(name='Other', email='other@savvium.invalid', password='!')
+        db.session.add(other)
+        db.session.flush()
+        category = BudgetCategory(user_id=other.id, name='Food', budget=100)
+        db.session.add(category)
+        db.session.flush()
+        db.session.add(Expense(category_id=category.id, user_id=other.id, name='Coffee', amount=2,
+                               date=date(2025, 6, 1)))
+        db.session.commit()
+    add_expense(client, 'Coffee beans')
+    assert names(client, 'q=coffee') == ['Coffee beans']
+
+
+def test_filters_renames_and_pages(client, user):
+    expense_id = add_expense(client, 'Lunch')
+    add_expense(client, 'Lunch', category_id=2)
+    assert [r['category_id'] for r in search(client, 'q=lunch&category_id=2').get_json()] == [2]
+    assert names(client, 'q=blah&from=2025-03-01&to=2025-03-31') == ['Blah 3', 'Blah 3']
+    assert names(client, 'q=salary&type=incomes')[:1] == ['Salary']
+
+    client.patch(f'/expenses/{expense_id}', json={'name': 'Dinner'})
+    assert names(client, 'q=dinner') == ['Dinner']
+    assert len(names(client, 'q=lunch')) == 1
+
+    first = search(client, 'q=blah&limit=10')
+    rest = search(client, 'q=blah&limit=50&cursor=' + first.headers['X-Next-Cursor'])
+    ids = [r['id'] for r in first.get_json() + rest.get_json()]
+    assert len(ids) == len(set(ids)) == 24
+    assert 'X-Next-Cursor' not in rest.headers
@@ -0,0 +1,17 @@
+def sync(client, since):
+    response = client.get(f'/users/1/sync?since={since}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_deleted_ids_are_not_reused(client, user):
+    token = sync(client, 0)['sync_token']
+    newest = max(e['id'] for e in sync(client, 0)['expenses']['updated'])
+
+    assert client.delete(f'/expenses/{newest}').status_code == 200
+    created = client.post('/expenses', json={'category_id': 1, 'name': 'Coffee', 'amount': 3, 'date': '2025-12-02'})
+    assert created.get_json()['expense']['id'] > newest
+
+    changes = sync(client, token)['expenses']
+    assert changes['deleted'] == [newest]
+    assert [e['name'] for e in changes['updated']] == ['Coffee']
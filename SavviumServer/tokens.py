@@ -0,0 +1,30 @@
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from config import INSECURE_SECRET_KEY
+
+
+class MissingSecretKey(RuntimeError):
+    """Raised when tokens are issued or checked without a real SECRET_KEY."""
+
+
+# Access tokens are signed, timestamped user ids: verifying one is an HMAC
+# check against SECRET_KEY, with no database lookup. They cannot be revoked
+# individually; changing SECRET_KEY invalidates every token.
+def _serializer():
+    secret_key = current_app.config.get('SECRET_KEY')
+    if not secret_key or secret_key == INSECURE_SECRET_KEY:
+        raise MissingSecretKey('SECRET_KEY is not set')
+    return URLSafeTimedSerializer(secret_key, salt='savvium-access-token')
+
+
+def issue_token(user_id):
+    return _serializer().dumps({'uid': user_id})
+
+
+def token_user_id(token):
+    """The user id a token was issued to, or None if it is forged or older than TOKEN_MAX_AGE."""
+    try:
+        payload = _serializer().loads(token, max_age=current_app.config['TOKEN_MAX_AGE'])
+    except BadSignature:
+        return None
+    return payload.get('uid') if isinstance(payload, dict) else None